@@ -1,51 +1,77 @@
 import os
-from flask import Flask, request, jsonify, abort
+from flask import Flask, request, abort, Response, stream_with_context
 from functools import wraps
-from dotenv import load_dotenv
 import logging
 
+# Leitura dos pedidos, erros e /stats compartilhados com o app ASGI
+import api_comum
+from api_comum import CABECALHOS_STREAM, Pedido, new_session_id
+
 # Importa a classe ChatRAG do arquivo existente
 from chat_interativo import ChatRAG
-
-# Carrega as variáveis de ambiente
-load_dotenv()
+from indexacao import FilaIndexacao
+from lote import responder_lote
+from inicializacao import Inicializacao
+from lojistas import BasesLojistas, chave_sessao
+from motor import MotorRAG
+from metricas import METRICS_ENABLED, anotar, get_metrics, span, trace
+from sse import sse_event
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Configurações da API
-API_KEY = os.getenv("API_KEY", "sua_chave_api_aqui")
 app = Flask(__name__)
 
-# Instância global do ChatRAG (inicializada uma vez)
-chat_rag_instance = None
+# ChatRAG criado e aquecido em segundo plano na primeira requisição
+# (inicializacao.py): a porta abre na hora, com qualquer servidor WSGI
+inicializacao = Inicializacao(ChatRAG)
+
+# Índices e prompts dos lojistas, carregados sob demanda (lojistas.py)
+lojistas = BasesLojistas(MotorRAG)
+
+# Documentos enviados em POST /ingest, indexados por workers em segundo plano
+indexacao = FilaIndexacao(lojistas)
+
+
+def pedido_atual():
+    """Campos da requisição atual (api_comum.Pedido)"""
+    return Pedido(
+        request.get_json(silent=True), request.headers, request.args, request.remote_addr
+    )
 
 
 def require_api_key(f):
     """Decorator para exigir chave de API em todas as requisições"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        # Verifica se a chave está no header Authorization ou query parameter
-        api_key = request.headers.get('Authorization')
-        if api_key and api_key.startswith('Bearer '):
-            api_key = api_key.replace('Bearer ', '')
-        else:
-            api_key = request.args.get('api_key') or request.json.get('api_key') if request.json else None
-        
-        if not api_key or api_key != API_KEY:
-            logger.warning(f"Tentativa de acesso não autorizado de {request.remote_addr}")
-            abort(401, description="Chave de API inválida ou ausente")
-        
+        erro = api_comum.autorizar(pedido_atual())
+        if erro:
+            return erro
         return f(*args, **kwargs)
     return decorated_function
 
 
+def require_ingest_key(f):
+    """Decorator do /ingest: exige INGEST_API_KEY no header Authorization"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        erro = api_comum.autorizar_ingest(pedido_atual())
+        if erro:
+            return erro
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def resolver_motor(pedido, carregar=True):
+    """Motor da requisição: o do lojista (merchant_id) ou o padrão (api_comum.resolver_motor)"""
+    return api_comum.resolver_motor(pedido, inicializacao, lojistas, carregar)
+
+
 def init_chat_rag():
-    """Inicializa a instância do ChatRAG"""
-    global chat_rag_instance
+    """Inicializa o ChatRAG na thread atual, esperando terminar (scripts e benchmarks)"""
     try:
-        chat_rag_instance = ChatRAG()
+        inicializacao.executar()
         logger.info("Sistema ChatRAG inicializado com sucesso")
         return True
     except Exception as e:
@@ -53,140 +79,240 @@ def init_chat_rag():
         return False
 
 
+def get_chat_rag():
+    """Instância do ChatRAG, ou None enquanto a inicialização não terminou"""
+    return inicializacao.motor
+
+
+@app.before_request
+def iniciar_em_segundo_plano():
+    """A primeira requisição (ex.: a sonda de /ready) dispara a inicialização"""
+    inicializacao.iniciar()
+
+
+def component_stats():
+    """Estatísticas dos caches, sessões, roteador, clientes, resiliência e inicialização (/stats e /metrics)"""
+    return api_comum.component_stats(inicializacao, lojistas, indexacao)
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Endpoint de verificação de saúde da API"""
-    return jsonify({
-        "status": "healthy",
-        "service": "Chat RAG API",
-        "chat_rag_loaded": chat_rag_instance is not None
-    })
+    """Liveness: o processo responde (mesmo antes de o ChatRAG ficar pronto); não consulta nenhum componente"""
+    return api_comum.saude("Chat RAG API", inicializacao)
+
+
+@app.route('/stats', methods=['GET'])
+@require_api_key
+def get_stats():
+    """Estatísticas dos caches, sessões, roteador, clientes, resiliência, lojistas e indexação"""
+    return component_stats()
+
+
+@app.route('/ready', methods=['GET'])
+def ready_check():
+    """Readiness: 200 só depois de o ChatRAG ser criado e aquecido"""
+    return api_comum.prontidao(inicializacao)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Latência por etapa e contadores (Prometheus; ?format=json para JSON)"""
+    if not METRICS_ENABLED:
+        abort(404)
+    if request.args.get('format') == 'json':
+        return get_metrics().stats()
+    return Response(
+        get_metrics().prometheus(component_stats()),
+        mimetype='text/plain; version=0.0.4'
+    )
 
 
 @app.route('/chat', methods=['POST'])
 @require_api_key
 def chat():
     """Endpoint principal para interagir com o chat"""
-    try:
-        # Verifica se o ChatRAG foi inicializado
-        if chat_rag_instance is None:
-            return jsonify({
-                "error": "Sistema ChatRAG não inicializado"
-            }), 500
-        
-        # Valida o payload
-        if not request.json:
-            return jsonify({
-                "error": "Payload JSON é obrigatório"
-            }), 400
-        
-        message = request.json.get('message', '').strip()
-        if not message:
-            return jsonify({
-                "error": "Campo 'message' é obrigatório e não pode estar vazio"
-            }), 400
-        
-        # Processa a mensagem usando o ChatRAG
-        logger.info(f"Processando mensagem: {message[:50]}...")
-        response = chat_rag_instance.process_question(message)
-        
-        # Log da resposta para monitoramento
-        logger.info(f"Resposta gerada com sucesso para pergunta: {message[:30]}...")
-        
-        return jsonify({
-            "response": response,
-            "status": "success"
-        })
-    
-    except Exception as e:
-        logger.error(f"Erro ao processar mensagem: {e}")
-        return jsonify({
-            "error": "Erro interno do servidor",
-            "details": str(e)
-        }), 500
+    # Cada etapa do pedido entra no trace (metricas.py)
+    with trace("chat"):
+        try:
+            pedido = pedido_atual()
+            # ChatRAG pronto e, com merchant_id, o motor do lojista
+            chat_rag_instance, merchant_id, erro = resolver_motor(pedido)
+            if erro:
+                return erro
+
+            message, erro = pedido.mensagem()
+            if erro:
+                anotar(status="invalid")
+                return erro
+
+            # Cada cliente tem a própria conversa; sem session_id, começa uma nova
+            session_id = pedido.session_id() or new_session_id()
+
+            # Processa a mensagem usando o ChatRAG
+            logger.info(f"Processando mensagem: {message[:50]}...")
+            response = chat_rag_instance.process_question(
+                message, chave_sessao(session_id, merchant_id)
+            )
+
+            # Log da resposta para monitoramento
+            logger.info(f"Resposta gerada com sucesso para pergunta: {message[:30]}...")
+
+            with span("serialization"):
+                return api_comum.resposta_chat(response, session_id)
+
+        except Exception as e:
+            anotar(status="error")
+            logger.error(f"Erro ao processar mensagem: {e}")
+            return api_comum.erro_interno(e)
+
+
+@app.route('/chat/stream', methods=['POST'])
+@require_api_key
+def chat_stream():
+    """Envia a resposta em streaming (SSE) conforme os tokens chegam"""
+    pedido = pedido_atual()
+    chat_rag_instance, merchant_id, erro = resolver_motor(pedido)
+    if erro:
+        return erro
+
+    message, erro = pedido.mensagem()
+    if erro:
+        return erro
+
+    session_id = pedido.session_id() or new_session_id()
+    logger.info(f"Processando mensagem (stream): {message[:50]}...")
+
+    def generate():
+        partes = []
+        with trace("chat_stream"):
+            try:
+                for delta in chat_rag_instance.process_question_stream(
+                    message, chave_sessao(session_id, merchant_id)
+                ):
+                    partes.append(delta)
+                    yield sse_event({"delta": delta})
+                yield api_comum.evento_fim(partes, session_id)
+            except Exception as e:
+                yield api_comum.evento_erro(e)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers=CABECALHOS_STREAM
+    )
+
+
+@app.route('/chat/batch', methods=['POST'])
+@require_api_key
+def chat_batch():
+    """Responde um lote de perguntas independentes, em JSONL conforme ficam prontas"""
+    pedido = pedido_atual()
+    chat_rag_instance, merchant_id, erro = resolver_motor(pedido)
+    if erro:
+        return erro
+
+    itens, concorrencia, usar_cache, erro = api_comum.ler_lote(
+        pedido, request.get_data(as_text=True)
+    )
+    if erro:
+        return erro
+
+    def generate():
+        with trace("chat_batch"):
+            try:
+                for resultado in responder_lote(chat_rag_instance, itens, concorrencia, usar_cache):
+                    yield api_comum.linha_lote(resultado)
+            except Exception as e:
+                yield api_comum.linha_erro_lote(e)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers=CABECALHOS_STREAM
+    )
 
 
 @app.route('/chat/clear', methods=['POST'])
 @require_api_key
 def clear_history():
-    """Limpa o histórico da conversa"""
+    """Limpa o histórico da conversa da sessão"""
     try:
-        if chat_rag_instance is None:
-            return jsonify({
-                "error": "Sistema ChatRAG não inicializado"
-            }), 500
-        
-        chat_rag_instance.conversation_history = []
-        logger.info("Histórico da conversa limpo")
-        
-        return jsonify({
-            "message": "Histórico da conversa limpo com sucesso",
-            "status": "success"
-        })
-    
+        pedido = pedido_atual()
+        chat_rag_instance, merchant_id, erro = resolver_motor(pedido, carregar=False)
+        if erro:
+            return erro
+
+        session_id, erro = api_comum.exigir_sessao(pedido)
+        if erro:
+            return erro
+
+        chat_rag_instance.clear_history(chave_sessao(session_id, merchant_id))
+        return api_comum.historico_limpo()
+
     except Exception as e:
         logger.error(f"Erro ao limpar histórico: {e}")
-        return jsonify({
-            "error": "Erro interno do servidor",
-            "details": str(e)
-        }), 500
+        return api_comum.erro_interno(e)
 
 
 @app.route('/chat/history', methods=['GET'])
 @require_api_key
 def get_history():
-    """Retorna o histórico da conversa atual"""
+    """Retorna o histórico da conversa da sessão"""
     try:
-        if chat_rag_instance is None:
-            return jsonify({
-                "error": "Sistema ChatRAG não inicializado"
-            }), 500
-        
-        return jsonify({
-            "history": chat_rag_instance.conversation_history,
-            "total_messages": len(chat_rag_instance.conversation_history),
-            "status": "success"
-        })
-    
+        pedido = pedido_atual()
+        chat_rag_instance, merchant_id, erro = resolver_motor(pedido, carregar=False)
+        if erro:
+            return erro
+
+        session_id, erro = api_comum.exigir_sessao(pedido, "Parâmetro")
+        if erro:
+            return erro
+
+        history = chat_rag_instance.get_history(chave_sessao(session_id, merchant_id))
+        return api_comum.resposta_historico(history, session_id)
+
     except Exception as e:
         logger.error(f"Erro ao obter histórico: {e}")
-        return jsonify({
-            "error": "Erro interno do servidor",
-            "details": str(e)
-        }), 500
+        return api_comum.erro_interno(e)
+
+
+@app.route('/cache/invalidate', methods=['POST'])
+@require_api_key
+def invalidate_cache():
+    """Descarta o cache de respostas (use depois de reindexar a base)"""
+    return api_comum.invalidar_caches(lojistas)
+
+
+@app.route('/ingest', methods=['POST'])
+@require_ingest_key
+def ingest():
+    """Enfileira documentos de um lojista para indexação; retorna o job"""
+    return api_comum.enfileirar(pedido_atual(), indexacao)
+
+
+@app.route('/ingest/<job_id>', methods=['GET'])
+@require_ingest_key
+def ingest_status(job_id):
+    """Estado, progresso e vazão de um job de indexação"""
+    return api_comum.estado_job(indexacao, job_id)
 
 
 @app.errorhandler(401)
 def unauthorized(error):
     """Handler personalizado para erro 401"""
-    return jsonify({
-        "error": "Não autorizado",
-        "message": "Chave de API inválida ou ausente",
-        "hint": "Inclua a chave no header Authorization como 'Bearer sua_chave' ou no parâmetro 'api_key'"
-    }), 401
+    return api_comum.NAO_AUTORIZADO
 
 
 @app.errorhandler(404)
 def not_found(error):
     """Handler personalizado para erro 404"""
-    return jsonify({
-        "error": "Endpoint não encontrado",
-        "available_endpoints": [
-            "GET /health",
-            "POST /chat",
-            "POST /chat/clear",
-            "GET /chat/history"
-        ]
-    }), 404
+    return api_comum.NAO_ENCONTRADO
 
 
 @app.errorhandler(500)
 def internal_error(error):
     """Handler personalizado para erro 500"""
-    return jsonify({
-        "error": "Erro interno do servidor",
-        "message": "Ocorreu um erro inesperado. Tente novamente mais tarde."
-    }), 500
+    return api_comum.ERRO_INESPERADO
 
 
 if __name__ == '__main__':
@@ -195,29 +321,28 @@ if __name__ == '__main__':
     print("=" * 60)
     
     # Valida se a chave de API foi definida
-    if API_KEY == "sua_chave_api_aqui":
+    if api_comum.API_KEY == "sua_chave_api_aqui":
         print("❌ AVISO: Defina a variável API_KEY no arquivo .env!")
         print("   Exemplo: API_KEY=minha_chave_secreta_123")
     else:
-        print(f"✅ Chave de API configurada: {API_KEY[:10]}...")
+        print(f"✅ Chave de API configurada: {api_comum.API_KEY[:10]}...")
+    if not api_comum.INGEST_API_KEY or api_comum.INGEST_API_KEY == api_comum.API_KEY:
+        print("ℹ️ POST /ingest desativado: defina INGEST_API_KEY (diferente de API_KEY)")
     
-    # Inicializa o ChatRAG
-    print("\n📚 Inicializando sistema ChatRAG...")
-    if init_chat_rag():
-        print("✅ Sistema ChatRAG carregado com sucesso!")
-    else:
-        print("❌ Falha ao carregar ChatRAG. Verifique as configurações.")
+    # Inicializa o ChatRAG em segundo plano: a porta abre sem esperar
+    print("\n📚 Inicializando sistema ChatRAG em segundo plano (acompanhe em GET /ready)...")
+    inicializacao.iniciar()
     
     print("\n🔗 Endpoints disponíveis:")
-    print("   GET  /health           - Verificação de saúde")
-    print("   POST /chat             - Enviar mensagem")
-    print("   POST /chat/clear       - Limpar histórico")
-    print("   GET  /chat/history     - Obter histórico")
+    for rota, descricao in api_comum.ENDPOINTS:
+        metodo, caminho = rota.split(" ")
+        print(f"   {metodo:<4} {caminho:<17} - {descricao}")
     
     print(f"\n🔑 Autenticação: Inclua a chave de API:")
     print("   • Header: Authorization: Bearer sua_chave")
     print("   • Query: ?api_key=sua_chave")
     print("   • JSON: {\"api_key\": \"sua_chave\", \"message\": \"...\"}")
+    print("   • /ingest: Authorization: Bearer <INGEST_API_KEY>")
     
     print("\n" + "=" * 60)
     
@@ -0,0 +1,330 @@
+import os
+import asyncio
+from quart import Quart, request, abort, Response
+from functools import wraps
+import logging
+
+# Leitura dos pedidos, erros e /stats compartilhados com o app Flask
+import api_comum
+from api_comum import CABECALHOS_STREAM, Pedido, new_session_id
+
+# Versão assíncrona do ChatRAG (cliente AsyncOpenAI)
+from chat_async import AsyncChatRAG
+from indexacao import FilaIndexacao
+from lote import aresponder_lote
+from inicializacao import Inicializacao
+from lojistas import BasesLojistas, chave_sessao
+from metricas import METRICS_ENABLED, anotar, get_metrics, span, trace
+from sse import sse_event
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+app = Quart(__name__)
+
+# AsyncChatRAG criado e aquecido em uma thread ao subir o servidor
+# (inicializacao.py): a porta abre sem esperar o Chroma nem o aquecimento
+inicializacao = Inicializacao(AsyncChatRAG)
+
+# Índices e prompts dos lojistas, carregados sob demanda (lojistas.py)
+lojistas = BasesLojistas(AsyncChatRAG)
+
+# Documentos enviados em POST /ingest, indexados por workers (threads) em segundo plano
+indexacao = FilaIndexacao(lojistas)
+
+
+async def pedido_atual():
+    """Campos da requisição atual (api_comum.Pedido)"""
+    return Pedido(
+        await request.get_json(silent=True), request.headers, request.args, request.remote_addr
+    )
+
+
+def require_api_key(f):
+    """Decorator para exigir chave de API em todas as requisições"""
+    @wraps(f)
+    async def decorated_function(*args, **kwargs):
+        erro = api_comum.autorizar(await pedido_atual())
+        if erro:
+            return erro
+        return await f(*args, **kwargs)
+    return decorated_function
+
+
+def require_ingest_key(f):
+    """Decorator do /ingest: exige INGEST_API_KEY no header Authorization"""
+    @wraps(f)
+    async def decorated_function(*args, **kwargs):
+        erro = api_comum.autorizar_ingest(await pedido_atual())
+        if erro:
+            return erro
+        return await f(*args, **kwargs)
+    return decorated_function
+
+
+def get_chat_rag():
+    """Instância do AsyncChatRAG, ou None enquanto a inicialização não terminou"""
+    return inicializacao.motor
+
+
+@app.before_serving
+@app.before_request
+async def iniciar_em_segundo_plano():
+    """Dispara a inicialização sem segurar a subida do servidor nem a requisição"""
+    inicializacao.iniciar()
+
+
+async def resolver_motor(pedido, carregar=True):
+    """
+    Motor da requisição: o do lojista (merchant_id) ou o padrão (api_comum.resolver_motor)
+
+    O índice do lojista é carregado em uma thread, fora do event loop.
+    """
+    merchant_id, _ = pedido.tenant()
+    if merchant_id and carregar:
+        return await asyncio.to_thread(
+            api_comum.resolver_motor, pedido, inicializacao, lojistas, carregar
+        )
+    return api_comum.resolver_motor(pedido, inicializacao, lojistas, carregar)
+
+
+async def init_chat_rag():
+    """Inicializa o AsyncChatRAG e espera terminar, sem bloquear o event loop (scripts e benchmarks)"""
+    try:
+        await asyncio.to_thread(inicializacao.executar)
+        logger.info("Sistema AsyncChatRAG inicializado com sucesso")
+        return True
+    except Exception as e:
+        logger.error(f"Erro ao inicializar AsyncChatRAG: {e}")
+        return False
+
+
+async def component_stats():
+    """Estatísticas dos caches, sessões, roteador, clientes, resiliência e inicialização (/stats e /metrics)"""
+    # SQLite e Redis (sessões, jobs) fazem I/O: a consulta roda fora do event loop
+    return await asyncio.to_thread(
+        api_comum.component_stats, inicializacao, lojistas, indexacao, "async_coalescer"
+    )
+
+
+@app.route('/health', methods=['GET'])
+async def health_check():
+    """Liveness: o processo responde (mesmo antes de o AsyncChatRAG ficar pronto); não consulta nenhum componente"""
+    return api_comum.saude("Chat RAG API (async)", inicializacao)
+
+
+@app.route('/stats', methods=['GET'])
+@require_api_key
+async def get_stats():
+    """Estatísticas dos caches, sessões, roteador, clientes, resiliência, lojistas e indexação"""
+    return await component_stats()
+
+
+@app.route('/ready', methods=['GET'])
+async def ready_check():
+    """Readiness: 200 só depois de o AsyncChatRAG ser criado e aquecido"""
+    return api_comum.prontidao(inicializacao)
+
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    """Latência por etapa e contadores (Prometheus; ?format=json para JSON)"""
+    if not METRICS_ENABLED:
+        abort(404)
+    if request.args.get('format') == 'json':
+        return get_metrics().stats()
+    return Response(
+        get_metrics().prometheus(await component_stats()),
+        mimetype='text/plain; version=0.0.4'
+    )
+
+
+@app.route('/chat', methods=['POST'])
+@require_api_key
+async def chat():
+    """Endpoint principal para interagir com o chat"""
+    with trace("chat"):
+        try:
+            pedido = await pedido_atual()
+            # AsyncChatRAG pronto e, com merchant_id, o motor do lojista
+            chat_rag_instance, merchant_id, erro = await resolver_motor(pedido)
+            if erro:
+                return erro
+
+            message, erro = pedido.mensagem()
+            if erro:
+                anotar(status="invalid")
+                return erro
+
+            session_id = pedido.session_id() or new_session_id()
+            logger.info(f"Processando mensagem: {message[:50]}...")
+            response = await chat_rag_instance.aprocess_question(
+                message, chave_sessao(session_id, merchant_id)
+            )
+
+            with span("serialization"):
+                return api_comum.resposta_chat(response, session_id)
+
+        except Exception as e:
+            anotar(status="error")
+            logger.error(f"Erro ao processar mensagem: {e}")
+            return api_comum.erro_interno(e)
+
+
+@app.route('/chat/stream', methods=['POST'])
+@require_api_key
+async def chat_stream():
+    """Envia a resposta em streaming (SSE) conforme os tokens chegam"""
+    pedido = await pedido_atual()
+    chat_rag_instance, merchant_id, erro = await resolver_motor(pedido)
+    if erro:
+        return erro
+
+    message, erro = pedido.mensagem()
+    if erro:
+        return erro
+
+    session_id = pedido.session_id() or new_session_id()
+    logger.info(f"Processando mensagem (stream): {message[:50]}...")
+
+    async def generate():
+        partes = []
+        with trace("chat_stream"):
+            try:
+                async for delta in chat_rag_instance.aprocess_question_stream(
+                    message, chave_sessao(session_id, merchant_id)
+                ):
+                    partes.append(delta)
+                    yield sse_event({"delta": delta})
+                yield api_comum.evento_fim(partes, session_id)
+            except Exception as e:
+                yield api_comum.evento_erro(e)
+
+    response = Response(generate(), mimetype='text/event-stream', headers=CABECALHOS_STREAM)
+    response.timeout = None
+    return response
+
+
+@app.route('/chat/batch', methods=['POST'])
+@require_api_key
+async def chat_batch():
+    """Responde um lote de perguntas independentes, em JSONL conforme ficam prontas"""
+    pedido = await pedido_atual()
+    chat_rag_instance, merchant_id, erro = await resolver_motor(pedido)
+    if erro:
+        return erro
+
+    itens, concorrencia, usar_cache, erro = api_comum.ler_lote(
+        pedido, await request.get_data(as_text=True)
+    )
+    if erro:
+        return erro
+
+    async def generate():
+        with trace("chat_batch"):
+            try:
+                async for resultado in aresponder_lote(chat_rag_instance, itens, concorrencia, usar_cache):
+                    yield api_comum.linha_lote(resultado)
+            except Exception as e:
+                yield api_comum.linha_erro_lote(e)
+
+    response = Response(generate(), mimetype='application/x-ndjson', headers=CABECALHOS_STREAM)
+    response.timeout = None
+    return response
+
+
+@app.route('/chat/clear', methods=['POST'])
+@require_api_key
+async def clear_history():
+    """Limpa o histórico da conversa da sessão"""
+    pedido = await pedido_atual()
+    chat_rag_instance, merchant_id, erro = await resolver_motor(pedido, carregar=False)
+    if erro:
+        return erro
+
+    session_id, erro = api_comum.exigir_sessao(pedido)
+    if erro:
+        return erro
+
+    await chat_rag_instance.aclear_history(chave_sessao(session_id, merchant_id))
+    return api_comum.historico_limpo()
+
+
+@app.route('/chat/history', methods=['GET'])
+@require_api_key
+async def get_history():
+    """Retorna o histórico da conversa da sessão"""
+    pedido = await pedido_atual()
+    chat_rag_instance, merchant_id, erro = await resolver_motor(pedido, carregar=False)
+    if erro:
+        return erro
+
+    session_id, erro = api_comum.exigir_sessao(pedido, "Parâmetro")
+    if erro:
+        return erro
+
+    history = await chat_rag_instance.aget_history(chave_sessao(session_id, merchant_id))
+    return api_comum.resposta_historico(history, session_id)
+
+
+@app.route('/cache/invalidate', methods=['POST'])
+@require_api_key
+async def invalidate_cache():
+    """Descarta o cache de respostas (use depois de reindexar a base)"""
+    return api_comum.invalidar_caches(lojistas)
+
+
+@app.route('/ingest', methods=['POST'])
+@require_ingest_key
+async def ingest():
+    """Enfileira documentos de um lojista para indexação; retorna o job"""
+    # Validar megabytes de texto não deve segurar o event loop
+    return await asyncio.to_thread(api_comum.enfileirar, await pedido_atual(), indexacao)
+
+
+@app.route('/ingest/<job_id>', methods=['GET'])
+@require_ingest_key
+async def ingest_status(job_id):
+    """Estado, progresso e vazão de um job de indexação"""
+    # Com INGEST_JOB_BACKEND sqlite ou redis a consulta faz I/O
+    return await asyncio.to_thread(api_comum.estado_job, indexacao, job_id)
+
+
+@app.errorhandler(401)
+async def unauthorized(error):
+    """Handler personalizado para erro 401"""
+    return api_comum.NAO_AUTORIZADO
+
+
+@app.errorhandler(404)
+async def not_found(error):
+    """Handler personalizado para erro 404"""
+    return api_comum.NAO_ENCONTRADO
+
+
+@app.errorhandler(500)
+async def internal_error(error):
+    """Handler personalizado para erro 500"""
+    return api_comum.ERRO_INESPERADO
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print("=" * 60)
+    print("🚀 INICIANDO API CHAT RAG (ASYNC)")
+    print("=" * 60)
+
+    if api_comum.API_KEY == "sua_chave_api_aqui":
+        print("❌ AVISO: Defina a variável API_KEY no arquivo .env!")
+        print("   Exemplo: API_KEY=minha_chave_secreta_123")
+    if not api_comum.INGEST_API_KEY or api_comum.INGEST_API_KEY == api_comum.API_KEY:
+        print("ℹ️ POST /ingest desativado: defina INGEST_API_KEY (diferente de API_KEY)")
+
+    uvicorn.run(
+        app,
+        host='0.0.0.0',
+        port=int(os.getenv('PORT', 5000)),
+        log_level="info"
+    )
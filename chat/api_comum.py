@@ -0,0 +1,351 @@
+"""
+Partes das APIs Flask (api_chat.py) e ASGI (api_chat_async.py) que não
+dependem do framework
+
+A leitura da requisição (chave de API, sessão, lojista, mensagem), as
+respostas de erro, o payload de /stats e os endpoints que só consultam os
+componentes ficam aqui, uma vez. Os apps só adaptam: leem o corpo com o
+framework, esperam o I/O (o app ASGI leva para uma thread o que bloqueia) e
+devolvem as respostas, tuplas (dicionário, status[, headers]) que o Flask e
+o Quart convertem em JSON.
+"""
+
+import hmac
+import json
+import logging
+import os
+import uuid
+
+from dotenv import load_dotenv
+
+from cache import get_answer_cache, get_embedding_cache
+from clientes import get_registry
+from contexto import get_context_stats
+from indexacao import FilaCheia
+from lojistas import LojistaDesconhecido, validar_id
+from lote import ler_pedido_lote
+from metricas import anotar
+from resiliencia import resilience_stats
+from sessoes import get_session_store
+from sse import sse_event
+
+# Carrega as variáveis de ambiente
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configurações da API
+API_KEY = os.getenv("API_KEY", "sua_chave_api_aqui")
+# Chave própria do /ingest: quem só conversa (API_KEY) não altera as bases.
+# Sem ela a indexação pela API fica desligada
+INGEST_API_KEY = os.getenv("INGEST_API_KEY", "")
+
+# (rota, descrição): a resposta 404 e a lista impressa ao subir o servidor
+ENDPOINTS = [
+    ("GET /health", "Verificação de saúde (liveness)"),
+    ("GET /ready", "Sistema pronto para atender (readiness)"),
+    ("GET /stats", "Estatísticas dos caches, sessões e lojistas"),
+    ("GET /metrics", "Latência por etapa e contadores (Prometheus)"),
+    ("POST /chat", "Enviar mensagem"),
+    ("POST /chat/stream", "Enviar mensagem (resposta em streaming SSE)"),
+    ("POST /chat/batch", "Lote de perguntas (JSONL com tempos por item)"),
+    ("POST /chat/clear", "Limpar histórico"),
+    ("GET /chat/history", "Obter histórico"),
+    ("POST /cache/invalidate", "Limpar cache de respostas"),
+    ("POST /ingest", "Indexar documentos de um lojista"),
+    ("GET /ingest/<job_id>", "Progresso da indexação"),
+]
+
+# Headers das respostas em streaming (SSE e JSONL): sem cache nem buffer no proxy
+CABECALHOS_STREAM = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+NAO_AUTORIZADO = {
+    "error": "Não autorizado",
+    "message": "Chave de API inválida ou ausente",
+    "hint": "Inclua a chave no header Authorization como 'Bearer sua_chave' ou no parâmetro 'api_key'"
+}, 401
+
+NAO_ENCONTRADO = {
+    "error": "Endpoint não encontrado",
+    "available_endpoints": [rota for rota, _ in ENDPOINTS]
+}, 404
+
+ERRO_INESPERADO = {
+    "error": "Erro interno do servidor",
+    "message": "Ocorreu um erro inesperado. Tente novamente mais tarde."
+}, 500
+
+
+class Pedido:
+    """Os campos de uma requisição: corpo JSON, headers e query string"""
+
+    def __init__(self, payload, headers, args, remote_addr=None):
+        # payload: o JSON como veio (o lote aceita uma lista); None sem JSON
+        self.json = payload
+        self.tem_json = bool(payload)
+        self.payload = payload if isinstance(payload, dict) else {}
+        self.headers = headers
+        self.args = args
+        self.remote_addr = remote_addr
+
+    def _bearer(self):
+        chave = self.headers.get("Authorization") or ""
+        return chave[len("Bearer "):] if chave.startswith("Bearer ") else None
+
+    def chave_api(self):
+        """Chave do header Authorization, do parâmetro api_key ou do JSON"""
+        return self._bearer() or self.args.get("api_key") or self.payload.get("api_key")
+
+    def session_id(self):
+        """session_id do JSON, do header X-Session-Id ou da query"""
+        return (
+            self.payload.get("session_id")
+            or self.payload.get("sessionId")
+            or self.headers.get("X-Session-Id")
+            or self.args.get("session_id")
+        )
+
+    def tenant(self):
+        """merchant_id e product_id do JSON, dos headers X-Merchant-Id/X-Product-Id ou da query"""
+        merchant_id = (
+            self.payload.get("merchant_id")
+            or self.payload.get("merchantId")
+            or self.headers.get("X-Merchant-Id")
+            or self.args.get("merchant_id")
+        )
+        product_id = (
+            self.payload.get("product_id")
+            or self.payload.get("productId")
+            or self.headers.get("X-Product-Id")
+            or self.args.get("product_id")
+        )
+        return merchant_id, product_id
+
+    def mensagem(self):
+        """Lê e valida o campo 'message' (retorna (mensagem, erro))"""
+        if not self.tem_json:
+            return None, erro("Payload JSON é obrigatório")
+        message = self.payload.get("message")
+        message = message.strip() if isinstance(message, str) else ""
+        if not message:
+            return None, erro("Campo 'message' é obrigatório e não pode estar vazio")
+        return message, None
+
+
+def erro(mensagem, status=400, headers=None):
+    """Resposta de erro {"error": mensagem}"""
+    if headers:
+        return {"error": mensagem}, status, headers
+    return {"error": mensagem}, status
+
+
+def erro_interno(e):
+    return {"error": "Erro interno do servidor", "details": str(e)}, 500
+
+
+def autorizar(pedido):
+    """None se a chave de API confere; senão a resposta 401"""
+    chave = pedido.chave_api()
+    if chave and hmac.compare_digest(str(chave).encode(), API_KEY.encode()):
+        return None
+    logger.warning(f"Tentativa de acesso não autorizado de {pedido.remote_addr}")
+    return NAO_AUTORIZADO
+
+
+def autorizar_ingest(pedido):
+    """None se o pedido traz INGEST_API_KEY; senão 403 (indexação desligada) ou 401"""
+    if not INGEST_API_KEY or INGEST_API_KEY == API_KEY:
+        return erro("Indexação pela API desativada: defina INGEST_API_KEY (diferente de API_KEY)", 403)
+    # Só pelo header: a chave não vai parar em logs de URL
+    chave = pedido._bearer() or ""
+    if hmac.compare_digest(chave.encode(), INGEST_API_KEY.encode()):
+        return None
+    logger.warning(f"Tentativa de indexação não autorizada de {pedido.remote_addr}")
+    return NAO_AUTORIZADO
+
+
+def new_session_id():
+    return f"chat_{uuid.uuid4().hex}"
+
+
+def exigir_sessao(pedido, campo="Campo"):
+    """(session_id, erro): endpoints de histórico não criam sessão"""
+    session_id = pedido.session_id()
+    if not session_id:
+        return None, erro(f"{campo} 'session_id' é obrigatório")
+    return session_id, None
+
+
+def nao_pronto(inicializacao):
+    """Resposta dos endpoints do chat enquanto o motor não está pronto"""
+    return {
+        "error": "Sistema ChatRAG inicializando",
+        "startup": inicializacao.stats()
+    }, 503, {"Retry-After": str(int(inicializacao.retry_delay))}
+
+
+def resolver_motor(pedido, inicializacao, bases, carregar=True):
+    """
+    Motor da requisição: o do lojista (merchant_id) ou o padrão
+
+    Retorna (motor, merchant_id, resposta de erro ou None). Com
+    carregar=False o índice do lojista não é carregado (histórico).
+    """
+    chat_rag = inicializacao.motor
+    if chat_rag is None:
+        anotar(status="not_ready")
+        return None, None, nao_pronto(inicializacao)
+    merchant_id, product_id = pedido.tenant()
+    if not merchant_id:
+        return chat_rag, None, None
+    try:
+        if not carregar:
+            return chat_rag, validar_id(merchant_id), None
+        return bases.motor(merchant_id, product_id), merchant_id, None
+    except LojistaDesconhecido as e:
+        anotar(status="invalid")
+        return None, None, erro(str(e), 404)
+    except ValueError as e:
+        anotar(status="invalid")
+        return None, None, erro(str(e))
+
+
+def component_stats(inicializacao, bases, fila, coalescer="coalescer"):
+    """
+    Estatísticas dos caches, sessões, roteador, clientes, resiliência e inicialização (/stats e /metrics)
+
+    coalescer: atributo do motor com a coalescência (async_coalescer no app ASGI).
+    """
+    answer_cache = get_answer_cache()
+    # O roteador do motor, se já existir: a consulta não o cria (nem lê a pasta docs)
+    intent_router = getattr(inicializacao.motor, "intent_router", None)
+    coalescer = getattr(inicializacao.motor, coalescer, None)
+    return {
+        "embedding_cache": get_embedding_cache().stats(),
+        "answer_cache": answer_cache.stats() if answer_cache else None,
+        "sessions": get_session_store().stats(),
+        "context": get_context_stats().stats(),
+        "intents": intent_router.stats() if intent_router else None,
+        "coalescing": coalescer.stats() if coalescer else None,
+        "clients": get_registry().stats(),
+        "resilience": resilience_stats(),
+        "startup": inicializacao.stats(),
+        "tenants": bases.stats(),
+        "ingestion": fila.stats()
+    }
+
+
+def saude(servico, inicializacao):
+    """Liveness: o processo responde; não consulta nenhum componente"""
+    return {
+        "status": "healthy",
+        "service": servico,
+        "chat_rag_loaded": inicializacao.pronto
+    }
+
+
+def prontidao(inicializacao):
+    """Readiness: 200 só depois de o motor ser criado e aquecido"""
+    status = 200 if inicializacao.pronto else 503
+    return {
+        "status": "ready" if status == 200 else inicializacao.estado,
+        **inicializacao.stats()
+    }, status
+
+
+def resposta_chat(response, session_id):
+    return {
+        "response": response,
+        "session_id": session_id,
+        "status": "success"
+    }
+
+
+def evento_fim(partes, session_id):
+    """Último evento SSE do /chat/stream, com a resposta inteira"""
+    return sse_event(resposta_chat("".join(partes), session_id), event="done")
+
+
+def evento_erro(e):
+    anotar(status="error")
+    logger.error(f"Erro ao processar mensagem (stream): {e}")
+    return sse_event(erro_interno(e)[0], event="error")
+
+
+def linha_lote(resultado):
+    return json.dumps(resultado, ensure_ascii=False) + "\n"
+
+
+def linha_erro_lote(e):
+    anotar(status="error")
+    logger.error(f"Erro ao processar lote: {e}")
+    return linha_lote(erro_interno(e)[0])
+
+
+def ler_lote(pedido, corpo):
+    """(itens, concorrência, usar o cache?, erro) do /chat/batch"""
+    try:
+        itens, concorrencia, usar_cache = ler_pedido_lote(pedido.json, corpo, pedido.args)
+    except ValueError as e:
+        return None, None, None, erro(str(e))
+    logger.info(f"Processando lote de {len(itens)} perguntas")
+    return itens, concorrencia, usar_cache, None
+
+
+def resposta_historico(history, session_id):
+    return {
+        "history": history,
+        "session_id": session_id,
+        "total_messages": len(history),
+        "status": "success"
+    }
+
+
+def historico_limpo():
+    logger.info("Histórico da conversa limpo")
+    return {
+        "message": "Histórico da conversa limpo com sucesso",
+        "status": "success"
+    }
+
+
+def invalidar_caches(bases):
+    """Descarta o cache de respostas, o padrão e os dos lojistas (use depois de reindexar a base)"""
+    answer_cache = get_answer_cache()
+    if answer_cache is not None:
+        answer_cache.invalidate()
+    bases.invalidar_caches()
+    logger.info("Cache de respostas invalidado")
+    return {
+        "message": "Cache de respostas invalidado",
+        "status": "success"
+    }
+
+
+def enfileirar(pedido, fila):
+    """Enfileira os documentos do pedido para indexação (POST /ingest)"""
+    if not pedido.tem_json:
+        return erro("Payload JSON é obrigatório")
+    merchant_id, _ = pedido.tenant()
+    if not merchant_id:
+        return erro("Campo 'merchant_id' é obrigatório")
+    try:
+        job = fila.enviar(merchant_id, pedido.payload.get("documents"))
+    except ValueError as e:
+        return erro(str(e))
+    except FilaCheia as e:
+        return erro(str(e), 429, {"Retry-After": "30"})
+
+    logger.info(f"Job de indexação {job.id}: {job.n_documents} documentos de {job.merchant_id}")
+    return {
+        **job.stats(),
+        "status_url": f"/ingest/{job.id}"
+    }, 202
+
+
+def estado_job(fila, job_id):
+    """Estado, progresso e vazão de um job de indexação (GET /ingest/<job_id>)"""
+    job = fila.job(job_id)
+    if job is None:
+        return erro("Job não encontrado", 404)
+    return job.stats()
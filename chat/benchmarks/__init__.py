@@ -0,0 +1,3 @@
+"""
+Benchmarks e servidores locais que substituem as APIs externas
+"""
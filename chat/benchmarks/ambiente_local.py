@@ -0,0 +1,84 @@
+"""
+Ambiente local para benchmarks dos front ends (ChatRAG e API)
+
+Sobe o servidor falso da OpenAI, aponta o cliente para ele via variáveis
+de ambiente e gera um snapshot dos docs com embeddings falsos para o
+retriever local. Com um FakeChromaServer, indexa os mesmos chunks nele e
+usa o backend "chroma" (CloudClient apontado via CHROMA_HOST). Chame antes
+de importar chat_interativo/api_chat.
+"""
+
+import os
+
+import cache
+import intencoes
+from benchmarks.fake_openai import FakeOpenAIServer, fake_embedding
+from chunking import EMBEDDING_MODEL, gerar_chunks
+from clientes import COLLECTION_NAME, get_chroma_embedding_function
+from rag import carregar_documentos, directory_path
+from snapshot import salvar_snapshot
+
+
+def chunks_dos_docs():
+    """Chunks da pasta docs, com os mesmos IDs do rag.py"""
+    return gerar_chunks(carregar_documentos(directory_path))
+
+
+def indexar_no_chroma(chroma, chunks, embeddings):
+    """Cria a coleção no servidor falso do Chroma com os chunks dos docs"""
+    import chromadb
+
+    client = chromadb.HttpClient(
+        host=chroma.host, port=chroma.port, tenant=chroma.tenant, database=chroma.database
+    )
+    # Mesma função de embedding do chat (o Chroma recusa uma diferente da gravada)
+    collection = client.get_or_create_collection(
+        COLLECTION_NAME, embedding_function=get_chroma_embedding_function()
+    )
+    collection.upsert(
+        ids=[c["id"] for c in chunks],
+        documents=[c["text"] for c in chunks],
+        embeddings=embeddings,
+    )
+
+
+def preparar_ambiente(tmp_dir, answer_cache=False, chroma=None, intent_router=True, **fake_kwargs):
+    """
+    Inicia o servidor falso e configura o ambiente; retorna o servidor
+
+    chroma: FakeChromaServer já iniciado para usar o backend "chroma" em vez
+    do snapshot local. intent_router=False desliga as respostas prontas,
+    para que toda pergunta chegue ao LLM.
+    """
+    fake = FakeOpenAIServer(**fake_kwargs).start()
+
+    chunks = chunks_dos_docs()
+    embeddings = [fake_embedding(c["text"]) for c in chunks]
+    snapshot_path = os.path.join(tmp_dir, "snapshot.snap")
+    salvar_snapshot(
+        snapshot_path,
+        [c["id"] for c in chunks],
+        [c["text"] for c in chunks],
+        embeddings,
+        metadata={"embedding_model": EMBEDDING_MODEL},
+    )
+
+    os.environ["OPENAI_API_KEY"] = "fake"
+    os.environ["OPENAI_BASE_URL"] = fake.base_url
+    os.environ["RETRIEVER_BACKEND"] = "local"
+    os.environ["SNAPSHOT_PATH"] = snapshot_path
+    if chroma is not None:
+        os.environ["RETRIEVER_BACKEND"] = "chroma"
+        os.environ["CHROMA_HOST"] = chroma.host
+        os.environ["CHROMA_PORT"] = str(chroma.port)
+        os.environ["CHROMA_SSL"] = "false"
+        os.environ["CHROMADB_API_KEY"] = "fake"
+        os.environ["CHROMADB_TENANT_ID"] = chroma.tenant
+        os.environ["CHROMADB"] = chroma.database
+        indexar_no_chroma(chroma, chunks, embeddings)
+    os.environ["ANSWER_CACHE_ENABLED"] = "true" if answer_cache else "false"
+    # cache.py lê a variável ao ser importado, o que normalmente já aconteceu
+    cache.ANSWER_CACHE_ENABLED = answer_cache
+    os.environ["INTENT_ROUTER_ENABLED"] = "true" if intent_router else "false"
+    intencoes.INTENT_ROUTER_ENABLED = intent_router
+    return fake
@@ -0,0 +1,171 @@
+"""
+Avaliação offline do chunking: recall@k das perguntas de referência
+
+Cada pergunta de benchmarks/dados/perguntas_avaliacao.json traz o trecho do
+documento que a responde. Como os IDs dos chunks são posicionais e mudam com
+o chunker, o trecho é resolvido nos IDs esperados de cada chunker (os chunks
+que o contêm inteiro), e um acerto no top-k é recuperar um deles. Compara o
+split_text original com o chunker estrutural usando os embeddings falsos
+determinísticos (sem rede) ou, com --openai, os embeddings reais.
+Com --hibrido, avalia também a busca híbrida (BM25 + vetorial) sobre o
+chunker estrutural. Execute a partir de chat/:
+
+    python -m benchmarks.avaliar_chunking -k 1 3 5 --hibrido
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+
+from benchmarks.fake_openai import fake_embedding
+from chunking import CHUNK_PARAMS, CHUNK_PARAMS_FIXO, gerar_chunks
+from rag import carregar_documentos, directory_path
+from busca_lexical import BM25Index
+from retriever import HybridRetriever, LocalRetriever
+from tokens import count_tokens
+
+PERGUNTAS_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "dados", "perguntas_avaliacao.json"
+)
+
+
+def _normalizar(texto):
+    return re.sub(r"\s+", " ", texto).strip()
+
+
+def carregar_perguntas(path=PERGUNTAS_PATH):
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def ids_esperados(pergunta, chunks):
+    """IDs dos chunks do documento da pergunta que contêm o trecho esperado"""
+    trecho = _normalizar(pergunta["expected"])
+    prefixo = f"{pergunta['doc']}_chunk"
+    return {
+        chunk["id"]
+        for chunk in chunks
+        if chunk["id"].startswith(prefixo) and trecho in _normalizar(chunk["text"])
+    }
+
+
+def funcao_embedding(usar_openai):
+    """Função lista de textos -> lista de vetores (falsa ou da OpenAI)"""
+    if not usar_openai:
+        return lambda textos: [fake_embedding(texto) for texto in textos]
+
+    from openai import OpenAI
+
+    from ingestao import embed_textos
+
+    client = OpenAI()
+
+    def embed(textos):
+        vetores = []
+        for inicio in range(0, len(textos), 100):
+            vetores.extend(embed_textos(client, textos[inicio:inicio + 100]))
+        return vetores
+
+    return embed
+
+
+def avaliar(nome, chunks, perguntas, embed, ks, verbose=False, hibrido=False):
+    """Recall@k, MRR e tamanho do contexto recuperado para um conjunto de chunks"""
+    ids, textos = [c["id"] for c in chunks], [c["text"] for c in chunks]
+    retriever = LocalRetriever(ids, textos, embed(textos))
+    if hibrido:
+        retriever = HybridRetriever(retriever, BM25Index(ids, textos))
+    tokens_chunk = {c["id"]: count_tokens(c["text"]) for c in chunks}
+    embeddings = embed([p["question"] for p in perguntas])
+    k_max = max(ks)
+
+    acertos = {k: 0 for k in ks}
+    reciprocos, tokens_contexto, sem_chunk = [], {k: [] for k in ks}, 0
+    for pergunta, embedding in zip(perguntas, embeddings):
+        esperados = ids_esperados(pergunta, chunks)
+        if not esperados:
+            # O trecho foi cortado ao meio: nenhum chunk o contém inteiro
+            sem_chunk += 1
+        if hibrido:
+            _, encontrados = retriever.search(pergunta["question"], lambda _: embedding, k_max)
+        else:
+            encontrados = retriever.query_by_embedding(embedding, k_max)
+        resultados = [r["id"] for r in encontrados]
+        posicao = next((i for i, cid in enumerate(resultados) if cid in esperados), None)
+        reciprocos.append(0.0 if posicao is None else 1.0 / (posicao + 1))
+        for k in ks:
+            if posicao is not None and posicao < k:
+                acertos[k] += 1
+            tokens_contexto[k].append(sum(tokens_chunk[cid] for cid in resultados[:k]))
+        if verbose and (posicao is None or posicao >= min(ks)):
+            print(f"   ❌ {pergunta['question']}")
+            print(f"      esperado: {sorted(esperados) or 'nenhum chunk contém o trecho'}")
+            print(f"      top-{k_max}: {resultados}")
+
+    tamanhos = list(tokens_chunk.values())
+    return {
+        "chunker": nome,
+        "chunks": len(chunks),
+        "avg_chunk_tokens": statistics.mean(tamanhos),
+        "max_chunk_tokens": max(tamanhos),
+        "split_answers": sem_chunk,
+        "recall": {k: acertos[k] / len(perguntas) for k in ks},
+        "mrr": statistics.mean(reciprocos),
+        "context_tokens": {k: statistics.mean(tokens_contexto[k]) for k in ks},
+        "lexical_shortcuts": retriever.shortcuts if hibrido else 0,
+    }
+
+
+def imprimir(resultado, ks):
+    print(f"\n=== {resultado['chunker']} ===")
+    print(
+        f"Chunks: {resultado['chunks']} "
+        f"(média {resultado['avg_chunk_tokens']:.0f} tokens, máx. {resultado['max_chunk_tokens']})"
+    )
+    print(f"Respostas cortadas entre chunks: {resultado['split_answers']}")
+    for k in ks:
+        print(
+            f"recall@{k}: {resultado['recall'][k]:.2f} | "
+            f"tokens de contexto no top-{k}: {resultado['context_tokens'][k]:.0f}"
+        )
+    print(f"MRR: {resultado['mrr']:.3f}")
+    if resultado["lexical_shortcuts"]:
+        print(f"Atalhos lexicais (sem embedding): {resultado['lexical_shortcuts']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-k", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--max-tokens", type=int, default=CHUNK_PARAMS["max_tokens"])
+    parser.add_argument("--overlap", type=int, default=CHUNK_PARAMS["overlap_tokens"])
+    parser.add_argument("--perguntas", default=PERGUNTAS_PATH)
+    parser.add_argument("--openai", action="store_true", help="usa embeddings reais (requer OPENAI_API_KEY)")
+    parser.add_argument("--verbose", action="store_true", help="mostra as perguntas que erraram")
+    parser.add_argument("--hibrido", action="store_true", help="avalia também a busca BM25 + vetorial")
+    args = parser.parse_args()
+
+    documents = carregar_documentos(directory_path)
+    perguntas = carregar_perguntas(args.perguntas)
+    embed = funcao_embedding(args.openai)
+    print(f"📋 {len(perguntas)} perguntas de referência")
+
+    estrutural = dict(CHUNK_PARAMS, max_tokens=args.max_tokens, overlap_tokens=args.overlap)
+    configuracoes = [
+        ("split_text (1000 caracteres)", CHUNK_PARAMS_FIXO, False),
+        (f"estrutural ({args.max_tokens} tokens)", estrutural, False),
+    ]
+    if args.hibrido:
+        configuracoes.append((f"estrutural ({args.max_tokens} tokens) + BM25", estrutural, True))
+    for nome, params, hibrido in configuracoes:
+        if args.verbose:
+            print(f"\n--- {nome} ---")
+        resultado = avaliar(
+            nome, gerar_chunks(documents, params), perguntas, embed, args.k, args.verbose, hibrido
+        )
+        imprimir(resultado, args.k)
+
+
+if __name__ == "__main__":
+    main()
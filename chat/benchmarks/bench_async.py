@@ -0,0 +1,131 @@
+"""
+Carga concorrente em um único worker: Flask síncrono vs. ASGI assíncrono
+
+Simula um worker síncrono do gunicorn (Flask sem threads) e um worker
+uvicorn com api_chat_async, ambos contra o servidor falso da OpenAI, e
+dispara requisições concorrentes em /chat. Execute a partir de chat/:
+
+    python -m benchmarks.bench_async --concurrency 50 --requests 200
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import socket
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.ambiente_local import preparar_ambiente
+
+
+def porta_livre():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def iniciar_flask_sincrono():
+    """Um worker síncrono: atende uma requisição por vez"""
+    from werkzeug.serving import make_server
+
+    import api_chat
+
+    api_chat.init_chat_rag()
+    server = make_server("127.0.0.1", 0, api_chat.app, threaded=False)
+    server.socket.listen(1024)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_port, server.shutdown
+
+
+def iniciar_uvicorn_async():
+    """Um worker uvicorn com o app Quart (um event loop)"""
+    import uvicorn
+
+    import api_chat_async
+
+    port = porta_livre()
+    config = uvicorn.Config(
+        api_chat_async.app, host="127.0.0.1", port=port, log_level="warning", backlog=1024
+    )
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    # O AsyncChatRAG é criado em segundo plano depois que a porta abre
+    api_chat_async.inicializacao.aguardar()
+
+    def parar():
+        server.should_exit = True
+
+    return port, parar
+
+
+def requisitar(port, message):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=300)
+    inicio = time.perf_counter()
+    conn.request(
+        "POST",
+        "/chat",
+        body=json.dumps({"message": message}),
+        headers={"Authorization": "Bearer sua_chave_api_aqui", "Content-Type": "application/json"},
+    )
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    return response.status, time.perf_counter() - inicio
+
+
+def carga(port, total, concorrencia):
+    """Dispara `total` requisições com `concorrencia` clientes simultâneos"""
+    # Perguntas distintas para não cair no cache de embeddings
+    perguntas = [f"Frete muito caro? pedido {i}" for i in range(total)]
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        resultados = list(executor.map(lambda q: requisitar(port, q), perguntas))
+    duracao = time.perf_counter() - inicio
+    latencias = sorted(t for _, t in resultados)
+    erros = sum(1 for status, _ in resultados if status != 200)
+    return {
+        "throughput": total / duracao,
+        "p50": statistics.median(latencias),
+        "p95": latencias[int(len(latencias) * 0.95) - 1],
+        "erros": erros,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.1, help="latência de cada chamada à OpenAI (s)")
+    parser.add_argument("--skip-sync", action="store_true", help="só mede o worker assíncrono")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fake = preparar_ambiente(tmp, latency=args.latency)
+        modos = [("asgi (uvicorn + Quart)", iniciar_uvicorn_async)]
+        if not args.skip_sync:
+            modos.insert(0, ("wsgi síncrono (Flask)", iniciar_flask_sincrono))
+        try:
+            for nome, iniciar in modos:
+                port, parar = iniciar()
+                fake.reset_stats()
+                stats = carga(port, args.requests, args.concurrency)
+                parar()
+                # Pico de chamadas simultâneas à OpenAI = conversas em andamento no worker
+                print(
+                    f"{nome:<24} {stats['throughput']:7.1f} req/s | "
+                    f"p50 {stats['p50'] * 1000:7.0f} ms | p95 {stats['p95'] * 1000:7.0f} ms | "
+                    f"{fake.max_in_flight} conversas simultâneas | {stats['erros']} erros"
+                )
+        finally:
+            fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Teste de carga de ponta a ponta: vazão e latência de cauda de /chat
+
+Sobe os servidores falsos da OpenAI e (com --backend chroma) do Chroma,
+com latência e jitter configuráveis, e dispara perguntas concorrentes
+contra um dos alvos:
+
+- flask: api_chat em um servidor WSGI com threads
+- asgi: api_chat_async no uvicorn (um event loop)
+- direto: MotorRAG.process_question (motor.py) em threads, sem HTTP
+
+Mostra a vazão, p50/p90/p95/p99/máx, os erros e as chamadas feitas às
+APIs falsas. Execute a partir de chat/:
+
+    python -m benchmarks.bench_carga --alvo flask --backend chroma --concurrency 20 --requests 300 --salvar
+"""
+
+import argparse
+import logging
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.ambiente_local import preparar_ambiente
+from benchmarks.avaliar_chunking import carregar_perguntas
+from benchmarks.bench_async import iniciar_uvicorn_async, requisitar
+from benchmarks.fake_chroma import FakeChromaServer
+from benchmarks.resultados import salvar_resultado
+
+
+def iniciar_flask():
+    """api_chat em um servidor WSGI com uma thread por requisição"""
+    from werkzeug.serving import make_server
+
+    import api_chat
+
+    api_chat.init_chat_rag()
+    server = make_server("127.0.0.1", 0, api_chat.app, threaded=True)
+    server.socket.listen(1024)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_port, server.shutdown
+
+
+def montar_perguntas(total, repetidas, seed):
+    """
+    Perguntas de referência, em ordem aleatória
+
+    Com repetidas=False cada pergunta recebe um sufixo único, então nenhuma
+    cai nos caches de embeddings ou de respostas.
+    """
+    base = [p["question"] for p in carregar_perguntas()]
+    sorteio = random.Random(seed)
+    perguntas = [sorteio.choice(base) for _ in range(total)]
+    if repetidas:
+        return perguntas
+    return [f"{pergunta} (pedido {i})" for i, pergunta in enumerate(perguntas)]
+
+
+def percentil(ordenados, p):
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+def executar(chamar, perguntas, concorrencia):
+    """Executa chamar(pergunta) -> ok com `concorrencia` clientes; retorna as métricas"""
+
+    def cronometrar(pergunta):
+        inicio = time.perf_counter()
+        try:
+            ok = chamar(pergunta)
+        except Exception:
+            ok = False
+        return ok, time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        resultados = list(executor.map(cronometrar, perguntas))
+    duracao = time.perf_counter() - inicio
+    latencias = sorted(t for _, t in resultados)
+    return {
+        "requests": len(resultados),
+        "duration_s": duracao,
+        "throughput_rps": len(resultados) / duracao,
+        "p50_ms": percentil(latencias, 50) * 1000,
+        "p90_ms": percentil(latencias, 90) * 1000,
+        "p95_ms": percentil(latencias, 95) * 1000,
+        "p99_ms": percentil(latencias, 99) * 1000,
+        "max_ms": latencias[-1] * 1000,
+        "errors": sum(1 for ok, _ in resultados if not ok),
+    }
+
+
+def preparar_alvo(alvo):
+    """Retorna (chamar(pergunta) -> ok, parar())"""
+    if alvo == "direto":
+        from motor import ERRO_RESPOSTA, MotorRAG
+
+        chat = MotorRAG()
+        contador = iter(range(10**9))
+
+        def chamar(pergunta):
+            resposta = chat.process_question(pergunta, f"carga_{next(contador)}")
+            return not resposta.startswith(ERRO_RESPOSTA)
+
+        return chamar, lambda: None
+
+    port, parar = iniciar_flask() if alvo == "flask" else iniciar_uvicorn_async()
+    return (lambda pergunta: requisitar(port, pergunta)[0] == 200), parar
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--alvo", choices=["flask", "asgi", "direto"], default="flask")
+    parser.add_argument("--backend", choices=["local", "chroma"], default="local", help="busca no snapshot local ou no Chroma falso")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10, help="requisições antes da medição")
+    parser.add_argument("--latency", type=float, default=0.1, help="latência de cada chamada à OpenAI (s)")
+    parser.add_argument("--jitter", type=float, default=0.02, help="variação da latência da OpenAI (± s)")
+    parser.add_argument("--chroma-latency", type=float, default=0.03, help="latência de cada chamada ao Chroma (s)")
+    parser.add_argument("--chroma-jitter", type=float, default=0.01)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fração de chamadas à OpenAI que falham")
+    parser.add_argument("--repetidas", action="store_true", help="repete as perguntas (caches quentes)")
+    parser.add_argument("--answer-cache", action="store_true", help="liga o cache de respostas")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--salvar", action="store_true", help="grava o resultado em benchmarks/resultados/")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    chroma = None
+    if args.backend == "chroma":
+        chroma = FakeChromaServer(latency=args.chroma_latency, jitter=args.chroma_jitter).start()
+    with tempfile.TemporaryDirectory() as tmp:
+        fake = preparar_ambiente(
+            tmp,
+            answer_cache=args.answer_cache,
+            chroma=chroma,
+            latency=args.latency,
+            jitter=args.jitter,
+            fail_rate=args.fail_rate,
+        )
+        try:
+            chamar, parar = preparar_alvo(args.alvo)
+            perguntas = montar_perguntas(args.warmup + args.requests, args.repetidas, args.seed)
+            executar(chamar, perguntas[: args.warmup], args.concurrency)
+
+            fake.reset_stats()
+            if chroma is not None:
+                chroma.reset_stats()
+            metricas = executar(chamar, perguntas[args.warmup:], args.concurrency)
+            metricas["openai_embeddings"] = fake.total_requests("/v1/embeddings")
+            metricas["openai_completions"] = fake.total_requests("/v1/chat/completions")
+            metricas["chroma_queries"] = chroma.total_requests("query") if chroma else 0
+            parar()
+        finally:
+            fake.stop()
+            if chroma is not None:
+                chroma.stop()
+
+    print(
+        f"{args.alvo} ({args.backend}) | {metricas['throughput_rps']:.1f} req/s | "
+        f"p50 {metricas['p50_ms']:.0f} ms | p90 {metricas['p90_ms']:.0f} ms | "
+        f"p95 {metricas['p95_ms']:.0f} ms | p99 {metricas['p99_ms']:.0f} ms | "
+        f"máx {metricas['max_ms']:.0f} ms | {metricas['errors']} erros"
+    )
+    print(
+        f"OpenAI: {metricas['openai_embeddings']} embeddings, "
+        f"{metricas['openai_completions']} completions | Chroma: {metricas['chroma_queries']} queries"
+    )
+    if args.salvar:
+        parametros = {k: v for k, v in vars(args).items() if k != "salvar"}
+        salvar_resultado("bench_carga", parametros, metricas)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Custo de uma nova instância do chat e reaproveitamento de conexões
+
+Mede o tempo para criar a primeira e as instâncias seguintes do ChatRAG
+(como o Streamlit faz com o ChatRAGWeb a cada sessão) e quantas conexões
+TCP o servidor falso da OpenAI recebe para uma sequência de perguntas:
+com o registro de clientes (clientes.py) as instâncias compartilham o pool
+HTTP; com --sem-registro cada instância cria o próprio cliente e carrega
+o próprio retriever, como antes.
+Execute a partir de chat/:
+
+    python -m benchmarks.bench_clientes --sessions 20
+"""
+
+import argparse
+import contextlib
+import io
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.ambiente_local import preparar_ambiente
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=20, help="instâncias criadas (sessões)")
+    parser.add_argument("--latency", type=float, default=0.0, help="latência de cada chamada à OpenAI (s)")
+    parser.add_argument("--sem-registro", action="store_true", help="um cliente OpenAI novo por instância")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fake = preparar_ambiente(tmp, latency=args.latency)
+        try:
+            from openai import OpenAI
+
+            from chat_interativo import ChatRAG
+            from clientes import get_query_embedding_fn
+            from retriever import criar_retriever
+
+            tempos, chats = [], []
+            for _ in range(args.sessions):
+                inicio = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    chat = ChatRAG()
+                if args.sem_registro:
+                    chat.client = OpenAI(api_key="fake")
+                    chat.retriever = criar_retriever(
+                        "local", None, get_query_embedding_fn(), os.environ["SNAPSHOT_PATH"]
+                    )
+                tempos.append(time.perf_counter() - inicio)
+                chats.append(chat)
+
+            fake.reset_stats()
+            inicio = time.perf_counter()
+            for i, chat in enumerate(chats):
+                # Cada sessão faz duas perguntas (a segunda reaproveita a conexão)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    chat.process_question(f"Quanto tempo leva para ver resultado? ({i})", f"s{i}")
+                    chat.process_question(f"E o preço, vale a pena? ({i})", f"s{i}")
+            duracao = time.perf_counter() - inicio
+
+            print(f"Primeira instância:  {tempos[0] * 1000:8.1f} ms")
+            if len(tempos) > 1:
+                print(f"Instâncias seguintes: {statistics.median(tempos[1:]) * 1000:7.2f} ms (mediana)")
+            print(
+                f"{fake.total_requests()} requisições à OpenAI em {duracao * 1000:.0f} ms, "
+                f"{fake.connections} conexões TCP"
+            )
+        finally:
+            fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Rajada de perguntas iguais: chamadas à OpenAI com e sem coalescência
+
+Simula uma campanha: `--burst` clientes mandam a mesma pergunta ao mesmo
+tempo (threads no ChatRAG, corrotinas no AsyncChatRAG), contra o servidor
+falso da OpenAI e com o cache de respostas desligado. Mostra quantos
+completions foram feitos e quantos pedidos foram coalescidos. Execute a
+partir de chat/:
+
+    python -m benchmarks.bench_coalescencia --burst 50
+"""
+
+import argparse
+import asyncio
+import logging
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.ambiente_local import preparar_ambiente
+from coalescencia import AsyncSingleFlight, SingleFlight
+
+PERGUNTA = "Quanto tempo leva para ver resultado com o método?"
+
+
+def rajada_threads(chat, burst, rodada):
+    pergunta = f"{PERGUNTA} ({rodada})"
+    with ThreadPoolExecutor(max_workers=burst) as executor:
+        return list(executor.map(lambda i: chat.process_question(pergunta, f"t{rodada}_{i}"), range(burst)))
+
+
+async def rajada_async(chat, burst, rodada):
+    pergunta = f"{PERGUNTA} ({rodada})"
+    return await asyncio.gather(
+        *(chat.aprocess_question(pergunta, f"a{rodada}_{i}") for i in range(burst))
+    )
+
+
+def imprimir(nome, duracao, fake, coalescer, respostas):
+    stats = coalescer.stats() if coalescer else None
+    print(
+        f"{nome:<28} {duracao * 1000:7.0f} ms | "
+        f"{fake.total_requests('/v1/chat/completions'):>3} completions | "
+        f"{fake.total_requests('/v1/embeddings'):>3} embeddings | "
+        f"{stats['coalesced'] if stats else 0:>3} coalescidos | "
+        f"{len(set(respostas))} resposta(s) distinta(s)"
+    )
+
+
+async def medir_async(chat, fake, burst, primeira_rodada):
+    # As duas medições no mesmo event loop (o cliente assíncrono fica preso a ele)
+    for rodada, (nome, coalescer) in enumerate(
+        [("asyncio sem coalescência", None), ("asyncio com coalescência", AsyncSingleFlight())],
+        start=primeira_rodada,
+    ):
+        chat.async_coalescer = coalescer
+        fake.reset_stats()
+        inicio = time.perf_counter()
+        respostas = await rajada_async(chat, burst, rodada)
+        imprimir(nome, time.perf_counter() - inicio, fake, coalescer, respostas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--burst", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.2, help="latência de cada chamada à OpenAI (s)")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fake = preparar_ambiente(tmp, latency=args.latency)
+        try:
+            from chat_async import AsyncChatRAG
+
+            chat = AsyncChatRAG()
+            # Sem cache de respostas: só a coalescência evita os completions repetidos
+            chat.answer_cache = None
+            for rodada, (nome, coalescer) in enumerate(
+                [("threads sem coalescência", None), ("threads com coalescência", SingleFlight())]
+            ):
+                chat.coalescer = coalescer
+                fake.reset_stats()
+                inicio = time.perf_counter()
+                respostas = rajada_threads(chat, args.burst, rodada)
+                imprimir(nome, time.perf_counter() - inicio, fake, coalescer, respostas)
+            asyncio.run(medir_async(chat, fake, args.burst, primeira_rodada=2))
+        finally:
+            fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark da ingestão: um embedding/upsert por chunk vs. pipeline em lote
+
+Roda contra o servidor falso da OpenAI e um Chroma em memória, sem
+credenciais. Execute a partir da pasta chat/:
+
+    python -m benchmarks.bench_ingestao --latency 0.05 --multiplier 10
+"""
+
+import argparse
+import time
+
+import chromadb
+from openai import OpenAI
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from ingestao import embed_textos, executar_ingestao, imprimir_estatisticas
+from chunking import dividir_documento
+from rag import carregar_documentos, directory_path
+
+
+def carregar_chunks(multiplier):
+    """Carrega e divide os docs como o rag.py faz (replicando N vezes)"""
+    chunks = []
+    for doc in carregar_documentos(directory_path):
+        for copia in range(multiplier):
+            for i, chunk in enumerate(dividir_documento(doc)):
+                chunks.append({"id": f"{doc['id']}_copy{copia}_chunk{i + 1}", "text": chunk})
+    return chunks
+
+
+def ingestao_sequencial(chunks, client, collection):
+    """Comportamento antigo: uma requisição de embedding e um upsert por chunk"""
+    inicio = time.perf_counter()
+    for chunk in chunks:
+        embedding = embed_textos(client, [chunk["text"]])[0]
+        collection.upsert(ids=[chunk["id"]], documents=[chunk["text"]], embeddings=[embedding])
+    segundos = time.perf_counter() - inicio
+    return {
+        "chunks": len(chunks),
+        "seconds": segundos,
+        "chunks_per_second": len(chunks) / segundos if segundos else 0.0,
+        "embedding_requests": len(chunks),
+        "upsert_requests": len(chunks),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--latency", type=float, default=0.05, help="latência simulada (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="variação da latência (s)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fração de requisições com erro 500")
+    parser.add_argument("--multiplier", type=int, default=1, help="replica os docs N vezes")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--max-tokens", type=int, default=8000)
+    parser.add_argument("--skip-sequential", action="store_true")
+    args = parser.parse_args()
+
+    chunks = carregar_chunks(args.multiplier)
+    print(f"📄 {len(chunks)} chunks para indexar")
+
+    with FakeOpenAIServer(latency=args.latency, jitter=args.jitter, fail_rate=args.fail_rate) as fake:
+        client = OpenAI(api_key="fake", base_url=fake.base_url, max_retries=0)
+        chroma = chromadb.EphemeralClient()
+
+        if not args.skip_sequential:
+            collection = chroma.get_or_create_collection("bench_sequencial")
+            antes = fake.total_requests()
+            stats = ingestao_sequencial(chunks, client, collection)
+            print("\n==== Sequencial (1 chunk por requisição) ====")
+            print(
+                f"   {stats['seconds']:.2f}s | {stats['chunks_per_second']:.1f} chunks/s | "
+                f"{fake.total_requests() - antes} requisições HTTP"
+            )
+
+        collection = chroma.get_or_create_collection("bench_lotes")
+        antes = fake.total_requests()
+        stats = executar_ingestao(
+            chunks,
+            client,
+            collection,
+            max_tokens=args.max_tokens,
+            concorrencia=args.concurrency,
+            espera_base=0.05,
+        )
+        print("\n==== Pipeline em lote ====")
+        imprimir_estatisticas(stats)
+        print(f"   {fake.total_requests() - antes} requisições HTTP no servidor falso")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Quanto do tráfego o roteador de intenções tira do LLM
+
+Passa um tráfego de exemplo pelo roteador: saudações, pedidos de ajuda e
+agradecimentos, os exemplos do comando 'ajuda' e as perguntas de referência
+de benchmarks/dados/perguntas_avaliacao.json. Mostra a fração respondida
+sem LLM (por regra e por centroide), os acertos por intenção e, para as
+perguntas de referência roteadas, se a resposta pronta contém o trecho
+esperado. Usa os embeddings falsos (sem rede) ou, com --openai, os reais.
+Execute a partir de chat/:
+
+    python -m benchmarks.bench_intencoes --threshold 0.8
+"""
+
+import argparse
+import statistics
+import time
+
+from benchmarks.avaliar_chunking import _normalizar, carregar_perguntas, funcao_embedding
+from intencoes import (
+    EXEMPLOS_PERGUNTAS,
+    INTENT_MARGIN,
+    INTENT_THRESHOLD,
+    IntentRouter,
+    intencoes_dos_documentos,
+    intencoes_fixas,
+)
+
+CONVERSA = [
+    "Oi", "Olá!", "bom dia", "Boa tarde, tudo bem?", "ajuda", "O que você pode fazer?",
+    "Obrigado!", "valeu", "Muito obrigada pela ajuda", "Quanto tempo leva para ver resultado?",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--threshold", type=float, default=INTENT_THRESHOLD)
+    parser.add_argument("--margin", type=float, default=INTENT_MARGIN)
+    parser.add_argument("--openai", action="store_true", help="usa embeddings reais (requer OPENAI_API_KEY)")
+    parser.add_argument("--verbose", action="store_true", help="mostra a intenção de cada mensagem")
+    args = parser.parse_args()
+
+    embed = funcao_embedding(args.openai)
+    router = IntentRouter(intencoes_fixas() + intencoes_dos_documentos(), args.threshold, args.margin)
+    perguntas = carregar_perguntas()
+    trafego = [(texto, None) for texto in CONVERSA]
+    trafego += [(texto, None) for _, exemplos in EXEMPLOS_PERGUNTAS for texto in exemplos]
+    trafego += [(p["question"], p["expected"]) for p in perguntas]
+    print(f"📋 {len(router.intencoes)} intenções, {len(trafego)} mensagens")
+
+    inicio = time.perf_counter()
+    router.centroides(embed)
+    print(f"Centroides: {(time.perf_counter() - inicio) * 1000:.1f} ms")
+
+    embeddings = embed([texto for texto, _ in trafego])
+    tempos, corretas, erradas = [], 0, 0
+    for (texto, esperado), embedding in zip(trafego, embeddings):
+        inicio = time.perf_counter()
+        intencao, via = router.por_regra(texto), "regra"
+        if intencao is None:
+            intencao, via = router.por_embedding(embedding, embed), "embedding"
+        tempos.append(time.perf_counter() - inicio)
+        router.registrar(intencao, via)
+        if intencao is not None and esperado is not None:
+            if _normalizar(esperado) in _normalizar(intencao.answer):
+                corretas += 1
+            else:
+                erradas += 1
+        if args.verbose:
+            destino = f"{intencao.name} ({via})" if intencao else "LLM"
+            print(f"   {texto!r} -> {destino}")
+
+    stats = router.stats()
+    print(
+        f"\nSem LLM: {stats['routed']}/{stats['requests']} ({stats['routed_rate']:.0%}) | "
+        f"regra {stats['by_rule']} | centroide {stats['by_embedding']}"
+    )
+    print(f"Perguntas de referência roteadas: {corretas} com o trecho esperado, {erradas} sem")
+    print(f"Classificação p50 {statistics.median(tempos) * 1e6:.1f} µs")
+    for name, hits in sorted(stats["hits"].items(), key=lambda item: -item[1]["hits"]):
+        print(f"   {name:<60} {hits['hits']:>3} ({hits['hit_rate']:.1%})")
+
+
+if __name__ == "__main__":
+    main()
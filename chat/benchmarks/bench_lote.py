@@ -0,0 +1,84 @@
+"""
+Perguntas de avaliação uma a uma x em lote (lote.py)
+
+Responde as perguntas de benchmarks/dados/perguntas_avaliacao.json (repetidas
+até --perguntas) contra o servidor falso da OpenAI, sem cache de respostas:
+primeiro em série, como hoje com uma chamada ao /chat por pergunta, depois
+com responder_lote. Mostra o tempo total, as requisições de embedding e a
+vazão. Execute a partir de chat/:
+
+    python -m benchmarks.bench_lote --perguntas 200 --concurrency 8
+"""
+
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+
+from benchmarks.ambiente_local import preparar_ambiente
+
+PERGUNTAS = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "dados", "perguntas_avaliacao.json"
+)
+
+
+def carregar_itens(total):
+    with open(PERGUNTAS, "r", encoding="utf-8") as file:
+        perguntas = [p["question"] for p in json.load(file)]
+    # Variações numeradas: o cache de embeddings não responde as repetições
+    return [
+        {"id": i, "question": f"{perguntas[i % len(perguntas)]} ({i // len(perguntas)})"}
+        for i in range(total)
+    ]
+
+
+def imprimir(nome, duracao, fake, total):
+    print(
+        f"{nome:<22} {duracao:6.2f}s | {total / duracao:6.1f} perguntas/s | "
+        f"{fake.total_requests('/v1/embeddings'):>4} embeddings | "
+        f"{fake.total_requests('/v1/chat/completions'):>4} completions"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--perguntas", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05, help="latência de cada chamada à OpenAI (s)")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fake = preparar_ambiente(tmp, latency=args.latency)
+        try:
+            import lote
+            from motor import MotorRAG
+
+            lote.BATCH_CONCURRENCY = max(lote.BATCH_CONCURRENCY, args.concurrency)
+            motor = MotorRAG(answer_cache=None, coalescer=None)
+            motor.retriever.count()
+
+            fake.reset_stats()
+            inicio = time.perf_counter()
+            for item in carregar_itens(args.perguntas):
+                motor.process_question(f"{item['question']} [serie]", history=[])
+            imprimir("uma a uma", time.perf_counter() - inicio, fake, args.perguntas)
+
+            fake.reset_stats()
+            inicio = time.perf_counter()
+            for resultado in lote.responder_lote(motor, carregar_itens(args.perguntas), args.concurrency):
+                pass
+            imprimir(f"lote ({args.concurrency} simultâneas)", time.perf_counter() - inicio, fake, args.perguntas)
+            tempos = resultado["timings_ms"]
+            print(
+                f"   embedding do lote {tempos['embedding']:.0f} ms | busca do lote "
+                f"{tempos['retrieval']:.1f} ms | origens {resultado['sources']}"
+            )
+        finally:
+            fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Micro-benchmarks das etapas locais do pipeline (sem rede)
+
+Mede, sobre os documentos de docs/ e as perguntas de referência, o custo
+de cada etapa que roda no próprio processo: chunking, índice BM25, busca
+vetorial em memória, busca híbrida, montagem do prompt, contagem de
+tokens e classificação de intenções. Os embeddings são os falsos
+determinísticos, calculados antes das medições. Execute a partir de chat/:
+
+    python -m benchmarks.bench_micro --repeat 200 --salvar
+"""
+
+import argparse
+import statistics
+import time
+
+from benchmarks.avaliar_chunking import carregar_perguntas
+from benchmarks.fake_openai import fake_embedding
+from benchmarks.resultados import salvar_resultado
+from busca_lexical import BM25Index
+from chunking import gerar_chunks
+from coalescencia import chave_pedido
+from contexto import montar_mensagens
+from intencoes import IntentRouter, intencoes_dos_documentos, intencoes_fixas
+from rag import carregar_documentos, directory_path
+from retriever import HybridRetriever, LocalRetriever
+from tokens import count_tokens
+
+HISTORICO = [
+    {"role": "user", "content": "Oi, quanto custa o curso?"},
+    {"role": "assistant", "content": "Olá! O curso 'Menos Café Mais Chá' sai por 12x de R$ 9,90. 🍃"},
+    {"role": "user", "content": "E se não funcionar comigo?"},
+    {"role": "assistant", "content": "Você tem 7 dias de garantia incondicional! 💚"},
+]
+
+
+def medir(funcao, entradas, repeat):
+    """Tempos (s) de funcao(entrada), passando pelas entradas em ciclo"""
+    tempos = []
+    for i in range(repeat):
+        entrada = entradas[i % len(entradas)]
+        inicio = time.perf_counter()
+        funcao(entrada)
+        tempos.append(time.perf_counter() - inicio)
+    return tempos
+
+
+def resumir(tempos):
+    ordenados = sorted(tempos)
+    return {
+        "p50_us": statistics.median(ordenados) * 1e6,
+        "p95_us": ordenados[int(len(ordenados) * 0.95) - 1] * 1e6,
+        "ops_s": len(ordenados) / sum(ordenados) if sum(ordenados) else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=200, help="execuções por etapa")
+    parser.add_argument("--salvar", action="store_true", help="grava o resultado em benchmarks/resultados/")
+    args = parser.parse_args()
+
+    documentos = carregar_documentos(directory_path)
+    chunks = gerar_chunks(documentos)
+    ids = [c["id"] for c in chunks]
+    textos = [c["text"] for c in chunks]
+    perguntas = [p["question"] for p in carregar_perguntas()]
+    embeddings = {pergunta: fake_embedding(pergunta) for pergunta in perguntas}
+
+    local = LocalRetriever(ids, textos, [fake_embedding(t) for t in textos])
+    bm25 = BM25Index(ids, textos)
+    hibrido = HybridRetriever(local, bm25, lexical_shortcut=False)
+    router = IntentRouter(intencoes_fixas() + intencoes_dos_documentos())
+    router.centroides(lambda lote: [fake_embedding(t) for t in lote])
+    resultados = {p: [r["text"] for r in local.query_by_embedding(embeddings[p])] for p in perguntas}
+    print(f"📋 {len(documentos)} documentos, {len(chunks)} chunks, {len(perguntas)} perguntas")
+
+    etapas = [
+        ("chunking", lambda _: gerar_chunks(documentos), [None], max(1, args.repeat // 20)),
+        ("bm25_index", lambda _: BM25Index(ids, textos), [None], max(1, args.repeat // 10)),
+        ("bm25_query", bm25.query, perguntas, args.repeat),
+        ("vector_query", lambda p: local.query_by_embedding(embeddings[p]), perguntas, args.repeat),
+        ("hybrid_search", lambda p: hibrido.search(p, embeddings.__getitem__), perguntas, args.repeat),
+        ("prompt_assembly", lambda p: montar_mensagens(p, resultados[p], HISTORICO), perguntas, args.repeat),
+        ("count_tokens", count_tokens, textos, args.repeat),
+        ("intent_rule", router.por_regra, perguntas, args.repeat),
+        ("intent_centroid", lambda p: router.por_embedding(embeddings[p], None), perguntas, args.repeat),
+        ("coalesce_key", lambda p: chave_pedido(p, HISTORICO), perguntas, args.repeat),
+    ]
+
+    metricas = {}
+    for nome, funcao, entradas, repeat in etapas:
+        metricas[nome] = resumir(medir(funcao, entradas, repeat))
+        print(
+            f"{nome:<16} p50 {metricas[nome]['p50_us']:10.1f} µs | "
+            f"p95 {metricas[nome]['p95_us']:10.1f} µs | {metricas[nome]['ops_s']:10.0f} ops/s"
+        )
+
+    if args.salvar:
+        salvar_resultado("bench_micro", {"repeat": args.repeat, "chunks": len(chunks)}, metricas)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Resiliência do chat contra falhas injetadas no servidor falso da OpenAI
+
+Roda o MotorRAG em threads (sem HTTP) em cenários de falha e mostra, para
+cada um, a latência, as respostas de erro que chegariam ao cliente, as
+chamadas feitas à OpenAI e os eventos das políticas (resiliencia.py):
+
+- normal: sem falhas
+- cauda: slow_rate das respostas demoram slow_latency; com e sem hedge
+- falhas: fail_rate das chamadas devolvem 503; os retries recuperam
+- queda: o modelo principal fica fora do ar; o circuito abre e o modelo
+  de reserva responde
+
+Execute a partir de chat/:
+
+    python -m benchmarks.bench_resiliencia --requests 200 --salvar
+"""
+
+import argparse
+import contextlib
+import io
+import logging
+import tempfile
+
+import resiliencia
+from benchmarks.ambiente_local import preparar_ambiente
+from benchmarks.bench_carga import executar, montar_perguntas, preparar_alvo
+from benchmarks.resultados import salvar_resultado
+
+MODELO_RESERVA = "modelo-reserva"
+EVENTOS = ("retries", "hedges", "hedge_wins", "timeouts", "budget_exhausted", "breaker_opened", "rejected", "fallbacks")
+
+
+def cenarios(args):
+    """(nome, atributos do servidor falso, hedge ligado?, modelo de reserva)"""
+    cauda = {"slow_rate": args.slow_rate, "slow_latency": args.slow_latency}
+    return [
+        ("normal", {}, True, ""),
+        ("cauda_sem_hedge", cauda, False, ""),
+        ("cauda_com_hedge", cauda, True, ""),
+        ("falhas", {"fail_rate": args.fail_rate, "fail_status": 503}, True, ""),
+        ("queda", {"fail_models": {resiliencia.LLM_MODEL}}, True, MODELO_RESERVA),
+    ]
+
+
+def injetar_falhas(fake, atributos):
+    """Configura as falhas do servidor falso (sem atributos: nenhuma falha)"""
+    fake.fail_rate, fake.fail_status, fake.slow_rate = 0.0, 500, 0.0
+    fake.fail_models = set()
+    for nome, valor in atributos.items():
+        setattr(fake, nome, valor)
+
+
+def recriar_politicas(hedge, reserva):
+    """Políticas novas (sem amostras, circuito fechado) para o cenário"""
+    resiliencia.descartar_politicas()
+    resiliencia.LLM_FALLBACK_MODEL = reserva
+    for nome in ("completion", "completion_fallback", "embedding"):
+        resiliencia.get_politica(nome).hedge = hedge
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=200, help="perguntas por cenário")
+    parser.add_argument("--warmup", type=int, default=40, help="perguntas antes da medição (amostras de latência)")
+    parser.add_argument("--latency", type=float, default=0.05, help="latência normal da OpenAI (s)")
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="fração de respostas lentas no cenário cauda")
+    parser.add_argument("--slow-latency", type=float, default=2.0, help="latência das respostas lentas (s)")
+    parser.add_argument("--fail-rate", type=float, default=0.2, help="fração de falhas no cenário falhas")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--salvar", action="store_true", help="grava o resultado em benchmarks/resultados/")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    resultados = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        fake = preparar_ambiente(tmp, latency=args.latency, jitter=args.jitter)
+        try:
+            chamar, _ = preparar_alvo("direto")
+            for rodada, (nome, atributos, hedge, reserva) in enumerate(cenarios(args)):
+                perguntas = montar_perguntas(args.warmup + args.requests, False, args.seed + rodada)
+                # Aquecimento sem falhas: as políticas aprendem a latência normal
+                injetar_falhas(fake, {})
+                recriar_politicas(hedge, reserva)
+                # Os prints do motor (buscas, fallbacks) não poluem o resultado
+                with contextlib.redirect_stdout(io.StringIO()):
+                    executar(chamar, perguntas[: args.warmup], args.concurrency)
+                    injetar_falhas(fake, atributos)
+                    fake.reset_stats()
+                    metricas = executar(chamar, perguntas[args.warmup:], args.concurrency)
+                stats = resiliencia.resilience_stats()
+                metricas["openai_completions"] = fake.total_requests("/v1/chat/completions")
+                metricas["openai_embeddings"] = fake.total_requests("/v1/embeddings")
+                for politica in ("completion", "completion_fallback", "embedding"):
+                    eventos = stats.get(politica, {})
+                    for evento in EVENTOS:
+                        if eventos.get(evento):
+                            metricas[f"{politica}_{evento}"] = eventos[evento]
+                resultados[nome] = metricas
+                eventos = {k: v for k, v in metricas.items() if k.startswith(("completion", "embedding"))}
+                print(
+                    f"{nome:<16} p50 {metricas['p50_ms']:6.0f} ms | p99 {metricas['p99_ms']:6.0f} ms | "
+                    f"máx {metricas['max_ms']:6.0f} ms | {metricas['errors']:>3} erros | "
+                    f"{metricas['openai_completions']:>4} completions | {eventos}"
+                )
+        finally:
+            fake.stop()
+
+    if args.salvar:
+        parametros = {k: v for k, v in vars(args).items() if k != "salvar"}
+        salvar_resultado("bench_resiliencia", parametros, resultados)
+
+
+if __name__ == "__main__":
+    main()
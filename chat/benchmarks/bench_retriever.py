@@ -0,0 +1,109 @@
+"""
+Compara o retriever local (NumPy em memória) com o Chroma
+
+Indexa os docs com embeddings falsos determinísticos em um Chroma em
+memória, exporta o snapshot (float32 e float16), e confere se os backends
+devolvem os mesmos chunks para as mesmas perguntas, medindo a latência de
+cada um e o tamanho e o tempo de abertura de cada snapshot.
+Execute a partir de chat/:
+
+    python -m benchmarks.bench_retriever --repeat 200
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import chromadb
+
+from benchmarks.fake_openai import fake_embedding
+from chunking import gerar_chunks
+from rag import carregar_documentos, directory_path
+from retriever import ChromaRetriever, LocalRetriever, exportar_snapshot
+
+PERGUNTAS = [
+    "E se não funcionar comigo?",
+    "Está muito caro para um curso online",
+    "Não tenho tempo para fazer o curso",
+    "Como funciona o método de 21 dias?",
+    "Quais são os benefícios do chá?",
+    "Como preparar o chá corretamente?",
+    "E se não chegar?",
+    "Como sei que é original?",
+    "Frete muito caro",
+    "Não tenho limite no cartão",
+    "A empresa é confiável?",
+]
+
+
+def montar_colecao():
+    """Cria uma coleção em memória com os chunks da pasta docs"""
+    chunks = gerar_chunks(carregar_documentos(directory_path))
+    collection = chromadb.EphemeralClient().get_or_create_collection("bench_retriever")
+    collection.upsert(
+        ids=[c["id"] for c in chunks],
+        documents=[c["text"] for c in chunks],
+        embeddings=[fake_embedding(c["text"]) for c in chunks],
+    )
+    return collection
+
+
+def medir(retriever, embeddings, n_results, repeat):
+    """Latências (s) de query_by_embedding sobre todas as perguntas"""
+    tempos = []
+    for _ in range(repeat):
+        for embedding in embeddings:
+            inicio = time.perf_counter()
+            retriever.query_by_embedding(embedding, n_results)
+            tempos.append(time.perf_counter() - inicio)
+    return tempos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument("-n", "--n-results", type=int, default=3)
+    args = parser.parse_args()
+
+    collection = montar_colecao()
+    chroma = ChromaRetriever(collection)
+    embeddings = [fake_embedding(pergunta) for pergunta in PERGUNTAS]
+    locais = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for dtype in ("float32", "float16"):
+            path = os.path.join(tmp, f"snapshot_{dtype}.snap")
+            exportar_snapshot(collection, path, dtype)
+            inicio = time.perf_counter()
+            local = LocalRetriever.from_snapshot(path)
+            abertura = time.perf_counter() - inicio
+            print(
+                f"📦 snapshot {dtype}: {os.path.getsize(path) / 1024:.0f} KiB, "
+                f"aberto em {abertura * 1000:.2f} ms"
+            )
+
+            divergencias = 0
+            for pergunta, embedding in zip(PERGUNTAS, embeddings):
+                ids_chroma = [r["id"] for r in chroma.query_by_embedding(embedding, args.n_results)]
+                ids_local = [r["id"] for r in local.query_by_embedding(embedding, args.n_results)]
+                if ids_chroma != ids_local:
+                    divergencias += 1
+                    print(f"⚠️ '{pergunta}': chroma={ids_chroma} local={ids_local}")
+            print(
+                f"{len(PERGUNTAS) - divergencias}/{len(PERGUNTAS)} perguntas com os mesmos "
+                f"chunks ({local.count()} chunks, top-{args.n_results})"
+            )
+            locais[f"local ({dtype})"] = local
+
+        for nome, retriever in (("chroma (em memória)", chroma), *locais.items()):
+            tempos = medir(retriever, embeddings, args.n_results, args.repeat)
+            tempos.sort()
+            print(
+                f"{nome:<20} p50 {statistics.median(tempos) * 1e6:8.1f} µs | "
+                f"p95 {tempos[int(len(tempos) * 0.95)] * 1e6:8.1f} µs"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Mede o custo de importar os módulos do chat em um processo novo
+
+É o que um worker do gunicorn paga ao subir. Execute a partir de chat/:
+
+    python -m benchmarks.bench_startup --repeat 5
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+SNIPPET = (
+    "import time; t = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - t)"
+)
+
+
+def medir_import(module, repeat):
+    """Tempo de import (s) de `module` em `repeat` processos novos"""
+    tempos = []
+    for _ in range(repeat):
+        saida = subprocess.run(
+            [sys.executable, "-c", SNIPPET.format(module=module)],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        tempos.append(float(saida.stdout.strip().splitlines()[-1]))
+    return tempos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("modules", nargs="*", default=["rag", "api_chat"])
+    args = parser.parse_args()
+
+    for module in args.modules:
+        tempos = medir_import(module, args.repeat)
+        print(
+            f"{module:<12} mediana {statistics.median(tempos) * 1000:.0f} ms | "
+            f"min {min(tempos) * 1000:.0f} ms | max {max(tempos) * 1000:.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Tempo até o primeiro token: /chat vs /chat/stream
+
+Sobe a API Flask contra o servidor falso da OpenAI (com latência por
+token) e compara quando o cliente recebe o primeiro texto em cada modo.
+O roteador de intenções e o cache de respostas ficam desligados: todas
+as perguntas passam pelo LLM.
+Execute a partir de chat/:
+
+    python -m benchmarks.bench_streaming --requests 10 --token-latency 0.02
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import statistics
+import tempfile
+import threading
+import time
+
+from benchmarks.ambiente_local import preparar_ambiente
+from cache import get_embedding_cache
+
+PERGUNTAS = [
+    "E se não funcionar comigo?",
+    "Como funciona o método de 21 dias?",
+    "Frete muito caro",
+    "Quais são os benefícios do chá?",
+    "Como sei que é original?",
+]
+
+
+def iniciar_api():
+    """Sobe o app Flask em uma thread e retorna (servidor, porta)"""
+    from werkzeug.serving import make_server
+
+    import api_chat
+    import api_comum
+
+    api_chat.init_chat_rag()
+    server = make_server("127.0.0.1", 0, api_chat.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.server_port, api_comum.API_KEY
+
+
+def requisitar(port, api_key, path, message):
+    """Retorna (segundos até o primeiro byte de texto, segundos até o fim)"""
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    inicio = time.perf_counter()
+    conn.request(
+        "POST",
+        path,
+        body=json.dumps({"message": message}),
+        headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+    )
+    response = conn.getresponse()
+    primeiro = None
+    if path.endswith("/stream"):
+        for line in response:
+            if primeiro is None and line.startswith(b"data:"):
+                primeiro = time.perf_counter() - inicio
+    else:
+        response.read()
+    total = time.perf_counter() - inicio
+    conn.close()
+    return (primeiro if primeiro is not None else total), total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.2, help="latência até o 1º token (s)")
+    parser.add_argument("--token-latency", type=float, default=0.02, help="tempo por token (s)")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fake = preparar_ambiente(
+            tmp, answer_cache=False, intent_router=False,
+            latency=args.latency, token_latency=args.token_latency,
+        )
+        server, port, api_key = iniciar_api()
+        try:
+            for path in ("/chat", "/chat/stream"):
+                # Cada modo começa sem embeddings em cache, para comparar igual
+                get_embedding_cache().clear()
+                ttft, totais = [], []
+                for i in range(args.requests):
+                    pergunta = PERGUNTAS[i % len(PERGUNTAS)]
+                    primeiro, total = requisitar(port, api_key, path, pergunta)
+                    ttft.append(primeiro)
+                    totais.append(total)
+                print(
+                    f"{path:<14} 1º token p50 {statistics.median(ttft) * 1000:7.1f} ms | "
+                    f"total p50 {statistics.median(totais) * 1000:7.1f} ms"
+                )
+        finally:
+            server.shutdown()
+            fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""
+Servidor local que imita a API HTTP do Chroma (v2) para benchmarks
+
+Atende o cliente oficial (chromadb.HttpClient ou o CloudClient com
+CHROMA_HOST apontando para cá) com coleções em memória: criação,
+add/upsert, get, count e query por embedding (distância L2 ao quadrado,
+como o Chroma), todos com latência e jitter configuráveis.
+
+    with FakeChromaServer(latency=0.03) as fake:
+        client = chromadb.HttpClient(host=fake.host, port=fake.port)
+"""
+
+import json
+import random
+import re
+import socket
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+PREFIXO = "/api/v2"
+ROTA_COLECOES = re.compile(
+    r"^/tenants/(?P<tenant>[^/]+)/databases/(?P<database>[^/]+)/collections"
+    r"(?:/(?P<colecao>[^/]+)(?:/(?P<acao>[^/]+))?)?$"
+)
+
+
+class _Colecao:
+    """Coleção em memória: ids, documentos, metadados e embeddings"""
+
+    def __init__(self, name, tenant, database, metadata=None, configuration=None):
+        self.id = str(uuid.uuid4())
+        self.name = name
+        self.tenant = tenant
+        self.database = database
+        self.metadata = metadata
+        self.configuration = configuration
+        self.ids = []
+        self.documents = []
+        self.metadatas = []
+        self.embeddings = []
+        self._indice = {}
+        self._matriz = None
+
+    def modelo(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "tenant": self.tenant,
+            "database": self.database,
+            "metadata": self.metadata,
+            "configuration_json": self.configuration,
+            "dimension": len(self.embeddings[0]) if self.embeddings else None,
+            "version": 0,
+            "log_position": 0,
+        }
+
+    def gravar(self, payload, sobrescrever=True):
+        documentos = payload.get("documents") or [None] * len(payload["ids"])
+        metadados = payload.get("metadatas") or [None] * len(payload["ids"])
+        for chunk_id, embedding, documento, metadado in zip(
+            payload["ids"], payload["embeddings"], documentos, metadados
+        ):
+            posicao = self._indice.get(chunk_id)
+            if posicao is None:
+                self._indice[chunk_id] = len(self.ids)
+                self.ids.append(chunk_id)
+                self.documents.append(documento)
+                self.metadatas.append(metadado)
+                self.embeddings.append(embedding)
+            elif sobrescrever:
+                self.documents[posicao] = documento
+                self.metadatas[posicao] = metadado
+                self.embeddings[posicao] = embedding
+        self._matriz = None
+
+    def matriz(self):
+        if self._matriz is None:
+            self._matriz = np.asarray(self.embeddings, dtype=np.float32)
+        return self._matriz
+
+    def _campos(self, posicoes, include):
+        resultado = {"ids": [self.ids[i] for i in posicoes]}
+        for campo, valores in (
+            ("documents", self.documents),
+            ("metadatas", self.metadatas),
+            ("embeddings", self.embeddings),
+        ):
+            resultado[campo] = [valores[i] for i in posicoes] if campo in include else None
+        return resultado
+
+    def get(self, payload):
+        posicoes = range(len(self.ids))
+        if payload.get("ids"):
+            posicoes = [self._indice[i] for i in payload["ids"] if i in self._indice]
+        posicoes = list(posicoes)[payload.get("offset") or 0:]
+        if payload.get("limit") is not None:
+            posicoes = posicoes[: payload["limit"]]
+        resultado = self._campos(posicoes, payload.get("include") or [])
+        resultado["include"] = payload.get("include") or []
+        return resultado
+
+    def query(self, payload):
+        include = payload.get("include") or []
+        resposta = {campo: [] for campo in ("ids", "documents", "metadatas", "embeddings", "distances")}
+        for embedding in payload["query_embeddings"]:
+            posicoes, distancias = [], []
+            if self.ids:
+                query = np.asarray(embedding, dtype=np.float32)
+                distancia = ((self.matriz() - query) ** 2).sum(axis=1)
+                k = min(payload.get("n_results", 10), len(self.ids))
+                posicoes = np.argsort(distancia)[:k].tolist()
+                distancias = [float(distancia[i]) for i in posicoes]
+            campos = self._campos(posicoes, include)
+            for campo in ("ids", "documents", "metadatas", "embeddings"):
+                resposta[campo].append(campos[campo])
+            resposta["distances"].append(distancias if "distances" in include else None)
+        for campo in ("documents", "metadatas", "embeddings", "distances"):
+            if campo not in include:
+                resposta[campo] = None
+        resposta["include"] = include
+        return resposta
+
+
+class FakeChromaServer:
+    """Servidor HTTP em thread separada com coleções em memória e contadores"""
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        latency=0.02,
+        jitter=0.0,
+        fail_rate=0.0,
+        tenant="default_tenant",
+        database="default_database",
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        # Tenant e database informados ao cliente autenticado (CloudClient)
+        self.tenant = tenant
+        self.database = database
+        self.colecoes = {}
+        self.requests = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def host(self):
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def total_requests(self, operacao=None):
+        with self._lock:
+            if operacao is None:
+                return sum(self.requests.values())
+            return self.requests.get(operacao, 0)
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests = {}
+            self.max_in_flight = self.in_flight
+
+    def _registrar(self, operacao):
+        with self._lock:
+            self.requests[operacao] = self.requests.get(operacao, 0) + 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def _finalizar(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _esperar(self):
+        atraso = self.latency + random.uniform(-self.jitter, self.jitter)
+        if atraso > 0:
+            time.sleep(atraso)
+
+    def _colecao(self, tenant, database, chave):
+        """Coleção pelo nome ou pelo id (o cliente usa os dois)"""
+        with self._lock:
+            colecao = self.colecoes.get((tenant, database, chave))
+            if colecao is None:
+                colecao = next((c for c in self.colecoes.values() if c.id == chave), None)
+        return colecao
+
+    def _criar(self, tenant, database, payload):
+        chave = (tenant, database, payload["name"])
+        with self._lock:
+            colecao = self.colecoes.get(chave)
+            if colecao is not None and not payload.get("get_or_create"):
+                return 409, {"error": "UniqueConstraintError", "message": f"Collection {payload['name']} already exists"}
+            if colecao is None:
+                colecao = self.colecoes[chave] = _Colecao(
+                    payload["name"], tenant, database, payload.get("metadata"), payload.get("configuration")
+                )
+        return 200, colecao.modelo()
+
+    def atender(self, metodo, path, payload):
+        """Retorna (status, corpo JSON) para uma requisição da API v2"""
+        if path == "/heartbeat":
+            return 200, {"nanosecond heartbeat": time.time_ns()}
+        if path == "/version":
+            return 200, "1.0.0"
+        if path == "/pre-flight-checks":
+            return 200, {"max_batch_size": 5461, "supports_base64_encoding": False}
+        if path == "/auth/identity":
+            return 200, {"user_id": "fake", "tenant": self.tenant, "databases": [self.database]}
+        partes = path.strip("/").split("/")
+        if partes[0] == "tenants" and len(partes) == 2:
+            return 200, {"name": partes[1]}
+        if partes[0] == "tenants" and len(partes) == 4 and partes[2] == "databases":
+            return 200, {"id": str(uuid.uuid5(uuid.NAMESPACE_DNS, path)), "name": partes[3], "tenant": partes[1]}
+
+        rota = ROTA_COLECOES.match(path)
+        if rota is None:
+            return 404, {"error": "NotFoundError", "message": f"Rota desconhecida: {path}"}
+        tenant, database = rota["tenant"], rota["database"]
+        if rota["colecao"] is None:
+            if metodo == "POST":
+                return self._criar(tenant, database, payload)
+            with self._lock:
+                return 200, [c.modelo() for c in self.colecoes.values()]
+
+        colecao = self._colecao(tenant, database, rota["colecao"])
+        if colecao is None:
+            return 404, {"error": "NotFoundError", "message": f"Collection {rota['colecao']} does not exist."}
+        acao = rota["acao"]
+        if acao is None:
+            return 200, colecao.modelo()
+        if acao == "count":
+            return 200, len(colecao.ids)
+        if acao in ("add", "upsert"):
+            with self._lock:
+                colecao.gravar(payload, sobrescrever=acao == "upsert")
+            return 200, {}
+        if acao == "get":
+            return 200, colecao.get(payload)
+        if acao == "query":
+            return 200, colecao.query(payload)
+        return 404, {"error": "NotFoundError", "message": f"Operação não suportada: {acao}"}
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def _responder(self, status, corpo):
+                dados = json.dumps(corpo).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(dados)))
+                self.end_headers()
+                self.wfile.write(dados)
+
+            def _atender(self, metodo):
+                tamanho = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(tamanho) or b"{}")
+                path = self.path.split("?")[0]
+                if path.startswith(PREFIXO):
+                    path = path[len(PREFIXO):]
+                operacao = path.rstrip("/").rsplit("/", 1)[-1]
+                fake._registrar(operacao)
+                try:
+                    fake._esperar()
+                    if fake.fail_rate > 0 and random.random() < fake.fail_rate:
+                        self._responder(500, {"error": "InternalError", "message": "falha injetada"})
+                        return
+                    self._responder(*fake.atender(metodo, path, payload))
+                finally:
+                    fake._finalizar()
+
+            def do_GET(self):
+                self._atender("GET")
+
+            def do_POST(self):
+                self._atender("POST")
+
+            def do_DELETE(self):
+                self._atender("DELETE")
+
+        return Handler
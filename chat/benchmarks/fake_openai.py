@@ -0,0 +1,292 @@
+"""
+Servidor local que imita a API da OpenAI para benchmarks
+
+Responde em /v1/embeddings com vetores determinísticos (bag-of-words com
+hashing, então textos parecidos ficam próximos) e em /v1/chat/completions
+com um texto derivado da pergunta (também em streaming SSE, token a token),
+todos com latência configurável. Para testar a resiliência injeta falhas:
+erros HTTP (fail_rate, fail_status), respostas lentas na cauda (slow_rate,
+slow_latency) e modelos fora do ar (fail_models).
+Use `base_url` com o cliente oficial: OpenAI(api_key="fake", base_url=...).
+"""
+
+import base64
+import hashlib
+import json
+import math
+import random
+import re
+import socket
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DIMENSOES = 1536
+
+
+def _normalizar_palavras(texto):
+    """Minúsculas, sem acentos, apenas palavras"""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return re.findall(r"\w+", texto)
+
+
+def fake_embedding(texto, dimensoes=DIMENSOES):
+    """Embedding determinístico por hashing das palavras, normalizado"""
+    vetor = [0.0] * dimensoes
+    for palavra in _normalizar_palavras(texto):
+        digest = hashlib.md5(palavra.encode("utf-8")).digest()
+        posicao = int.from_bytes(digest[:4], "little") % dimensoes
+        sinal = 1.0 if digest[4] & 1 else -1.0
+        vetor[posicao] += sinal
+    norma = math.sqrt(sum(v * v for v in vetor)) or 1.0
+    return [v / norma for v in vetor]
+
+
+class FakeOpenAIServer:
+    """Servidor HTTP em thread separada com contadores de requisições"""
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        latency=0.05,
+        jitter=0.0,
+        fail_rate=0.0,
+        dimensoes=DIMENSOES,
+        token_latency=0.0,
+        fail_status=500,
+        slow_rate=0.0,
+        slow_latency=5.0,
+        fail_models=(),
+    ):
+        self.latency = latency
+        # Tempo de geração por token do chat (simula um LLM emitindo tokens)
+        self.token_latency = token_latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        # Fração das requisições que demoram slow_latency (cauda de latência)
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        # Modelos que sempre falham (ex.: simular o modelo principal fora do ar)
+        self.fail_models = set(fail_models)
+        self.dimensoes = dimensoes
+        self.requests = {}
+        # Requisições sendo atendidas agora e o pico observado
+        self.in_flight = 0
+        self.max_in_flight = 0
+        # Conexões TCP aceitas (com keep-alive, bem menos que requisições)
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._server.handle_error = self._erro_conexao
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def total_requests(self, path=None):
+        with self._lock:
+            if path is None:
+                return sum(self.requests.values())
+            return self.requests.get(path, 0)
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests = {}
+            self.max_in_flight = self.in_flight
+            self.connections = 0
+
+    def _erro_conexao(self, request, client_address):
+        # O cliente desiste de respostas lentas (timeout, hedge): conexão fechada
+        # no meio da resposta é esperada e não precisa de traceback
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            ThreadingHTTPServer.handle_error(self._server, request, client_address)
+
+    def _registrar(self, path):
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def _finalizar(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _esperar(self):
+        atraso = self.latency + random.uniform(-self.jitter, self.jitter)
+        if self.slow_rate > 0 and random.random() < self.slow_rate:
+            atraso = self.slow_latency
+        if atraso > 0:
+            time.sleep(atraso)
+
+    def _deve_falhar(self, payload):
+        if payload.get("model") in self.fail_models:
+            return True
+        return self.fail_rate > 0 and random.random() < self.fail_rate
+
+    def _embeddings(self, payload):
+        entradas = payload.get("input", [])
+        if isinstance(entradas, str):
+            entradas = [entradas]
+        formato = payload.get("encoding_format", "float")
+        data = []
+        for indice, texto in enumerate(entradas):
+            vetor = fake_embedding(texto, self.dimensoes)
+            if formato == "base64":
+                vetor = base64.b64encode(array("f", vetor).tobytes()).decode("ascii")
+            data.append({"object": "embedding", "index": indice, "embedding": vetor})
+        tokens = sum(len(_normalizar_palavras(t)) for t in entradas)
+        return {
+            "object": "list",
+            "data": data,
+            "model": payload.get("model", "text-embedding-3-small"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    def _resposta_chat(self, payload):
+        """Texto determinístico a partir da última mensagem do usuário"""
+        pergunta = next(
+            (m["content"] for m in reversed(payload.get("messages", [])) if m["role"] == "user"),
+            "",
+        )
+        return f"Resposta simulada para: {pergunta}"
+
+    def _chat_completion(self, payload):
+        texto = self._resposta_chat(payload)
+        prompt_tokens = sum(
+            len(_normalizar_palavras(m.get("content") or "")) for m in payload.get("messages", [])
+        )
+        completion_tokens = len(_normalizar_palavras(texto))
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "gpt-4o-mini"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": texto},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def _tokens_chat(self, payload):
+        """Divide a resposta em tokens (palavras com o espaço seguinte)"""
+        return re.findall(r"\S+\s*", self._resposta_chat(payload))
+
+    def _chat_chunk(self, payload, delta=None, finish_reason=None):
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": payload.get("model", "gpt-4o-mini"),
+            "choices": [
+                {
+                    "index": 0,
+                    "delta": {} if delta is None else {"role": "assistant", "content": delta},
+                    "finish_reason": finish_reason,
+                }
+            ],
+        }
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                # Cabeçalhos e corpo saem em escritas separadas: sem TCP_NODELAY,
+                # Nagle + ACK atrasado somam ~40 ms por resposta com keep-alive
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with fake._lock:
+                    fake.connections += 1
+
+            def _responder(self, status, corpo):
+                dados = json.dumps(corpo).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(dados)))
+                self.end_headers()
+                self.wfile.write(dados)
+
+            def _responder_stream(self, payload):
+                """Chat em streaming (SSE), um token por evento"""
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                for token in fake._tokens_chat(payload):
+                    if fake.token_latency:
+                        time.sleep(fake.token_latency)
+                    evento = json.dumps(fake._chat_chunk(payload, token))
+                    self.wfile.write(f"data: {evento}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                evento = json.dumps(fake._chat_chunk(payload, finish_reason="stop"))
+                self.wfile.write(f"data: {evento}\n\ndata: [DONE]\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            def do_POST(self):
+                tamanho = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(tamanho) or b"{}")
+                path = self.path.split("?")[0]
+                fake._registrar(path)
+                try:
+                    self._atender(path, payload)
+                finally:
+                    fake._finalizar()
+
+            def _atender(self, path, payload):
+                fake._esperar()
+
+                if fake._deve_falhar(payload):
+                    self._responder(fake.fail_status, {"error": {"message": "falha injetada"}})
+                    return
+
+                if path.endswith("/embeddings"):
+                    self._responder(200, fake._embeddings(payload))
+                elif path.endswith("/chat/completions") and payload.get("stream"):
+                    self._responder_stream(payload)
+                elif path.endswith("/chat/completions"):
+                    tokens = fake._tokens_chat(payload)
+                    if fake.token_latency:
+                        time.sleep(fake.token_latency * len(tokens))
+                    self._responder(200, fake._chat_completion(payload))
+                else:
+                    self._responder(404, {"error": {"message": f"rota {path} não simulada"}})
+
+        return Handler
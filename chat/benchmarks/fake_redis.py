@@ -0,0 +1,176 @@
+"""
+Servidor local que fala o protocolo do Redis (RESP) para testes e benchmarks
+
+Implementa só os comandos usados por RedisSessionStore e pelo registro de
+jobs da indexação (listas, GET/SET EX, EXPIRE, DEL e transações
+MULTI/EXEC), com os dados em memória. Use com o cliente
+oficial: redis.Redis(host=..., port=...) ou SESSION_REDIS_URL=server.url.
+"""
+
+import socketserver
+import threading
+import time
+
+
+class _Erro(Exception):
+    pass
+
+
+class FakeRedisServer:
+    """Servidor RESP em thread separada com contador de comandos"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        self.latency = latency
+        self.commands = 0
+        self._data = {}  # chave -> lista de bytes (ou bytes, com SET)
+        self._expires = {}  # chave -> instante de expiração (time.monotonic)
+        self._lock = threading.RLock()
+        self._server = socketserver.ThreadingTCPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _lista(self, chave):
+        expira = self._expires.get(chave)
+        if expira is not None and time.monotonic() >= expira:
+            self._data.pop(chave, None)
+            self._expires.pop(chave, None)
+        return self._data.get(chave)
+
+    def executar(self, args):
+        """Executa um comando (lista de bytes) e retorna a resposta"""
+        comando = args[0].decode().upper()
+        with self._lock:
+            self.commands += 1
+            if comando == "PING":
+                return "PONG"
+            if comando in ("CLIENT", "SELECT"):
+                return "OK"
+            if comando == "RPUSH":
+                lista = self._lista(args[1])
+                if lista is None:
+                    lista = self._data[args[1]] = []
+                lista.extend(args[2:])
+                return len(lista)
+            if comando == "LRANGE":
+                lista = self._lista(args[1]) or []
+                inicio, fim = int(args[2]), int(args[3])
+                fim = len(lista) if fim == -1 else fim + 1
+                return lista[inicio:fim]
+            if comando == "LTRIM":
+                lista = self._lista(args[1])
+                if lista is not None:
+                    inicio, fim = int(args[2]), int(args[3])
+                    inicio = max(len(lista) + inicio, 0) if inicio < 0 else inicio
+                    fim = len(lista) + fim if fim < 0 else fim
+                    lista[:] = lista[inicio:fim + 1]
+                return "OK"
+            if comando == "SET":
+                self._data[args[1]] = args[2]
+                self._expires.pop(args[1], None)
+                if len(args) >= 5 and args[3].decode().upper() == "EX":
+                    self._expires[args[1]] = time.monotonic() + int(args[4])
+                return "OK"
+            if comando == "GET":
+                return self._lista(args[1])
+            if comando == "EXPIRE":
+                if self._lista(args[1]) is None:
+                    return 0
+                self._expires[args[1]] = time.monotonic() + int(args[2])
+                return 1
+            if comando == "DEL":
+                removidas = 0
+                for chave in args[1:]:
+                    removidas += self._lista(chave) is not None
+                    self._data.pop(chave, None)
+                    self._expires.pop(chave, None)
+                return removidas
+        raise _Erro(f"ERR unknown command '{comando}'")
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def _ler_comando(self):
+                linha = self.rfile.readline()
+                if not linha:
+                    return None
+                args = []
+                for _ in range(int(linha[1:])):
+                    tamanho = int(self.rfile.readline()[1:])
+                    args.append(self.rfile.read(tamanho + 2)[:-2])
+                return args
+
+            def _codificar(self, valor):
+                if valor is None:
+                    return b"_\r\n"  # nulo do RESP3
+                if isinstance(valor, _Erro):
+                    return f"-{valor}\r\n".encode()
+                if isinstance(valor, str):
+                    return f"+{valor}\r\n".encode()
+                if isinstance(valor, int):
+                    return f":{valor}\r\n".encode()
+                if isinstance(valor, bytes):
+                    return b"$%d\r\n%s\r\n" % (len(valor), valor)
+                if isinstance(valor, dict):
+                    # Mapa do RESP3 (resposta do HELLO)
+                    return b"%%%d\r\n" % len(valor) + b"".join(
+                        self._codificar(k.encode()) + self._codificar(v)
+                        for k, v in valor.items()
+                    )
+                return b"*%d\r\n" % len(valor) + b"".join(self._codificar(v) for v in valor)
+
+            def _executar(self, args):
+                try:
+                    return fake.executar(args)
+                except _Erro as e:
+                    return e
+
+            def handle(self):
+                fila = None  # comandos enfileirados entre MULTI e EXEC
+                while True:
+                    args = self._ler_comando()
+                    if args is None:
+                        return
+                    if fake.latency:
+                        time.sleep(fake.latency)
+                    comando = args[0].decode().upper()
+                    if comando == "HELLO":
+                        # Negociação do protocolo (redis-py pede RESP3)
+                        resposta = {"server": "redis", "proto": int(args[1]) if len(args) > 1 else 2}
+                        if resposta["proto"] == 2:
+                            resposta = [x for k, v in resposta.items() for x in (k.encode(), v)]
+                    elif comando == "MULTI":
+                        fila, resposta = [], "OK"
+                    elif comando == "EXEC":
+                        # Executa a transação inteira sob o lock (atômica)
+                        with fake._lock:
+                            resposta = [self._executar(a) for a in fila or []]
+                        fila = None
+                    elif fila is not None:
+                        fila.append(args)
+                        resposta = "QUEUED"
+                    else:
+                        resposta = self._executar(args)
+                    self.wfile.write(self._codificar(resposta))
+
+        return Handler
@@ -0,0 +1,122 @@
+"""
+Resultados dos benchmarks salvos em JSON para comparar execuções
+
+Os benchmarks com --salvar gravam em benchmarks/resultados/ um arquivo por
+execução com os parâmetros, o commit, a versão do Python e as métricas.
+Para comparar duas execuções (métrica a métrica, com a variação em %),
+execute a partir de chat/:
+
+    python -m benchmarks.resultados antes.json depois.json
+    python -m benchmarks.resultados --ultimos bench_carga
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import time
+
+RESULTADOS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resultados")
+
+
+def _commit():
+    try:
+        saida = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(RESULTADOS_DIR),
+        )
+        return saida.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def salvar_resultado(bench, parametros, metricas, pasta=RESULTADOS_DIR):
+    """
+    Grava a execução em <pasta>/<bench>-<data>.json e retorna o caminho
+
+    metricas: dicionário {nome: valor} ou {grupo: {nome: valor}}.
+    """
+    os.makedirs(pasta, exist_ok=True)
+    agora = time.strftime("%Y%m%d-%H%M%S")
+    caminho = os.path.join(pasta, f"{bench}-{agora}.json")
+    sufixo = 1
+    while os.path.exists(caminho):
+        sufixo += 1
+        caminho = os.path.join(pasta, f"{bench}-{agora}-{sufixo}.json")
+    with open(caminho, "w", encoding="utf-8") as file:
+        json.dump(
+            {
+                "bench": bench,
+                "timestamp": agora,
+                "commit": _commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "params": parametros,
+                "results": metricas,
+            },
+            file,
+            ensure_ascii=False,
+            indent=2,
+        )
+    print(f"💾 Resultado salvo em {caminho}")
+    return caminho
+
+
+def carregar_resultado(caminho):
+    with open(caminho, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def _achatar(metricas, prefixo=""):
+    """{grupo: {nome: valor}} -> {"grupo.nome": valor}, só valores numéricos"""
+    planas = {}
+    for nome, valor in metricas.items():
+        chave = f"{prefixo}{nome}"
+        if isinstance(valor, dict):
+            planas.update(_achatar(valor, chave + "."))
+        elif isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            planas[chave] = valor
+    return planas
+
+
+def comparar(antes, depois):
+    """Linhas (métrica, antes, depois, variação %) das métricas em comum"""
+    a, b = _achatar(antes["results"]), _achatar(depois["results"])
+    linhas = []
+    for chave in sorted(a.keys() & b.keys()):
+        variacao = (b[chave] - a[chave]) / a[chave] * 100 if a[chave] else None
+        linhas.append((chave, a[chave], b[chave], variacao))
+    return linhas
+
+
+def ultimos(bench, pasta=RESULTADOS_DIR, n=2):
+    """Os n resultados mais recentes de um benchmark (mais antigo primeiro)"""
+    return sorted(glob.glob(os.path.join(pasta, f"{bench}-*.json")), key=os.path.getmtime)[-n:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("arquivos", nargs="*", help="dois resultados: antes e depois")
+    parser.add_argument("--ultimos", metavar="BENCH", help="compara as duas últimas execuções do benchmark")
+    args = parser.parse_args()
+
+    arquivos = ultimos(args.ultimos) if args.ultimos else args.arquivos
+    if len(arquivos) != 2:
+        parser.error("informe dois arquivos de resultado (ou --ultimos com duas execuções salvas)")
+
+    antes, depois = (carregar_resultado(caminho) for caminho in arquivos)
+    print(f"antes:  {arquivos[0]} (commit {antes.get('commit')})")
+    print(f"depois: {arquivos[1]} (commit {depois.get('commit')})")
+    if antes.get("params") != depois.get("params"):
+        print("⚠️  Parâmetros diferentes entre as execuções")
+    for chave, a, b, variacao in comparar(antes, depois):
+        texto = f"{variacao:+7.1f}%" if variacao is not None else "      -"
+        print(f"   {chave:<40} {a:>12.4g} {b:>12.4g} {texto}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Índice BM25 em memória sobre os chunks da base de conhecimento
+
+Perguntas de clientes costumam trazer termos exatos ("frete", "boleto",
+"21 dias", "cartão") que a busca por embeddings às vezes troca por uma
+seção parecida. O índice invertido pontua os chunks por BM25 com uma
+tokenização para português sem acentos, sem stopwords e com os plurais
+mais comuns reduzidos ao singular ("cartões" -> "cartao").
+
+As contribuições de cada termo são pré-calculadas por chunk, então uma
+consulta é só a soma de alguns vetores esparsos.
+"""
+
+import math
+import re
+import unicodedata
+from collections import Counter
+from collections.abc import Sequence
+
+import numpy as np
+
+STOPWORDS = set(
+    """
+    a ao aos as com como da das de do dos e ela elas ele eles em entre era essa
+    esse esta este eu foi ha isso isto ja la lhe mais mas me meu minha muito na
+    nas nem no nos nossa nosso num numa o os ou para pela pelas pelo pelos por
+    qual quando que quem se sem ser seu sua so sao tambem te tem tenho ter um
+    uma voce voces vou vai
+    """.split()
+)
+
+
+def sem_acentos(texto):
+    texto = unicodedata.normalize("NFKD", texto.casefold())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+
+def _singular(termo):
+    """Reduz os plurais mais comuns do português (já sem acentos)"""
+    if len(termo) <= 3 or termo.isdigit():
+        return termo
+    for sufixo, troca in (("oes", "ao"), ("aes", "ao"), ("ais", "al"), ("eis", "el"),
+                          ("ns", "m"), ("res", "r"), ("zes", "z")):
+        if termo.endswith(sufixo):
+            return termo[: -len(sufixo)] + troca
+    if termo.endswith("s") and not termo.endswith(("ss", "us", "is")):
+        return termo[:-1]
+    return termo
+
+
+def tokenizar(texto):
+    """Termos do texto: minúsculos, sem acentos, sem stopwords, no singular"""
+    return [
+        _singular(termo)
+        for termo in re.findall(r"[^\W_]+", sem_acentos(texto))
+        if termo not in STOPWORDS
+    ]
+
+
+class BM25Index:
+    """Índice invertido com pontuação BM25"""
+
+    def __init__(self, ids, documents, k1=1.5, b=0.75):
+        self.ids = ids if isinstance(ids, list) else list(ids)
+        # Do snapshot os textos vêm como uma sequência lida sob demanda: o
+        # índice guarda a referência e lê cada texto pela posição, sem copiar
+        # o arquivo mapeado para o heap
+        self.documents = documents if isinstance(documents, Sequence) else list(documents)
+        self.k1 = k1
+        self.b = b
+        n_docs = len(self.documents)
+        tamanhos = np.zeros(n_docs, dtype=np.float32)
+        postings = {}
+        for indice in range(n_docs):
+            contagem = Counter(tokenizar(self.documents[indice]))
+            tamanhos[indice] = sum(contagem.values())
+            for termo, tf in contagem.items():
+                postings.setdefault(termo, []).append((indice, tf))
+        media = float(tamanhos.mean()) if n_docs and tamanhos.mean() > 0 else 1.0
+
+        # termo -> (índices dos chunks, peso BM25 do termo em cada chunk)
+        self._postings = {}
+        for termo, lista in postings.items():
+            indices = np.array([i for i, _ in lista], dtype=np.int64)
+            tf = np.array([t for _, t in lista], dtype=np.float32)
+            idf = math.log(1 + (n_docs - len(lista) + 0.5) / (len(lista) + 0.5))
+            norma = k1 * (1 - b + b * tamanhos[indices] / media)
+            self._postings[termo] = (indices, idf * tf * (k1 + 1) / (tf + norma))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def scores(self, question):
+        """Pontuação BM25 de todos os chunks e os termos da pergunta encontrados"""
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        encontrados = []
+        for termo in dict.fromkeys(tokenizar(question)):
+            posting = self._postings.get(termo)
+            if posting is not None:
+                indices, pesos = posting
+                scores[indices] += pesos
+                encontrados.append(termo)
+        return scores, encontrados
+
+    def query(self, question, n_results=3):
+        """Top-k por BM25 como [{"id", "text", "score"}] (só chunks com pontuação)"""
+        scores, _ = self.scores(question)
+        return self._resultados(scores, self._top(scores, n_results))
+
+    def _top(self, scores, n_results):
+        candidatos = np.flatnonzero(scores > 0)
+        k = min(n_results, len(candidatos))
+        return candidatos[np.argsort(-scores[candidatos], kind="stable")[:k]]
+
+    def _resultados(self, scores, indices):
+        return [
+            {"id": self.ids[i], "text": self.documents[i], "score": float(scores[i])}
+            for i in indices
+        ]
+
+    def exact_match(self, question, n_results=3, max_terms=3, margin=1.5):
+        """
+        Resultados por BM25 quando a pergunta é claramente uma busca por palavra-chave
+
+        Vale para perguntas curtas (até max_terms termos) cujos termos aparecem
+        todos no melhor chunk, com pontuação pelo menos `margin` vezes a do
+        segundo. Caso contrário retorna None e a busca segue para os embeddings.
+        """
+        termos = list(dict.fromkeys(tokenizar(question)))
+        if not termos or len(termos) > max_terms:
+            return None
+        scores, encontrados = self.scores(question)
+        if len(encontrados) < len(termos):
+            return None
+        top = self._top(scores, max(n_results, 2))
+        if not len(top):
+            return None
+        melhor = top[0]
+        if not all(melhor in self._postings[termo][0] for termo in termos):
+            return None
+        if len(top) > 1 and scores[melhor] < margin * scores[top[1]]:
+            return None
+        return self._resultados(scores, top[:n_results])
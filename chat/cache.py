@@ -0,0 +1,355 @@
+"""
+Caches de embeddings de perguntas e de respostas
+
+As mesmas objeções chegam o tempo todo ("Frete muito caro", "E se não
+chegar?"), então o embedding da pergunta é guardado em um cache LRU com TTL
+opcional, chaveado pelo texto normalizado e pelo nome do modelo. Há também
+uma camada opcional em disco (SQLite) que sobrevive a reinícios.
+
+O cache é único no processo (get_embedding_cache) e compartilhado por
+ChatRAG, ChatRAGWeb e rag.py. O cache semântico de respostas
+(get_answer_cache) serve as objeções frequentes sem chamar o LLM.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", "0")) or None
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH") or None
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "0")) or None
+# Similaridade mínima para servir uma resposta em cache quando o LLM falha
+ANSWER_FALLBACK_THRESHOLD = float(os.getenv("ANSWER_FALLBACK_THRESHOLD", "0.85"))
+
+
+def normalizar_pergunta(text):
+    """Normaliza a pergunta para uso como chave (caixa, espaços e pontuação final)"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.strip(" ?!.,;:\"'")
+
+
+class LRUCache:
+    """Dicionário LRU com limite de itens, TTL opcional e contadores"""
+
+    def __init__(self, max_entries=1024, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, created = item
+                if self.ttl is None or time.monotonic() - created < self.ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class DiskEmbeddingStore:
+    """Camada em disco: SQLite com os vetores em float32"""
+
+    def __init__(self, path, ttl=None):
+        self.ttl = ttl
+        self.hits = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings "
+            "(key TEXT PRIMARY KEY, vector BLOB NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT vector, created FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        vector, created = row
+        if self.ttl is not None and time.time() - created >= self.ttl:
+            return None
+        self.hits += 1
+        return np.frombuffer(vector, dtype=np.float32)
+
+    def put(self, key, embedding):
+        vector = np.asarray(embedding, dtype=np.float32).tobytes()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, vector, created) VALUES (?, ?, ?)",
+                (key, vector, time.time()),
+            )
+            self._conn.commit()
+
+
+class EmbeddingCache:
+    """Cache de embeddings em memória (LRU/TTL) com camada opcional em disco"""
+
+    def __init__(self, max_entries=EMBEDDING_CACHE_SIZE, ttl=EMBEDDING_CACHE_TTL, disk_path=None):
+        self.memory = LRUCache(max_entries, ttl)
+        self.disk = DiskEmbeddingStore(disk_path, ttl) if disk_path else None
+
+    @staticmethod
+    def chave(text, model_name):
+        normalizado = normalizar_pergunta(text)
+        return hashlib.sha256(f"{model_name}\x00{normalizado}".encode("utf-8")).hexdigest()
+
+    def get(self, text, model_name):
+        key = self.chave(text, model_name)
+        embedding = self.memory.get(key)
+        if embedding is None and self.disk is not None:
+            embedding = self.disk.get(key)
+            if embedding is not None:
+                self.memory.put(key, embedding)
+        return embedding
+
+    def put(self, text, model_name, embedding):
+        key = self.chave(text, model_name)
+        embedding = np.asarray(embedding, dtype=np.float32)
+        self.memory.put(key, embedding)
+        if self.disk is not None:
+            self.disk.put(key, embedding)
+
+    def clear(self):
+        self.memory.clear()
+
+    def stats(self):
+        stats = self.memory.stats()
+        stats["disk_hits"] = self.disk.hits if self.disk is not None else 0
+        return stats
+
+
+class CachedEmbeddingFunction:
+    """
+    Envolve uma função de embedding (lista de textos -> lista de vetores)
+
+    Textos já vistos saem do cache; os que faltam são embedados juntos em
+    uma única chamada à função original.
+    """
+
+    def __init__(self, embedding_function, model_name, cache=None):
+        self.embedding_function = embedding_function
+        self.model_name = model_name
+        self.cache = cache if cache is not None else get_embedding_cache()
+
+    def __call__(self, input):
+        textos = [input] if isinstance(input, str) else list(input)
+        embeddings = [self.cache.get(text, self.model_name) for text in textos]
+        faltando = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if faltando:
+            novos = self.embedding_function([textos[i] for i in faltando])
+            for i, embedding in zip(faltando, novos):
+                self.cache.put(textos[i], self.model_name, embedding)
+                embeddings[i] = np.asarray(embedding, dtype=np.float32)
+        return embeddings
+
+
+class SemanticAnswerCache:
+    """
+    Cache semântico de respostas
+
+    Uma pergunta nova reaproveita a resposta de uma pergunta anterior quando
+    os chunks recuperados são os mesmos (IDs e conteúdo) e a similaridade de
+    cosseno entre os embeddings das perguntas passa do limiar. Como o
+    conteúdo dos chunks faz parte da chave, uma mudança no índice invalida
+    as respostas afetadas; invalidate() limpa tudo.
+    """
+
+    def __init__(self, threshold=0.95, max_entries=512, ttl=None, fallback_threshold=0.85):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.fallback_threshold = fallback_threshold
+        self.hits = 0
+        self.misses = 0
+        self.fallback_hits = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()  # id -> (fingerprint, embedding, answer, created)
+        self._by_fingerprint = {}  # fingerprint -> set de ids
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(results):
+        """Chave dos chunks recuperados: IDs e hash do texto, na ordem"""
+        digest = hashlib.sha256()
+        for result in results:
+            digest.update(result["id"].encode("utf-8") + b"\x00")
+            digest.update(hashlib.sha256(result["text"].encode("utf-8")).digest())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _normalizar(embedding):
+        vetor = np.asarray(embedding, dtype=np.float32)
+        norma = np.linalg.norm(vetor)
+        return vetor / norma if norma else vetor
+
+    def _remover(self, entry_id):
+        fingerprint = self._entries.pop(entry_id)[0]
+        ids = self._by_fingerprint.get(fingerprint)
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del self._by_fingerprint[fingerprint]
+
+    def lookup(self, embedding, results):
+        """Retorna a resposta em cache para a pergunta ou None"""
+        fingerprint = self.fingerprint(results)
+        query = self._normalizar(embedding)
+        agora = time.monotonic()
+        with self._lock:
+            melhor_id, melhor_score = None, self.threshold
+            for entry_id in list(self._by_fingerprint.get(fingerprint, ())):
+                _, vetor, _, created = self._entries[entry_id]
+                if self.ttl is not None and agora - created >= self.ttl:
+                    self._remover(entry_id)
+                    continue
+                score = float(vetor @ query)
+                if score >= melhor_score:
+                    melhor_id, melhor_score = entry_id, score
+            if melhor_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(melhor_id)
+            self.hits += 1
+            return self._entries[melhor_id][2]
+
+    def mais_proxima(self, embedding):
+        """
+        Resposta da pergunta mais parecida, sem exigir os mesmos chunks
+
+        Usada só quando o LLM está indisponível (resiliencia.py): uma
+        resposta a uma pergunta parecida é melhor que uma mensagem de erro.
+        """
+        query = self._normalizar(embedding)
+        agora = time.monotonic()
+        with self._lock:
+            melhor, melhor_score = None, self.fallback_threshold
+            for _, vetor, answer, created in self._entries.values():
+                if self.ttl is not None and agora - created >= self.ttl:
+                    continue
+                score = float(vetor @ query)
+                if score >= melhor_score:
+                    melhor, melhor_score = answer, score
+            if melhor is not None:
+                self.fallback_hits += 1
+            return melhor
+
+    def store(self, embedding, results, answer):
+        fingerprint = self.fingerprint(results)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (
+                fingerprint,
+                self._normalizar(embedding),
+                answer,
+                time.monotonic(),
+            )
+            self._by_fingerprint.setdefault(fingerprint, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remover(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self):
+        """Descarta todas as respostas (ex.: depois de reindexar)"""
+        with self._lock:
+            self._entries.clear()
+            self._by_fingerprint.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "fallback_hits": self.fallback_hits,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    """Retorna o cache de embeddings do processo (criado na primeira chamada)"""
+    global _embedding_cache
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache(disk_path=EMBEDDING_CACHE_PATH)
+        return _embedding_cache
+
+
+_answer_cache = None
+
+
+def get_answer_cache():
+    """Retorna o cache semântico de respostas do processo (None se desativado)"""
+    global _answer_cache
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    with _embedding_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = SemanticAnswerCache(
+                ANSWER_CACHE_THRESHOLD,
+                ANSWER_CACHE_SIZE,
+                ANSWER_CACHE_TTL,
+                ANSWER_FALLBACK_THRESHOLD,
+            )
+        return _answer_cache
@@ -0,0 +1,182 @@
+"""
+Versão assíncrona do motor RAG para servidores ASGI (api_chat_async.py)
+
+Usa o cliente assíncrono da OpenAI para embeddings e completions, então um
+único event loop atende muitas conversas em andamento enquanto espera a
+rede. Prompt, retriever e caches são os mesmos do MotorRAG (motor.py), e
+também os passos do pipeline (roteador de intenções, cache de respostas,
+reserva quando o LLM falha, histórico): aqui ficam só as chamadas de rede e
+de sessões que esperam no event loop.
+"""
+
+import asyncio
+import time
+
+from clientes import get_async_openai_client
+from coalescencia import AsyncSingleFlight, chave_pedido
+from metricas import registrar_tokens, span
+from motor import MotorRAG, resposta_compartilhavel
+from resiliencia import acompletar, get_politica
+
+
+class AsyncChatRAG(MotorRAG):
+    def __init__(self, async_client=None, **componentes):
+        """
+        Inicializa o motor com o cliente assíncrono da OpenAI
+
+        componentes: substituem os do motor (retriever, client, answer_cache...)
+        """
+        super().__init__(**componentes)
+        self.async_client = async_client or get_async_openai_client(self.openai_api_key)
+        # Coalescência no event loop (as corrotinas não usam o SingleFlight de threads)
+        self.async_coalescer = (
+            AsyncSingleFlight(self.coalescer.wait) if self.coalescer is not None else None
+        )
+
+    async def aembed_question(self, question):
+        """Embedding da pergunta, passando pelo cache compartilhado"""
+        cache = self.query_embedding_fn.cache
+        model_name = self.query_embedding_fn.model_name
+        embedding = cache.get(question, model_name)
+        if embedding is None:
+            with span("embedding"):
+                response = await get_politica("embedding").aexecutar(
+                    lambda timeout: self.async_client.embeddings.create(
+                        input=[question], model=model_name, timeout=timeout
+                    )
+                )
+            registrar_tokens(response.usage, "embedding")
+            embedding = response.data[0].embedding
+            cache.put(question, model_name, embedding)
+        return embedding
+
+    async def aretrieve(self, question, n_results=None, lexical_shortcut=True):
+        """Busca os chunks relevantes e retorna o embedding da pergunta junto"""
+        try:
+            with span("retrieval"):
+                return await self.retriever.asearch(
+                    question, self.aembed_question, n_results or self.n_results, lexical_shortcut
+                )
+        except Exception as e:
+            print(f"❌ Erro ao buscar documentos: {e}")
+            return None, []
+
+    async def aget_history(self, session_id=None):
+        """Histórico da sessão, sem bloquear o event loop"""
+        if session_id is None:
+            return self.conversation_history
+        return await self.sessions.aget_history(session_id)
+
+    async def aclear_history(self, session_id=None):
+        """Limpa o histórico da sessão, sem bloquear o event loop"""
+        if session_id is None:
+            self.conversation_history = []
+        else:
+            await self.sessions.aclear(session_id)
+
+    async def _aguardar_turno(self, messages, session_id=None):
+        """Acrescenta as mensagens do turno ao histórico, sem bloquear o event loop"""
+        if session_id is None:
+            self.conversation_history.extend(messages)
+        else:
+            await self.sessions.aappend(session_id, messages)
+
+    async def _apreparar_roteador(self, embedding):
+        """Embeda os exemplos das intenções uma vez, fora do event loop, antes do primeiro roteamento"""
+        router = self.intent_router
+        if router is not None and embedding is not None and not router.preparado:
+            await asyncio.to_thread(router.centroides, self.query_embedding_fn)
+
+    async def _abuscar_contexto(self, question, history):
+        """Busca os chunks e consulta o roteador de intenções e o cache de respostas"""
+        resultado = self._resultado_por_regra(question)
+        if resultado is not None:
+            return resultado
+        embedding, results = await self.aretrieve(
+            question, lexical_shortcut=self._atalho_lexical(history)
+        )
+        if results:
+            await self._apreparar_roteador(embedding)
+        return self._resultado_da_busca(embedding, results, history)
+
+    async def _acompletion(self, messages, stream=False):
+        """Chamada de chat com prazos, retries e modelo de reserva (resiliencia.py)"""
+        return await acompletar(
+            self._pedido_completion(self.async_client, messages, stream),
+            stream=stream,
+            modelo=self.model,
+        )
+
+    async def agenerate_response(self, question, relevant_chunks, history=None):
+        """Gera resposta usando OpenAI com contexto RAG"""
+        try:
+            messages = self.build_messages(question, relevant_chunks, history)
+            with span("completion"):
+                return self._conteudo(await self._acompletion(messages))
+        except Exception as e:
+            return self._falha_na_geracao(e)
+
+    async def agenerate_response_stream(self, question, relevant_chunks, history=None):
+        """Gera a resposta em streaming, devolvendo os trechos conforme chegam"""
+        messages = self.build_messages(question, relevant_chunks, history)
+        inicio = time.perf_counter()
+        async for chunk in await self._acompletion(messages, stream=True):
+            texto = self._trecho(chunk, inicio)
+            if texto:
+                inicio = None
+                yield texto
+
+    async def _aresponder(self, question, history):
+        """Busca o contexto e gera a resposta (resposta None se não houver chunks)"""
+        resultado = await self._abuscar_contexto(question, history)
+        if self._precisa_gerar(resultado):
+            response = await self.agenerate_response(
+                question, self._chunks(resultado[1]), history
+            )
+            resultado = self._com_resposta_gerada(resultado, response)
+        return resultado
+
+    async def aprocess_question(self, question, session_id=None):
+        """Processa uma pergunta e retorna a resposta"""
+        history = await self.aget_history(session_id)
+
+        if self.async_coalescer is None:
+            resultado, compartilhado = await self._aresponder(question, history), False
+        else:
+            resultado, compartilhado = await self.async_coalescer.do(
+                chave_pedido(question, history),
+                lambda: self._aresponder(question, history),
+                resposta_compartilhavel,
+            )
+        response, messages = self._concluir(question, resultado, compartilhado)
+        if messages is not None:
+            await self._aguardar_turno(messages, session_id)
+        return response
+
+    async def aprocess_question_stream(self, question, session_id=None):
+        """Processa uma pergunta devolvendo a resposta em trechos (deltas)"""
+        history = await self.aget_history(session_id)
+        resultado = await self._abuscar_contexto(question, history)
+
+        if self._precisa_gerar(resultado):
+            embedding, results, use_cache, _ = resultado
+            partes = []
+            try:
+                async for delta in self.agenerate_response_stream(
+                    question, self._chunks(results), history
+                ):
+                    partes.append(delta)
+                    yield delta
+            except Exception as e:
+                final, response, use_cache = self._falha_no_stream(e, partes, embedding, use_cache)
+                yield final
+                resultado = embedding, results, use_cache, response
+            else:
+                resultado = self._com_resposta_gerada(resultado, "".join(partes))
+            response, messages = self._concluir(question, resultado)
+        else:
+            response, messages = self._concluir(question, resultado)
+            yield response
+
+        if messages is not None:
+            await self._aguardar_turno(messages, session_id)
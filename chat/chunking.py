@@ -0,0 +1,182 @@
+"""
+Divisão dos documentos da base de conhecimento em chunks
+
+- split_text: o corte original a cada N caracteres (CHUNK_PARAMS_FIXO)
+- markdown: segue os títulos (#, ##, ###), e dentro de cada seção os
+  parágrafos, as linhas e as frases, com limite e sobreposição em tokens.
+  Cada chunk começa com o caminho de títulos da seção (ex.: "## 2. E-COMMERCE"
+  e "### OBJEÇÃO: ..."), então uma objeção e sua resposta ficam juntas
+- texto: parágrafos, linhas e frases, para documentos sem títulos
+
+O chunker de cada documento vem de REGRAS_CHUNKER (padrão do nome do arquivo
+-> chunker); para um novo tipo de documento, registre a função em CHUNKERS e
+acrescente a regra.
+"""
+
+import re
+from fnmatch import fnmatch
+
+from tokens import count_tokens, truncate_tokens
+
+# Modelo de embedding da base: definido só aqui, o manifesto registra o nome
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# (padrão do nome do arquivo, chunker); vale a primeira regra que casar
+REGRAS_CHUNKER = [
+    ["*.md", "markdown"],
+    ["*_OTIMIZADO.txt", "markdown"],
+    ["*", "texto"],
+]
+
+# Parâmetros que, se mudarem, invalidam todos os embeddings da coleção
+CHUNK_PARAMS = {
+    "chunker": "estrutural",
+    "max_tokens": 300,
+    "overlap_tokens": 40,
+    "regras": REGRAS_CHUNKER,
+}
+
+# Parâmetros do split_text original (comparação e fallback)
+CHUNK_PARAMS_FIXO = {"chunker": "split_text", "chunk_size": 1000, "chunk_overlap": 20}
+
+TITULO = re.compile(r"^(#{1,6})\s+\S")
+SEPARADOR_SECAO = re.compile(r"^\s*(-{3,}|\*{3,})\s*$")
+# Separadores tentados em ordem, do maior para o menor pedaço
+SEPARADORES = [
+    re.compile(r"\n\s*\n"),  # parágrafos
+    re.compile(r"\n"),  # linhas (itens de lista)
+    re.compile(r"(?<=[.!?…])\s+"),  # frases
+    re.compile(r"\s+"),  # palavras
+]
+
+
+def split_text(text, chunk_size=1000, chunk_overlap=20):
+    """Corta o texto a cada chunk_size caracteres, com sobreposição"""
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = start + chunk_size
+        chunks.append(text[start:end])
+        start = end - chunk_overlap
+    return chunks
+
+
+def _unidades(texto, max_tokens, model_name, nivel=0):
+    """Quebra o texto em pedaços de até max_tokens, nos maiores separadores possíveis"""
+    if count_tokens(texto, model_name) <= max_tokens:
+        return [texto]
+    if nivel == len(SEPARADORES):
+        # Uma única "palavra" maior que o limite: corte direto por tokens
+        cortado = truncate_tokens(texto, max_tokens, model_name)
+        return [cortado] + _unidades(texto[len(cortado):].strip(), max_tokens, model_name, nivel)
+    unidades = []
+    for parte in SEPARADORES[nivel].split(texto):
+        if parte.strip():
+            unidades.extend(_unidades(parte.strip(), max_tokens, model_name, nivel + 1))
+    return unidades
+
+
+def _agrupar(unidades, max_tokens, overlap_tokens, model_name):
+    """Junta as unidades em chunks de até max_tokens, repetindo o final do anterior"""
+    chunks, atual, tokens_atual = [], [], 0
+    for unidade in unidades:
+        tokens = count_tokens(unidade, model_name) + 1
+        if atual and tokens_atual + tokens > max_tokens:
+            chunks.append("\n".join(atual))
+            # Sobreposição: as últimas unidades que cabem em overlap_tokens
+            sobra, tokens_sobra = [], 0
+            for anterior in reversed(atual):
+                t = count_tokens(anterior, model_name) + 1
+                if tokens_sobra + t > overlap_tokens or tokens_sobra + t + tokens > max_tokens:
+                    break
+                sobra.insert(0, anterior)
+                tokens_sobra += t
+            atual, tokens_atual = sobra, tokens_sobra
+        atual.append(unidade)
+        tokens_atual += tokens
+    if atual:
+        chunks.append("\n".join(atual))
+    return chunks
+
+
+def _dividir_secao(prefixo, corpo, max_tokens, overlap_tokens, model_name):
+    """Divide o corpo de uma seção, repetindo o prefixo (títulos) em cada chunk"""
+    tokens_prefixo = count_tokens(prefixo, model_name) + 1 if prefixo else 0
+    limite = max(max_tokens - tokens_prefixo, max_tokens // 4, 1)
+    unidades = _unidades(corpo, limite, model_name)
+    partes = _agrupar(unidades, limite, overlap_tokens, model_name)
+    return [f"{prefixo}\n{parte}" if prefixo else parte for parte in partes]
+
+
+def split_texto(text, max_tokens=300, overlap_tokens=40, model_name=EMBEDDING_MODEL):
+    """Chunks por parágrafos, linhas e frases, até max_tokens cada"""
+    text = text.strip()
+    if not text:
+        return []
+    return _dividir_secao("", text, max_tokens, overlap_tokens, model_name)
+
+
+def secoes_markdown(text):
+    """Lista de (títulos da seção, do mais externo ao atual; corpo)"""
+    secoes = []
+    caminho = []  # [(nível, linha do título)]
+    corpo = []
+
+    def fechar():
+        texto = "\n".join(corpo).strip()
+        if texto:
+            secoes.append(([linha for _, linha in caminho], texto))
+        corpo.clear()
+
+    for linha in text.splitlines():
+        titulo = TITULO.match(linha)
+        if titulo:
+            fechar()
+            nivel = len(titulo.group(1))
+            caminho = [item for item in caminho if item[0] < nivel]
+            caminho.append((nivel, linha.strip()))
+        elif not SEPARADOR_SECAO.match(linha):
+            corpo.append(linha)
+    fechar()
+    return secoes
+
+
+def split_markdown(text, max_tokens=300, overlap_tokens=40, model_name=EMBEDDING_MODEL):
+    """Chunks por seção (títulos); seções grandes seguem por parágrafos e frases"""
+    chunks = []
+    for titulos, corpo in secoes_markdown(text):
+        chunks.extend(
+            _dividir_secao("\n".join(titulos), corpo, max_tokens, overlap_tokens, model_name)
+        )
+    return chunks
+
+
+CHUNKERS = {
+    "markdown": split_markdown,
+    "texto": split_texto,
+}
+
+
+def chunker_do_documento(doc_id, regras=REGRAS_CHUNKER):
+    """Nome do chunker para o arquivo, pela primeira regra que casar"""
+    for padrao, chunker in regras:
+        if fnmatch(doc_id, padrao):
+            return chunker
+    return "texto"
+
+
+def dividir_documento(doc, params=CHUNK_PARAMS):
+    """Divide um documento ({"id", "text"}) em chunks conforme os parâmetros"""
+    if params["chunker"] == "split_text":
+        return split_text(doc["text"], params["chunk_size"], params["chunk_overlap"])
+    chunker = CHUNKERS[chunker_do_documento(doc["id"], params.get("regras", REGRAS_CHUNKER))]
+    return chunker(doc["text"], params["max_tokens"], params["overlap_tokens"])
+
+
+def gerar_chunks(documents, params=CHUNK_PARAMS):
+    """Chunks de todos os documentos, com os IDs usados na coleção"""
+    return [
+        {"id": f"{doc['id']}_chunk{i + 1}", "text": chunk}
+        for doc in documents
+        for i, chunk in enumerate(dividir_documento(doc, params))
+    ]
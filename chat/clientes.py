@@ -0,0 +1,254 @@
+"""
+Registro de clientes compartilhados no processo
+
+rag.py, ChatRAG (terminal e API) e ChatRAGWeb (uma instância por sessão do
+Streamlit) usam os mesmos clientes da OpenAI e do Chroma e o mesmo
+retriever, criados sob demanda na primeira chamada. Os clientes da OpenAI
+mantêm um pool HTTP com keep-alive, então as requisições seguintes
+reaproveitam as conexões (sem novo handshake TLS), e uma nova sessão do
+Streamlit não paga o custo de criar clientes nem de carregar o snapshot.
+
+Tamanho do pool e timeouts vêm das variáveis de ambiente abaixo. Os
+retries das chamadas do chat ficam em resiliencia.py, por isso o SDK não
+refaz as requisições por padrão (OPENAI_MAX_RETRIES=0).
+"""
+
+import os
+import threading
+
+import chromadb
+import openai
+from chromadb.utils import embedding_functions
+from openai import AsyncOpenAI, OpenAI
+
+from cache import CachedEmbeddingFunction
+from chunking import EMBEDDING_MODEL
+from metricas import registrar_tokens, span
+from resiliencia import get_politica
+from retriever import caminho_snapshot, criar_retriever
+
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "0"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "100"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+
+# Biblioteca HTTP do SDK da OpenAI (httpx2 nas versões mais novas, httpx nas anteriores)
+try:
+    import httpx2 as _http
+except ImportError:
+    import httpx as _http
+
+COLLECTION_NAME = "texto_gerado"
+CHROMA_PERSISTENT_PATH = "chroma_persistent_storage"
+
+
+class ClientRegistry:
+    """Objetos criados uma vez por chave e reaproveitados no processo"""
+
+    def __init__(self):
+        self._objetos = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    def obter(self, chave, factory):
+        """Retorna o objeto da chave, criando-o com factory() na primeira vez"""
+        objeto = self._objetos.get(chave)
+        if objeto is not None:
+            self.reused += 1
+            return objeto
+        with self._lock:
+            lock = self._locks.setdefault(chave, threading.Lock())
+        # Um lock por chave: criar o cliente do Chroma não bloqueia o da OpenAI
+        with lock:
+            objeto = self._objetos.get(chave)
+            if objeto is None:
+                objeto = factory()
+                self._objetos[chave] = objeto
+                self.created += 1
+            else:
+                self.reused += 1
+            return objeto
+
+    def descartar(self, chave):
+        """Remove o objeto da chave (a próxima chamada cria outro)"""
+        return self._objetos.pop(chave, None)
+
+    def stats(self):
+        return {
+            "clients": sorted(str(chave[0]) for chave in self._objetos),
+            "created": self.created,
+            "reused": self.reused,
+            "http_pool_size": HTTP_POOL_SIZE,
+            "timeout": OPENAI_TIMEOUT,
+        }
+
+
+_registry = ClientRegistry()
+
+
+def get_registry():
+    """Retorna o registro de clientes do processo"""
+    return _registry
+
+
+def _limites_http():
+    return _http.Limits(
+        max_connections=HTTP_POOL_SIZE,
+        max_keepalive_connections=HTTP_POOL_SIZE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def _timeout_http():
+    return _http.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+
+
+def get_openai_client(api_key=None):
+    """Cliente OpenAI síncrono com pool HTTP compartilhado"""
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    return _registry.obter(
+        ("openai", api_key),
+        lambda: OpenAI(
+            api_key=api_key,
+            max_retries=OPENAI_MAX_RETRIES,
+            timeout=_timeout_http(),
+            http_client=openai.DefaultHttpxClient(
+                limits=_limites_http(), timeout=_timeout_http()
+            ),
+        ),
+    )
+
+
+def get_ingestion_openai_client(api_key=None, pool_size=2):
+    """
+    Cliente OpenAI da indexação em segundo plano (indexacao.py)
+
+    Tem um pool HTTP próprio e pequeno: uma rajada de indexação não ocupa as
+    conexões das perguntas do chat.
+    """
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    limits = _http.Limits(
+        max_connections=pool_size,
+        max_keepalive_connections=pool_size,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    return _registry.obter(
+        ("openai_ingest", api_key, pool_size),
+        lambda: OpenAI(
+            api_key=api_key,
+            max_retries=OPENAI_MAX_RETRIES,
+            timeout=_timeout_http(),
+            http_client=openai.DefaultHttpxClient(limits=limits, timeout=_timeout_http()),
+        ),
+    )
+
+
+def get_async_openai_client(api_key=None):
+    """
+    Cliente OpenAI assíncrono com pool HTTP compartilhado
+
+    As conexões ficam presas ao event loop em que foram abertas: use um
+    único loop por processo (como no servidor ASGI).
+    """
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    return _registry.obter(
+        ("openai_async", api_key),
+        lambda: AsyncOpenAI(
+            api_key=api_key,
+            max_retries=OPENAI_MAX_RETRIES,
+            timeout=_timeout_http(),
+            http_client=openai.DefaultAsyncHttpxClient(
+                limits=_limites_http(), timeout=_timeout_http()
+            ),
+        ),
+    )
+
+
+def _embed_perguntas(textos, model_name):
+    """Embeddings das perguntas que não estavam no cache (etapa "embedding")"""
+    client = get_openai_client()
+    with span("embedding"):
+        response = get_politica("embedding").executar(
+            lambda timeout: client.embeddings.create(
+                input=textos, model=model_name, timeout=timeout
+            )
+        )
+    registrar_tokens(response.usage, "embedding")
+    data = sorted(response.data, key=lambda item: item.index)
+    return [item.embedding for item in data]
+
+
+def get_query_embedding_fn(model_name=EMBEDDING_MODEL):
+    """Embeddings das perguntas: cliente com pool + cache de embeddings do processo"""
+    return _registry.obter(
+        ("query_embedding", model_name),
+        lambda: CachedEmbeddingFunction(
+            lambda textos: _embed_perguntas(textos, model_name), model_name
+        ),
+    )
+
+
+def get_chroma_embedding_function(model_name=EMBEDDING_MODEL):
+    """Função de embedding registrada na coleção do Chroma"""
+    return _registry.obter(
+        ("chroma_embedding", model_name),
+        lambda: embedding_functions.OpenAIEmbeddingFunction(
+            api_key=os.getenv("OPENAI_API_KEY"), model_name=model_name
+        ),
+    )
+
+
+def get_chroma_client(kind="cloud"):
+    """Cliente do Chroma: "cloud" (Chroma Cloud) ou "persistent" (pasta local)"""
+
+    def criar():
+        if kind == "cloud":
+            # CHROMA_HOST aponta para outro servidor (self-hosted ou o falso dos benchmarks)
+            return chromadb.CloudClient(
+                api_key=os.getenv("CHROMADB_API_KEY"),
+                tenant=os.getenv("CHROMADB_TENANT_ID"),
+                database=os.getenv("CHROMADB"),
+                cloud_host=os.getenv("CHROMA_HOST", "api.trychroma.com"),
+                cloud_port=int(os.getenv("CHROMA_PORT", "443")),
+                enable_ssl=os.getenv("CHROMA_SSL", "true").lower() == "true",
+            )
+        if kind == "persistent":
+            return chromadb.PersistentClient(path=CHROMA_PERSISTENT_PATH)
+        raise ValueError(f"Cliente do Chroma desconhecido: {kind}")
+
+    return _registry.obter(("chroma", kind), criar)
+
+
+def get_collection(kind="cloud", name=COLLECTION_NAME):
+    """Coleção da base de conhecimento no Chroma (conecta na primeira chamada)"""
+    return _registry.obter(
+        ("collection", kind, name),
+        lambda: get_chroma_client(kind).get_or_create_collection(
+            name=name, embedding_function=get_chroma_embedding_function()
+        ),
+    )
+
+
+def get_retriever(backend=None, kind="cloud", name=COLLECTION_NAME, snapshot_path=None):
+    """
+    Retriever da coleção, criado uma vez por configuração
+
+    backend e snapshot_path seguem RETRIEVER_BACKEND e SNAPSHOT_PATH. O
+    backend local carrega o snapshot (e o índice BM25) uma única vez.
+    """
+    backend = backend or os.getenv("RETRIEVER_BACKEND", "chroma")
+    snapshot_path = snapshot_path or os.getenv("SNAPSHOT_PATH", caminho_snapshot(name))
+    chave = ("retriever", backend, kind, name, snapshot_path if backend == "local" else None)
+    return _registry.obter(
+        chave,
+        lambda: criar_retriever(
+            backend,
+            lambda: get_collection(kind, name),
+            get_query_embedding_fn(),
+            snapshot_path,
+            embedding_model=EMBEDDING_MODEL,
+        ),
+    )
@@ -0,0 +1,147 @@
+"""
+Coalescência de pedidos iguais em andamento (single-flight)
+
+Em campanhas muitos clientes mandam a mesma pergunta no mesmo segundo.
+Pedidos simultâneos com a mesma pergunta normalizada e o mesmo contexto
+(histórico) compartilham uma única busca + geração: o primeiro (líder)
+executa e os demais esperam o resultado dele.
+
+- a espera é limitada (COALESCE_WAIT); quem passa do limite executa sozinho
+- erros não se propagam: se o líder falhar (exceção ou resposta de erro),
+  cada seguidor executa a própria tentativa
+- stats() conta as execuções e os pedidos atendidos pelo resultado de outro
+
+SingleFlight serve os workers com threads (Flask); AsyncSingleFlight, o
+event loop do servidor ASGI.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+
+from cache import normalizar_pergunta
+
+COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "true").lower() == "true"
+COALESCE_WAIT = float(os.getenv("COALESCE_WAIT", "20"))
+
+
+def chave_pedido(question, history=()):
+    """Chave do pedido: pergunta normalizada e hash do histórico"""
+    contexto = json.dumps(list(history), ensure_ascii=False, sort_keys=True)
+    digest = hashlib.sha256(contexto.encode("utf-8")).hexdigest()
+    return f"{normalizar_pergunta(question)}\x00{digest}"
+
+
+class _Voo:
+    """Execução em andamento de uma chave"""
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.compartilhavel = False
+
+
+class SingleFlight:
+    """Deduplicação de chamadas simultâneas com a mesma chave (threads)"""
+
+    def __init__(self, wait=COALESCE_WAIT):
+        self.wait = wait
+        self.executions = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self.not_shared = 0
+        self._voos = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, compartilhavel=None):
+        """
+        Executa fn() uma vez por chave entre os pedidos simultâneos
+
+        Retorna (resultado, compartilhado), com compartilhado=True quando o
+        resultado veio da execução de outro pedido. `compartilhavel(resultado)`
+        decide se o resultado do líder pode ser entregue aos seguidores.
+        """
+        with self._lock:
+            voo = self._voos.get(key)
+            lider = voo is None
+            if lider:
+                voo = self._voos[key] = _Voo()
+
+        if lider:
+            try:
+                resultado = self._executar(fn)
+                voo.resultado = resultado
+                voo.compartilhavel = compartilhavel is None or compartilhavel(resultado)
+                return resultado, False
+            finally:
+                with self._lock:
+                    self._voos.pop(key, None)
+                voo.evento.set()
+
+        if not voo.evento.wait(self.wait):
+            self._contar("timeouts")
+        elif voo.compartilhavel:
+            self._contar("coalesced")
+            return voo.resultado, True
+        else:
+            self._contar("not_shared")
+        # Líder lento ou com erro: este pedido executa por conta própria
+        return self._executar(fn), False
+
+    def _executar(self, fn):
+        self._contar("executions")
+        return fn()
+
+    def _contar(self, contador):
+        with self._lock:
+            setattr(self, contador, getattr(self, contador) + 1)
+
+    def stats(self):
+        with self._lock:
+            total = self.executions + self.coalesced
+            return {
+                "wait": self.wait,
+                "in_flight": len(self._voos),
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "timeouts": self.timeouts,
+                "not_shared": self.not_shared,
+                "coalesced_rate": self.coalesced / total if total else 0.0,
+            }
+
+
+class AsyncSingleFlight(SingleFlight):
+    """Deduplicação de corrotinas simultâneas com a mesma chave (um event loop)"""
+
+    async def do(self, key, coro_fn, compartilhavel=None):
+        """Versão assíncrona de SingleFlight.do: coro_fn() é aguardada uma vez por chave"""
+        voo = self._voos.get(key)
+        if voo is None:
+            futuro = self._voos[key] = asyncio.get_running_loop().create_future()
+            self._contar("executions")
+            try:
+                resultado = await coro_fn()
+            except BaseException:
+                # Inclui o cancelamento do líder (cliente desconectou)
+                futuro.set_result((False, None))
+                raise
+            else:
+                ok = compartilhavel is None or compartilhavel(resultado)
+                futuro.set_result((ok, resultado))
+                return resultado, False
+            finally:
+                self._voos.pop(key, None)
+
+        try:
+            ok, resultado = await asyncio.wait_for(asyncio.shield(voo), self.wait)
+        except asyncio.TimeoutError:
+            self._contar("timeouts")
+        else:
+            if ok:
+                self._contar("coalesced")
+                return resultado, True
+            self._contar("not_shared")
+        self._contar("executions")
+        return await coro_fn(), False
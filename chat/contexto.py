@@ -0,0 +1,180 @@
+"""
+Montagem do prompt com orçamento de tokens
+
+O prompt enviado ao LLM tem um teto fixo de tokens de entrada
+(CONTEXT_MAX_TOKENS), preenchido em ordem de prioridade:
+
+1. prompt do sistema e pergunta atual (sempre entram)
+2. chunks recuperados, na ordem de relevância (o que não cabe inteiro é
+   cortado ou descartado)
+3. histórico da conversa, das mensagens mais recentes para as mais antigas
+
+A contagem usa o tokenizador local (tokens.py). Cada montagem gera um
+relatório de tokens, registrado no log e somado em get_context_stats().
+"""
+
+import logging
+import os
+import threading
+
+from tokens import count_tokens, truncate_tokens
+
+logger = logging.getLogger(__name__)
+
+CHAT_MODEL = "gpt-4o-mini"
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "3000"))
+CONTEXT_MAX_HISTORY = int(os.getenv("CONTEXT_MAX_HISTORY", "6"))
+# Um chunk só é cortado se sobrarem pelo menos estes tokens; senão é descartado
+CONTEXT_MIN_CHUNK_TOKENS = int(os.getenv("CONTEXT_MIN_CHUNK_TOKENS", "64"))
+
+# Tokens que a API soma por mensagem (papel e delimitadores) e para a resposta
+TOKENS_POR_MENSAGEM = 4
+TOKENS_RESPOSTA = 3
+
+SEPARADOR_CHUNKS = "\n\n"
+
+PRODUTO_PADRAO = "Menos Café Mais Chá"
+
+# Prompt otimizado para vendas ({produto}: nome do produto do lojista)
+PROMPT_VENDAS_MODELO = (
+    "Você é um assistente de vendas especializado em resolver objeções e vender. "
+    "Seu principal objetivo é vender o produto '{produto}'"
+    "Use as informações do contexto para responder de forma empática, persuasiva e profissional. "
+    "Use um tom conversacional, acolhedor e use emojis quando apropriado. "
+    "Se não souber a resposta baseada no contexto, diga que não tem essa informação específica. "
+    "Não diga tudo o que é possível encontrar no produto, dê alguns detalhes mas não todos"
+    "Sempre faça uma chamanda para a venda, o objetivo é fazer o cliente comprar o produto e não simplesmente responder perguntas"
+    "Não fale de desconto"
+    "Sempre foque nos benefícios e na solução que o produto oferece.\n\n"
+)
+PROMPT_VENDAS = PROMPT_VENDAS_MODELO.format(produto=PRODUTO_PADRAO)
+
+
+def tokens_mensagem(message, model_name=CHAT_MODEL):
+    return TOKENS_POR_MENSAGEM + count_tokens(message.get("content") or "", model_name)
+
+
+def montar_mensagens(
+    question,
+    relevant_chunks,
+    history=(),
+    max_tokens=CONTEXT_MAX_TOKENS,
+    max_history=CONTEXT_MAX_HISTORY,
+    model_name=CHAT_MODEL,
+    min_chunk_tokens=CONTEXT_MIN_CHUNK_TOKENS,
+    system_prompt=PROMPT_VENDAS,
+):
+    """
+    Monta as mensagens do chat dentro do orçamento de tokens
+
+    system_prompt: instruções do sistema (o prompt do produto do lojista).
+    Retorna (mensagens, relatório com a contagem de tokens por parte).
+    """
+    separador = count_tokens(SEPARADOR_CHUNKS, model_name)
+    pergunta = {"role": "user", "content": question}
+    tokens_sistema = TOKENS_POR_MENSAGEM + count_tokens(
+        f"{system_prompt}Contexto:\n\n\n", model_name
+    )
+    tokens_pergunta = tokens_mensagem(pergunta, model_name)
+    restante = max_tokens - tokens_sistema - tokens_pergunta - TOKENS_RESPOSTA
+
+    # Chunks em ordem de relevância: inteiros enquanto couberem
+    chunks, tokens_chunks = [], 0
+    cortados = descartados = 0
+    for chunk in relevant_chunks:
+        tokens = count_tokens(chunk, model_name) + separador
+        if tokens > restante:
+            if restante - separador < min_chunk_tokens:
+                descartados += 1
+                continue
+            chunk = truncate_tokens(chunk, restante - separador, model_name)
+            tokens = count_tokens(chunk, model_name) + separador
+            cortados += 1
+        chunks.append(chunk)
+        tokens_chunks += tokens
+        restante -= tokens
+
+    # Histórico das mensagens mais recentes para as mais antigas
+    recentes = list(history)[-max_history:] if max_history > 0 else []
+    historico, tokens_historico = [], 0
+    for message in reversed(recentes):
+        tokens = tokens_mensagem(message, model_name)
+        if tokens > restante:
+            break
+        historico.append(message)
+        tokens_historico += tokens
+        restante -= tokens
+    historico.reverse()
+
+    context = SEPARADOR_CHUNKS.join(chunks)
+    messages = [
+        {"role": "system", "content": f"{system_prompt}Contexto:\n{context}\n\n"},
+        *historico,
+        pergunta,
+    ]
+
+    relatorio = {
+        "budget": max_tokens,
+        "system": tokens_sistema,
+        "chunks": tokens_chunks,
+        "history": tokens_historico,
+        "question": tokens_pergunta,
+        "total": tokens_sistema + tokens_chunks + tokens_historico
+        + tokens_pergunta + TOKENS_RESPOSTA,
+        "chunks_used": len(chunks),
+        "chunks_trimmed": cortados,
+        "chunks_dropped": descartados,
+        "history_used": len(historico),
+        "history_dropped": len(recentes) - len(historico),
+    }
+    get_context_stats().registrar(relatorio)
+    logger.info(
+        "Prompt: %(total)d/%(budget)d tokens (sistema %(system)d, chunks %(chunks)d, "
+        "histórico %(history)d, pergunta %(question)d; chunks %(chunks_used)d usados, "
+        "%(chunks_trimmed)d cortados, %(chunks_dropped)d descartados; "
+        "histórico %(history_used)d usadas, %(history_dropped)d descartadas)",
+        relatorio,
+    )
+    return messages, relatorio
+
+
+class ContextStats:
+    """Totais dos prompts montados no processo"""
+
+    def __init__(self):
+        self.requests = 0
+        self.total_tokens = 0
+        self.max_tokens = 0
+        self.chunks_trimmed = 0
+        self.chunks_dropped = 0
+        self.history_dropped = 0
+        self._lock = threading.Lock()
+
+    def registrar(self, relatorio):
+        with self._lock:
+            self.requests += 1
+            self.total_tokens += relatorio["total"]
+            self.max_tokens = max(self.max_tokens, relatorio["total"])
+            self.chunks_trimmed += relatorio["chunks_trimmed"]
+            self.chunks_dropped += relatorio["chunks_dropped"]
+            self.history_dropped += relatorio["history_dropped"]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "budget": CONTEXT_MAX_TOKENS,
+                "requests": self.requests,
+                "avg_prompt_tokens": self.total_tokens / self.requests if self.requests else 0.0,
+                "max_prompt_tokens": self.max_tokens,
+                "chunks_trimmed": self.chunks_trimmed,
+                "chunks_dropped": self.chunks_dropped,
+                "history_dropped": self.history_dropped,
+            }
+
+
+_context_stats = ContextStats()
+
+
+def get_context_stats():
+    """Retorna os totais de tokens dos prompts do processo"""
+    return _context_stats
@@ -0,0 +1,578 @@
+"""
+Indexação em segundo plano dos documentos dos lojistas (POST /ingest)
+
+A API só valida os documentos e põe um job em uma fila limitada
+(INGEST_QUEUE_SIZE); com a fila cheia o pedido é recusado (429) em vez de
+acumular trabalho. Um pool pequeno de workers (INGEST_WORKERS) tira os
+jobs da fila e, para cada um:
+
+1. divide os documentos em chunks e compara com o manifesto da coleção do
+   lojista: só os chunks novos ou alterados são embedados
+2. embeda os chunks em lotes (ingestao.py), com no máximo
+   INGEST_CONCURRENCY requisições simultâneas, por um cliente da OpenAI
+   com pool HTTP próprio e fora das políticas de resiliência do chat
+3. grava os chunks na coleção do Chroma ou no snapshot do lojista
+   (backend local) e o manifesto
+4. troca o índice do lojista carregado em memória (BasesLojistas.recarregar);
+   os outros workers do servidor o recarregam ao ver a nova versão
+
+Assim o conteúdo novo responde perguntas sem reiniciar a API, e uma rajada
+de indexação não disputa conexões nem o circuit breaker com o /chat. Jobs
+do mesmo lojista rodam um de cada vez em todos os workers da máquina (lock
+de arquivo ao lado do manifesto, manifesto.bloqueio_colecao; sem fcntl,
+como no Windows, só dentro do processo); o progresso e a vazão de cada job
+ficam em GET /ingest/<job_id>, e os totais em /stats e /metrics.
+
+O job roda no worker que recebeu o pedido. Com INGEST_JOB_BACKEND sqlite
+ou redis (padrão: o SESSION_BACKEND), o estado de cada job é publicado lá
+e qualquer worker responde GET /ingest/<job_id>; com memory, só o worker
+que recebeu o pedido conhece o job.
+"""
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+from chunking import CHUNK_PARAMS, EMBEDDING_MODEL, dividir_documento
+from clientes import get_collection, get_ingestion_openai_client
+from ingestao import executar_ingestao
+from lojistas import (
+    LojistaDesconhecido,
+    caminho_snapshot_lojista,
+    carregar_config,
+    collection_do_lojista,
+    validar_id,
+)
+from manifesto import (
+    bloqueio_colecao,
+    carregar_manifesto,
+    manifesto_vazio,
+    planejar_reindexacao,
+    salvar_manifesto,
+)
+from sessoes import SESSION_BACKEND, SESSION_DB_PATH, SESSION_REDIS_URL
+from snapshot import carregar_snapshot, salvar_snapshot
+
+try:
+    import redis
+except ImportError:  # redis é opcional (só para INGEST_JOB_BACKEND=redis)
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "100"))
+# Requisições de embedding simultâneas por job (e conexões do pool da indexação)
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "2"))
+INGEST_MAX_DOCUMENTS = int(os.getenv("INGEST_MAX_DOCUMENTS", "500"))
+INGEST_MAX_MB = float(os.getenv("INGEST_MAX_MB", "20"))
+# Jobs terminados guardados para consulta (os mais antigos saem primeiro)
+INGEST_MAX_JOBS = int(os.getenv("INGEST_MAX_JOBS", "1000"))
+# Onde o estado dos jobs fica visível para os outros workers: memory (não
+# fica), sqlite (arquivo das sessões) ou redis
+INGEST_JOB_BACKEND = os.getenv("INGEST_JOB_BACKEND", SESSION_BACKEND)
+# Segundos que o estado de um job fica no sqlite/redis
+INGEST_JOB_TTL = float(os.getenv("INGEST_JOB_TTL", "86400"))
+
+
+class FilaCheia(Exception):
+    """A fila de indexação está cheia; tente de novo mais tarde"""
+
+
+def validar_documentos(documents, max_documents=INGEST_MAX_DOCUMENTS, max_mb=INGEST_MAX_MB):
+    """Lista de {"id", "text"} do pedido; ValueError se o formato ou o tamanho não servir"""
+    if not isinstance(documents, list) or not documents:
+        raise ValueError("Campo 'documents' deve ser uma lista não vazia de {id, text}")
+    if len(documents) > max_documents:
+        raise ValueError(f"No máximo {max_documents} documentos por pedido")
+    validos, ids, total = [], set(), 0
+    for doc in documents:
+        if not isinstance(doc, dict):
+            raise ValueError("Cada documento deve ser um objeto {id, text}")
+        doc_id, text = doc.get("id"), doc.get("text")
+        if not isinstance(doc_id, str) or not doc_id.strip() or len(doc_id) > 200:
+            raise ValueError("Cada documento precisa de um 'id' (texto de até 200 caracteres)")
+        if not isinstance(text, str) or not text.strip():
+            raise ValueError(f"Documento '{doc_id}' sem 'text'")
+        if doc_id in ids:
+            raise ValueError(f"Documento '{doc_id}' repetido")
+        ids.add(doc_id)
+        total += len(text.encode("utf-8"))
+        validos.append({"id": doc_id, "text": text})
+    if total > max_mb * 1024 * 1024:
+        raise ValueError(f"Documentos somam mais de {max_mb:g} MB")
+    return validos
+
+
+class ColecaoSnapshot:
+    """
+    O snapshot do lojista como uma coleção (backend local)
+
+    Tem o upsert/delete que executar_ingestao e o plano usam; as mudanças
+    ficam em memória e salvar() grava o snapshot novo de uma vez (o
+    arquivo é trocado de forma atômica).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.itens = {}
+        self.dtype = "float32"
+        if os.path.exists(path):
+            snap = carregar_snapshot(path)
+            if len(snap.ids):
+                self.dtype = str(snap.embeddings.dtype)
+            for i, chunk_id in enumerate(snap.ids):
+                self.itens[chunk_id] = (snap.documents[i], np.asarray(snap.embeddings[i], dtype=np.float32))
+
+    def upsert(self, ids, documents, embeddings):
+        for chunk_id, texto, embedding in zip(ids, documents, embeddings):
+            self.itens[chunk_id] = (texto, embedding)
+
+    def delete(self, ids):
+        for chunk_id in ids:
+            self.itens.pop(chunk_id, None)
+
+    def salvar(self, metadata):
+        ids = list(self.itens)
+        return salvar_snapshot(
+            self.path,
+            ids,
+            [self.itens[chunk_id][0] for chunk_id in ids],
+            [self.itens[chunk_id][1] for chunk_id in ids],
+            dtype=self.dtype,
+            metadata=metadata,
+        )
+
+
+class _ColecaoComProgresso:
+    """Repassa os upserts à coleção e conta os chunks gravados no job"""
+
+    def __init__(self, collection, job):
+        self.collection = collection
+        self.job = job
+
+    def upsert(self, ids, documents, embeddings):
+        self.collection.upsert(ids=ids, documents=documents, embeddings=embeddings)
+        self.job.chunks_done += len(ids)
+        self.job.atualizar()
+
+
+class JobIndexacao:
+    """Um pedido de indexação: documentos de um lojista, estado e progresso"""
+
+    # Campos publicados no registro compartilhado (tudo menos os documentos)
+    CAMPOS = (
+        "id", "merchant_id", "n_documents", "status", "stage", "error",
+        "chunks_total", "chunks_done", "chunks_unchanged", "chunks_deleted",
+        "failed_chunks", "embedding_requests", "created", "started", "finished",
+    )
+
+    def __init__(self, merchant_id, documents):
+        self.publicar = None
+        self.id = uuid.uuid4().hex
+        self.merchant_id = merchant_id
+        self.documents = documents
+        self.n_documents = len(documents)
+        self.status = "queued"
+        self.stage = None
+        self.error = None
+        self.chunks_total = 0
+        self.chunks_done = 0
+        self.chunks_unchanged = 0
+        self.chunks_deleted = 0
+        self.failed_chunks = 0
+        self.embedding_requests = 0
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    def estado(self):
+        return {campo: getattr(self, campo) for campo in self.CAMPOS}
+
+    @classmethod
+    def de_estado(cls, estado):
+        """Job lido do registro compartilhado (só para consultar o estado)"""
+        job = cls.__new__(cls)
+        job.publicar = None
+        job.documents = None
+        for campo in cls.CAMPOS:
+            setattr(job, campo, estado.get(campo))
+        return job
+
+    def atualizar(self):
+        """Publica o estado no registro compartilhado, se houver"""
+        if self.publicar is not None:
+            self.publicar(self)
+
+    @property
+    def seconds(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def stats(self):
+        seconds = self.seconds
+        return {
+            "job_id": self.id,
+            "merchant_id": self.merchant_id,
+            "status": self.status,
+            "stage": self.stage,
+            "error": self.error,
+            "documents": self.n_documents,
+            "chunks_total": self.chunks_total,
+            "chunks_done": self.chunks_done,
+            "chunks_unchanged": self.chunks_unchanged,
+            "chunks_deleted": self.chunks_deleted,
+            "failed_chunks": self.failed_chunks,
+            "progress": self.chunks_done / self.chunks_total if self.chunks_total else float(self.status == "done"),
+            "embedding_requests": self.embedding_requests,
+            "queued_s": (self.started or time.time()) - self.created,
+            "seconds": seconds,
+            "chunks_per_second": self.chunks_done / seconds if seconds > 0 else 0.0,
+        }
+
+
+def indexar_lojista(job, backend, client, concorrencia=INGEST_CONCURRENCY):
+    """
+    Indexa os documentos do job na coleção (ou no snapshot) do lojista
+
+    Os documentos são somados aos que o lojista já tem: um documento com o
+    mesmo id substitui o anterior e só os chunks alterados são embedados.
+    """
+    collection_name = collection_do_lojista(job.merchant_id)
+    manifest = carregar_manifesto(collection_name)
+
+    job.stage = "chunking"
+    job.atualizar()
+    # O plano só olha para os documentos do pedido; os outros ficam como estão
+    parcial = None
+    if manifest is not None:
+        ids = {doc["id"] for doc in job.documents}
+        parcial = {
+            **manifest,
+            "files": {k: v for k, v in manifest.get("files", {}).items() if k in ids},
+        }
+
+    def dividir(doc):
+        chunks = dividir_documento(doc, CHUNK_PARAMS)
+        # Cede o GIL entre documentos para as threads dos pedidos do chat
+        time.sleep(0)
+        return chunks
+
+    plan = planejar_reindexacao(job.documents, parcial, dividir, EMBEDDING_MODEL, CHUNK_PARAMS)
+    if plan["full"] and manifest is not None:
+        # O modelo de embedding ou o chunking mudou: os chunks antigos do
+        # lojista não combinam com os novos e saem todos, como em um
+        # `rag.py index` completo; a base passa a ter só os documentos do pedido
+        logger.warning(
+            f"Modelo ou chunking de {collection_name} mudou: a base do lojista é refeita"
+        )
+        plan["to_delete"] = [
+            chunk_id
+            for entry in manifest.get("files", {}).values()
+            for chunk_id in entry.get("chunks", {})
+        ]
+        manifest = None
+    job.chunks_total = len(plan["to_embed"])
+    job.chunks_unchanged = sum(
+        len(entry["chunks"]) for entry in plan["files"].values()
+    ) - job.chunks_total
+
+    job.stage = "embedding"
+    job.atualizar()
+    if backend == "local":
+        collection = ColecaoSnapshot(caminho_snapshot_lojista(job.merchant_id))
+    else:
+        try:
+            kind = carregar_config(job.merchant_id, backend).get("chroma", "cloud")
+        except LojistaDesconhecido:
+            kind = "cloud"
+        collection = get_collection(kind, collection_name)
+    if plan["to_delete"]:
+        collection.delete(ids=plan["to_delete"])
+        job.chunks_deleted = len(plan["to_delete"])
+    if plan["to_embed"]:
+        stats = executar_ingestao(
+            plan["to_embed"], client, _ColecaoComProgresso(collection, job),
+            concorrencia=concorrencia,
+        )
+        job.embedding_requests = stats["embedding_requests"]
+        job.failed_chunks = stats["failed_chunks"]
+        failed_ids = set(stats["failed_ids"])
+    else:
+        failed_ids = set()
+
+    job.stage = "publishing"
+    job.atualizar()
+    novo = manifesto_vazio(collection_name, EMBEDDING_MODEL, CHUNK_PARAMS)
+    if manifest is not None:
+        novo["files"].update(manifest.get("files", {}))
+    novo["files"].update(plan["files"])
+    if failed_ids:
+        # Documentos com chunks que falharam ficam fora do manifesto: um novo
+        # envio do mesmo documento tenta de novo
+        for doc_id, entry in plan["files"].items():
+            if any(cid in failed_ids for cid in entry["chunks"]):
+                novo["files"].pop(doc_id, None)
+    if backend == "local":
+        collection.salvar({
+            "collection": collection_name,
+            "embedding_model": EMBEDDING_MODEL,
+            "chunk_params": CHUNK_PARAMS,
+        })
+    salvar_manifesto(novo)
+    return job
+
+
+class RegistroJobsSQLite:
+    """Estado dos jobs em uma tabela do arquivo SQLite das sessões, lido por todos os workers da máquina"""
+
+    def __init__(self, path=SESSION_DB_PATH, ttl=INGEST_JOB_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, timeout=30, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ingest_jobs "
+            "(job_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def salvar(self, estado):
+        agora = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ingest_jobs (job_id, state, updated) VALUES (?, ?, ?)",
+                (estado["id"], json.dumps(estado), agora),
+            )
+            if estado["status"] in ("done", "failed"):
+                self._conn.execute(
+                    "DELETE FROM ingest_jobs WHERE updated < ?", (agora - self.ttl,)
+                )
+
+    def ler(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state, updated FROM ingest_jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        if row is None or time.time() - row[1] >= self.ttl:
+            return None
+        return json.loads(row[0])
+
+
+class RegistroJobsRedis:
+    """Estado dos jobs no Redis (uma chave com TTL por job), lido por todos os servidores"""
+
+    PREFIXO = "chat:ingest:"
+
+    def __init__(self, url=SESSION_REDIS_URL, ttl=INGEST_JOB_TTL, client=None):
+        if client is None:
+            if redis is None:
+                raise ImportError(
+                    "INGEST_JOB_BACKEND=redis requer o pacote redis (pip install redis)"
+                )
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.ttl = ttl
+
+    def salvar(self, estado):
+        self.client.set(
+            f"{self.PREFIXO}{estado['id']}", json.dumps(estado), ex=max(int(self.ttl), 1)
+        )
+
+    def ler(self, job_id):
+        valor = self.client.get(f"{self.PREFIXO}{job_id}")
+        return json.loads(valor) if valor else None
+
+
+def criar_registro_jobs(backend):
+    """Registro compartilhado dos jobs (sqlite ou redis); None com memory"""
+    if backend == "memory":
+        return None
+    if backend == "sqlite":
+        return RegistroJobsSQLite()
+    if backend == "redis":
+        return RegistroJobsRedis()
+    raise ValueError(f"Backend de jobs de indexação desconhecido: {backend}")
+
+
+class FilaIndexacao:
+    """
+    Fila limitada de jobs de indexação e o pool de workers que a consome
+
+    bases: BasesLojistas da API (backend e troca do índice carregado). Os
+    workers e o registro compartilhado dos jobs (job_backend) são criados
+    no primeiro uso, uma vez por processo.
+    """
+
+    def __init__(
+        self,
+        bases,
+        workers=INGEST_WORKERS,
+        queue_size=INGEST_QUEUE_SIZE,
+        concorrencia=INGEST_CONCURRENCY,
+        max_jobs=INGEST_MAX_JOBS,
+        client=None,
+        job_backend=INGEST_JOB_BACKEND,
+    ):
+        self.bases = bases
+        self.workers = max(1, workers)
+        self.concorrencia = max(1, concorrencia)
+        self.max_jobs = max_jobs
+        self.client = client
+        self.job_backend = job_backend
+        self.fila = queue.Queue(maxsize=queue_size)
+        self.jobs = OrderedDict()
+        self.submitted = 0
+        self.rejected = 0
+        self.done = 0
+        self.failed = 0
+        self.running = 0
+        self.chunks_indexed = 0
+        self.busy_seconds = 0.0
+        self._threads = []
+        self._pid = None
+        self._registro = None
+        self._registro_pid = None
+        self._lock = threading.Lock()
+        self._registro_lock = threading.Lock()
+        self._locks_lojistas = {}
+
+    def _iniciar_workers(self):
+        """Cria os workers (de novo em um processo criado por fork)"""
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._threads = [
+            threading.Thread(target=self._trabalhar, name=f"indexacao-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _registro_do_processo(self):
+        """Registro compartilhado dos jobs (de novo em um processo criado por fork)"""
+        with self._registro_lock:
+            if self._registro_pid != os.getpid():
+                self._registro = criar_registro_jobs(self.job_backend)
+                self._registro_pid = os.getpid()
+            return self._registro
+
+    def _publicar(self, job):
+        try:
+            registro = self._registro_do_processo()
+            if registro is not None:
+                registro.salvar(job.estado())
+        except Exception as e:
+            # O job segue; só os outros workers deixam de ver o progresso
+            logger.warning(f"Estado do job {job.id} não publicado: {e!r}")
+
+    def enviar(self, merchant_id, documents):
+        """Valida e enfileira os documentos; retorna o job (ValueError, FilaCheia)"""
+        job = JobIndexacao(validar_id(merchant_id), validar_documentos(documents))
+        job.publicar = self._publicar
+        # Publicado antes de entrar na fila: o worker pode começar em seguida
+        job.atualizar()
+        with self._lock:
+            self._iniciar_workers()
+            try:
+                self.fila.put_nowait(job)
+            except queue.Full:
+                self.rejected += 1
+                raise FilaCheia(f"Fila de indexação cheia ({self.fila.maxsize} jobs)")
+            self.jobs[job.id] = job
+            self.submitted += 1
+            self._limitar_jobs()
+        return job
+
+    def _limitar_jobs(self):
+        """Esquece os jobs terminados mais antigos além de max_jobs (com o lock)"""
+        excesso = len(self.jobs) - self.max_jobs
+        for job_id in list(self.jobs):
+            if excesso <= 0:
+                break
+            if self.jobs[job_id].status in ("done", "failed"):
+                del self.jobs[job_id]
+                excesso -= 1
+
+    def job(self, job_id):
+        """Job deste worker ou, com registro compartilhado, de qualquer worker"""
+        job = self.jobs.get(job_id)
+        if job is None:
+            registro = self._registro_do_processo()
+            estado = registro.ler(job_id) if registro is not None else None
+            if estado is not None:
+                job = JobIndexacao.de_estado(estado)
+        return job
+
+    def _trabalhar(self):
+        while True:
+            job = self.fila.get()
+            try:
+                self.executar(job)
+            finally:
+                self.fila.task_done()
+
+    def executar(self, job):
+        """Roda o job na thread atual (os workers chamam para cada job da fila)"""
+        with self._lock:
+            lock = self._locks_lojistas.setdefault(job.merchant_id, threading.Lock())
+        # Dois jobs do mesmo lojista gravariam o mesmo snapshot e manifesto: o
+        # lock de arquivo vale para os outros workers da máquina (e o rag.py)
+        with lock, bloqueio_colecao(collection_do_lojista(job.merchant_id)):
+            with self._lock:
+                self.running += 1
+            job.status, job.started = "running", time.time()
+            job.atualizar()
+            try:
+                client = self.client or get_ingestion_openai_client(pool_size=self.concorrencia)
+                indexar_lojista(job, self.bases.backend, client, self.concorrencia)
+                self.bases.recarregar(job.merchant_id)
+                job.status = "done"
+            except Exception as e:
+                logger.error(f"Erro no job de indexação {job.id} ({job.merchant_id}): {e!r}")
+                job.status, job.error = "failed", repr(e)
+            finally:
+                job.finished = time.time()
+                job.stage = None
+                # Os textos já estão no índice; o job guarda só as contagens
+                job.documents = None
+                job.atualizar()
+                with self._lock:
+                    self.running -= 1
+                    self.chunks_indexed += job.chunks_done
+                    self.busy_seconds += job.seconds
+                    if job.status == "done":
+                        self.done += 1
+                    else:
+                        self.failed += 1
+        logger.info(
+            f"Job {job.id} ({job.merchant_id}): {job.status}, {job.chunks_done}/"
+            f"{job.chunks_total} chunks em {job.seconds:.2f}s"
+        )
+        return job
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "concurrency": self.concorrencia,
+            "queued": self.fila.qsize(),
+            "max_queued": self.fila.maxsize,
+            "running": self.running,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "done": self.done,
+            "failed": self.failed,
+            "chunks_indexed": self.chunks_indexed,
+            "chunks_per_second": self.chunks_indexed / self.busy_seconds if self.busy_seconds > 0 else 0.0,
+        }
@@ -0,0 +1,178 @@
+"""
+Pipeline de ingestão em lote para a base de conhecimento
+
+Em vez de uma chamada de embedding e um upsert por chunk, os chunks são
+agrupados em lotes limitados por tokens, os lotes são embedados com
+concorrência limitada e cada lote é gravado no Chroma com um único upsert.
+Um lote que falha (no embedding ou no upsert) é tentado novamente sem
+reiniciar a ingestão inteira.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+
+from chunking import EMBEDDING_MODEL
+from tokens import count_tokens, truncate_tokens
+
+# Limites por requisição de embedding (a API aceita até 2048 entradas e
+# 300k tokens; ficamos bem abaixo para manter cada requisição rápida)
+MAX_TOKENS_POR_LOTE = 8000
+MAX_ITENS_POR_LOTE = 128
+# Tamanho máximo de uma entrada individual aceito pelo modelo
+MAX_TOKENS_POR_ENTRADA = 8191
+
+CONCORRENCIA = 4
+TENTATIVAS = 3
+ESPERA_BASE = 0.5
+
+
+def montar_lotes(
+    chunks,
+    max_tokens=MAX_TOKENS_POR_LOTE,
+    max_itens=MAX_ITENS_POR_LOTE,
+    model_name=EMBEDDING_MODEL,
+):
+    """
+    Agrupa os chunks em lotes limitados por tokens e por quantidade
+
+    Um chunk maior que MAX_TOKENS_POR_ENTRADA tem o texto cortado no limite
+    do modelo; a API recusaria a requisição do lote inteiro.
+    """
+    lotes = []
+    atual = []
+    tokens_atual = 0
+    for chunk in chunks:
+        tokens = count_tokens(chunk["text"], model_name)
+        if tokens > MAX_TOKENS_POR_ENTRADA:
+            texto = truncate_tokens(chunk["text"], MAX_TOKENS_POR_ENTRADA, model_name)
+            chunk = {**chunk, "text": texto}
+            tokens = count_tokens(texto, model_name)
+        if atual and (
+            tokens_atual + tokens > max_tokens or len(atual) >= max_itens
+        ):
+            lotes.append(atual)
+            atual = []
+            tokens_atual = 0
+        atual.append(chunk)
+        tokens_atual += tokens
+    if atual:
+        lotes.append(atual)
+    return lotes
+
+
+def embed_textos(client, textos, model_name=EMBEDDING_MODEL):
+    """Gera os embeddings de vários textos em uma única requisição"""
+    response = client.embeddings.create(input=textos, model=model_name)
+    # A API devolve um item por entrada; ordena pelo índice por segurança
+    data = sorted(response.data, key=lambda item: item.index)
+    return [item.embedding for item in data]
+
+
+def _com_retry(funcao, tentativas, espera_base, stats, lock, contador):
+    """Chama funcao() tentando novamente com backoff exponencial e jitter"""
+    for tentativa in range(1, tentativas + 1):
+        with lock:
+            stats[contador] += 1
+        try:
+            return funcao()
+        except Exception:
+            if tentativa == tentativas:
+                raise
+            with lock:
+                stats["retries"] += 1
+            time.sleep(espera_base * (2 ** (tentativa - 1)) * random.uniform(0.5, 1.5))
+
+
+def executar_ingestao(
+    chunks,
+    client,
+    collection,
+    model_name=EMBEDDING_MODEL,
+    max_tokens=MAX_TOKENS_POR_LOTE,
+    max_itens=MAX_ITENS_POR_LOTE,
+    concorrencia=CONCORRENCIA,
+    tentativas=TENTATIVAS,
+    espera_base=ESPERA_BASE,
+):
+    """
+    Embeda e grava os chunks ({"id", "text"}) no Chroma em lotes
+
+    Os embeddings rodam em até `concorrencia` lotes simultâneos; os upserts
+    acontecem na thread principal, conforme cada lote fica pronto. Embedding
+    e upsert são tentados novamente; um lote que ainda falha fica em
+    failed_batches/failed_ids e a ingestão segue. Retorna um dicionário com
+    as estatísticas da execução.
+    """
+    inicio = time.perf_counter()
+    lotes = montar_lotes(chunks, max_tokens, max_itens, model_name)
+    stats = {
+        "chunks": len(chunks),
+        "batches": len(lotes),
+        "embedding_requests": 0,
+        "upsert_requests": 0,
+        "retries": 0,
+        "failed_batches": [],
+        "failed_chunks": 0,
+        "failed_ids": [],
+    }
+    lock = threading.Lock()
+
+    with ThreadPoolExecutor(max_workers=max(1, concorrencia)) as executor:
+        futures = {
+            executor.submit(
+                _com_retry,
+                partial(embed_textos, client, [chunk["text"] for chunk in lote], model_name),
+                tentativas,
+                espera_base,
+                stats,
+                lock,
+                "embedding_requests",
+            ): (numero, lote)
+            for numero, lote in enumerate(lotes)
+        }
+        for future in as_completed(futures):
+            numero, lote = futures[future]
+            try:
+                embeddings = future.result()
+                _com_retry(
+                    partial(
+                        collection.upsert,
+                        ids=[chunk["id"] for chunk in lote],
+                        documents=[chunk["text"] for chunk in lote],
+                        embeddings=embeddings,
+                    ),
+                    tentativas,
+                    espera_base,
+                    stats,
+                    lock,
+                    "upsert_requests",
+                )
+            except Exception as e:
+                print(f"❌ Lote {numero} falhou após {tentativas} tentativas: {e}")
+                stats["failed_batches"].append(numero)
+                stats["failed_chunks"] += len(lote)
+                stats["failed_ids"].extend(chunk["id"] for chunk in lote)
+
+    stats["seconds"] = time.perf_counter() - inicio
+    indexados = stats["chunks"] - stats["failed_chunks"]
+    stats["chunks_per_second"] = (
+        indexados / stats["seconds"] if stats["seconds"] > 0 else 0.0
+    )
+    return stats
+
+
+def imprimir_estatisticas(stats):
+    """Mostra um resumo da ingestão"""
+    print(
+        f"✅ {stats['chunks'] - stats['failed_chunks']}/{stats['chunks']} chunks indexados "
+        f"em {stats['seconds']:.2f}s ({stats['chunks_per_second']:.1f} chunks/s)"
+    )
+    print(
+        f"   {stats['batches']} lotes | {stats['embedding_requests']} requisições de embedding | "
+        f"{stats['upsert_requests']} upserts | {stats['retries']} retentativas"
+    )
+    if stats["failed_batches"]:
+        print(f"   ⚠️ Lotes com falha: {stats['failed_batches']}")
@@ -0,0 +1,148 @@
+"""
+Inicialização do motor em segundo plano e prontidão das APIs
+
+Criar o motor conecta ao Chroma (get_or_create_collection), carrega o
+snapshot e o índice BM25 e varre a pasta docs/; aquecer o roteador de
+intenções embeda os exemplos. Nada disso roda no import do app nem antes
+de a porta abrir: a primeira requisição (ou o servidor, ao subir) dispara
+a inicialização em uma thread, e enquanto ela não termina
+
+- GET /health (liveness) responde 200
+- GET /ready (readiness) responde 503 e os endpoints do chat também,
+  com Retry-After
+
+Assim o app funciona em qualquer servidor WSGI/ASGI (gunicorn, uvicorn,
+waitress...), não só com `python api_chat.py`. Se a criação do motor
+falhar (Chroma fora do ar, por exemplo), uma nova tentativa é feita a
+cada STARTUP_RETRY_DELAY segundos. O tempo até ficar pronto (desde o
+import do app) aparece em /stats, em /ready e no /metrics (rag_startup_time_to_ready_s).
+"""
+
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Segundos entre as tentativas de criar o motor
+STARTUP_RETRY_DELAY = float(os.getenv("STARTUP_RETRY_DELAY", "5"))
+# Aquece os componentes (centroides das intenções) antes de ficar pronto
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "true").lower() == "true"
+
+
+def aquecer_intencoes(motor):
+    """Embeda os exemplos das intenções (uma chamada à OpenAI) antes do primeiro pedido"""
+    router = motor.intent_router
+    if router is not None and not router.preparado:
+        router.centroides(motor.query_embedding_fn)
+
+
+ETAPAS_AQUECIMENTO = [("intents", aquecer_intencoes)]
+
+
+class Inicializacao:
+    """
+    Cria e aquece o motor uma vez por processo, fora do caminho das requisições
+
+    criar(): retorna o motor; etapas: [(nome, funcao(motor))] de
+    aquecimento. Uma etapa que falha só gera um aviso (o componente é
+    preparado no primeiro pedido); uma falha em criar() é tentada de novo.
+    """
+
+    def __init__(self, criar, etapas=None, retry_delay=STARTUP_RETRY_DELAY):
+        self.criar = criar
+        if etapas is None:
+            etapas = ETAPAS_AQUECIMENTO if STARTUP_WARMUP else []
+        self.etapas = etapas
+        self.retry_delay = retry_delay
+        self.motor = None
+        self.estado = "pending"
+        self.erro = None
+        self.tentativas = 0
+        self.duracoes = {}
+        self.inicio = time.monotonic()
+        self.time_to_ready = None
+        self._pronto = threading.Event()
+        self._lock = threading.Lock()
+        self._lock_execucao = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    @property
+    def pronto(self):
+        return self.motor is not None
+
+    def executar(self):
+        """Cria e aquece o motor na thread atual (uma tentativa); retorna o motor"""
+        with self._lock_execucao:
+            if self.motor is not None:
+                return self.motor
+            self.estado = "starting"
+            self.tentativas += 1
+            try:
+                inicio = time.perf_counter()
+                motor = self.criar()
+                self.duracoes["engine"] = time.perf_counter() - inicio
+            except Exception as e:
+                self.estado, self.erro = "failed", repr(e)
+                raise
+            for nome, etapa in self.etapas:
+                inicio = time.perf_counter()
+                try:
+                    etapa(motor)
+                except Exception as e:
+                    logger.warning(f"Aquecimento '{nome}' falhou: {e!r}")
+                self.duracoes[nome] = time.perf_counter() - inicio
+            self.time_to_ready = time.monotonic() - self.inicio
+            self.estado, self.erro = "ready", None
+            self.motor = motor
+            self._pronto.set()
+            logger.info(f"Motor pronto em {self.time_to_ready:.2f}s ({self.tentativas} tentativa(s))")
+            return motor
+
+    def _executar_ate_conseguir(self):
+        while self.motor is None:
+            try:
+                self.executar()
+            except Exception as e:
+                logger.error(
+                    f"Erro ao inicializar o motor: {e!r}; nova tentativa em {self.retry_delay:g}s"
+                )
+                time.sleep(self.retry_delay)
+
+    def iniciar(self):
+        """
+        Dispara a inicialização em uma thread, se ainda não foi disparada
+
+        Barato o bastante para rodar em toda requisição. Um worker criado
+        por fork depois do disparo (gunicorn --preload) não herda a thread:
+        a inicialização é disparada de novo no novo processo.
+        """
+        if self.motor is not None:
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Depois do fork o lock pode ter vindo preso pela thread do pai
+                self._lock_execucao = threading.Lock()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._executar_ate_conseguir, name="inicializacao", daemon=True
+            )
+            self._thread.start()
+
+    def aguardar(self, timeout=None):
+        """Espera o motor ficar pronto; retorna se ficou"""
+        return self._pronto.wait(timeout)
+
+    def stats(self):
+        return {
+            "state": self.estado,
+            "ready": self.pronto,
+            "attempts": self.tentativas,
+            "time_to_ready_s": self.time_to_ready,
+            "error": self.erro,
+            "steps_s": dict(self.duracoes),
+        }
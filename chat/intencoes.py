@@ -0,0 +1,291 @@
+"""
+Roteador de intenções: respostas prontas sem chamar o LLM
+
+Boa parte das mensagens é uma saudação, um pedido de ajuda ou uma das
+objeções que a base de conhecimento já responde com um texto aprovado
+("Frete muito caro", "E se não chegar?"). O roteador reconhece essas
+intenções e devolve a resposta pronta; só as perguntas abertas seguem para
+o gpt-4o-mini.
+
+A classificação tem duas etapas:
+
+1. regras de palavras-chave sobre o texto normalizado (sem custo: roda
+   antes da busca)
+2. centroide mais próximo: o embedding da pergunta (o mesmo da busca) é
+   comparado com a média dos embeddings dos exemplos de cada intenção, e a
+   intenção só é aceita acima de INTENT_THRESHOLD e com INTENT_MARGIN de
+   vantagem sobre a segunda
+
+As intenções de objeção e suas respostas vêm dos documentos (blocos
+"### OBJEÇÃO: ..." seguidos de "**Resposta**: ..."), então uma mudança na
+base muda também as respostas prontas. Os acertos por intenção aparecem em
+stats().
+"""
+
+import os
+import re
+import threading
+
+import numpy as np
+
+from busca_lexical import sem_acentos
+from mensagem_boas_vindas import get_mensagem_boas_vindas
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+DOCS_DIR = os.path.join(base_dir, "docs")
+
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "true").lower() == "true"
+INTENT_THRESHOLD = float(os.getenv("INTENT_THRESHOLD", "0.80"))
+INTENT_MARGIN = float(os.getenv("INTENT_MARGIN", "0.03"))
+
+OBJECAO = re.compile(r'^#{2,}\s*OBJEÇÃO:\s*"?(.+?)"?\s*$')
+RESPOSTA = re.compile(r'^\*\*Resposta\*\*:\s*"?(.+?)"?\s*$')
+TITULO = re.compile(r"^#{1,6}\s")
+
+# Exemplos de perguntas (comando 'ajuda' do terminal e intenção "ajuda")
+EXEMPLOS_PERGUNTAS = [
+    (
+        "🎯 SOBRE OBJEÇÕES DE VENDAS",
+        [
+            "E se não funcionar comigo?",
+            "Está muito caro para um curso online",
+            "Não tenho tempo para fazer o curso",
+            "Como sei se o conteúdo é bom?",
+            "E se não conseguir aprender?",
+        ],
+    ),
+    (
+        "☕ SOBRE O PRODUTO 'MENOS CAFÉ MAIS CHÁ'",
+        [
+            "Como funciona o método de 21 dias?",
+            "Quais são os benefícios do chá?",
+            "Como preparar o chá corretamente?",
+            "Quais chás são recomendados?",
+            "E se eu não conseguir largar o café?",
+        ],
+    ),
+    (
+        "🛒 SOBRE CHECKOUT",
+        [
+            "E se não chegar?",
+            "Como sei que é original?",
+            "Frete muito caro",
+            "Não tenho limite no cartão",
+        ],
+    ),
+]
+
+# Outras formas comuns de fazer as objeções dos documentos (texto da objeção -> exemplos)
+EXEMPLOS_OBJECOES = {
+    "E se não chegar?": ["E se o produto não chegar?", "E se meu pedido não chegar?"],
+    "Como sei se é original?": ["Como sei que é original?", "É original mesmo?"],
+    "Frete muito caro": ["O frete está muito caro", "Frete caro demais"],
+    "Não tenho limite no cartão": ["Estou sem limite no cartão", "Meu cartão não tem limite"],
+}
+
+
+def normalizar(texto):
+    """Minúsculas, sem acentos e sem pontuação, com espaços simples"""
+    return " ".join(re.findall(r"[^\W_]+", sem_acentos(texto)))
+
+
+class Intencao:
+    """Intenção com resposta pronta"""
+
+    def __init__(self, name, answer, examples=(), pattern=None):
+        self.name = name
+        self.answer = answer
+        self.examples = list(examples)
+        # Regra: regex sobre o texto normalizado, ou os próprios exemplos
+        self.pattern = re.compile(pattern) if pattern else None
+        self._exatos = {normalizar(exemplo) for exemplo in self.examples}
+
+    def casa_regra(self, normalizado):
+        if self.pattern is not None and self.pattern.fullmatch(normalizado):
+            return True
+        return normalizado in self._exatos
+
+
+def texto_ajuda():
+    partes = ["Posso te ajudar com dúvidas como estas 😊"]
+    for titulo, exemplos in EXEMPLOS_PERGUNTAS:
+        partes.append(f"\n{titulo}:")
+        partes.extend(f"• '{exemplo}'" for exemplo in exemplos)
+    return "\n".join(partes)
+
+
+def intencoes_fixas():
+    """Saudação, ajuda e agradecimento"""
+    return [
+        Intencao(
+            "saudacao",
+            get_mensagem_boas_vindas()["content"],
+            ["Oi", "Olá, tudo bem?", "Bom dia", "Boa tarde", "Boa noite"],
+            r"(oi+|ola|opa|hey|hello|hi|e ai|bom dia|boa tarde|boa noite)( tudo bem| tudo bom)?",
+        ),
+        Intencao(
+            "ajuda",
+            texto_ajuda(),
+            ["Ajuda", "O que você pode fazer?", "Quais perguntas posso fazer?"],
+            r"(ajuda|help|menu|socorro|o que (voce|vc) (pode fazer|faz))",
+        ),
+        Intencao(
+            "agradecimento",
+            "Eu que agradeço! 💚 Se surgir qualquer dúvida sobre o "
+            "'Menos Café Mais Chá', é só me chamar. 🍃",
+            ["Obrigado", "Muito obrigada", "Valeu"],
+            r"(muito )?(obrigad[oa]|brigad[oa]|valeu|vlw)( mesmo)?",
+        ),
+    ]
+
+
+def objecoes_do_texto(texto):
+    """Lista de (objeção, resposta) dos blocos "### OBJEÇÃO" do documento"""
+    objecoes, atual = [], None
+    for linha in texto.splitlines():
+        linha = linha.strip()
+        titulo = OBJECAO.match(linha)
+        if titulo:
+            atual = titulo.group(1)
+        elif TITULO.match(linha):
+            atual = None
+        elif atual is not None:
+            resposta = RESPOSTA.match(linha)
+            if resposta:
+                objecoes.append((atual, resposta.group(1)))
+                atual = None
+    return objecoes
+
+
+def intencoes_dos_documentos(docs_dir=DOCS_DIR):
+    """Uma intenção por objeção dos documentos, com a resposta aprovada"""
+    intencoes = {}
+    if not os.path.isdir(docs_dir):
+        return []
+    for filename in sorted(os.listdir(docs_dir)):
+        if not filename.endswith((".txt", ".md")):
+            continue
+        with open(os.path.join(docs_dir, filename), "r", encoding="utf-8") as file:
+            texto = file.read()
+        for objecao, resposta in objecoes_do_texto(texto):
+            name = "objecao:" + normalizar(objecao).replace(" ", "_")
+            # A mesma objeção em dois documentos fica com a primeira resposta
+            intencoes.setdefault(
+                name,
+                Intencao(name, resposta, [objecao, *EXEMPLOS_OBJECOES.get(objecao, [])]),
+            )
+    return list(intencoes.values())
+
+
+class IntentRouter:
+    """Classificador local de intenções (regras + centroide mais próximo)"""
+
+    def __init__(self, intencoes, threshold=INTENT_THRESHOLD, margin=INTENT_MARGIN):
+        self.intencoes = list(intencoes)
+        self.threshold = threshold
+        self.margin = margin
+        self.requests = 0
+        self.by_rule = 0
+        self.by_embedding = 0
+        self.hits = {intencao.name: 0 for intencao in self.intencoes}
+        self._centroides = None
+        self._lock = threading.Lock()
+        self._lock_centroides = threading.Lock()
+
+    def por_regra(self, question):
+        """Intenção cuja regra de palavras-chave casa com a pergunta, ou None"""
+        normalizado = normalizar(question)
+        if not normalizado:
+            return None
+        for intencao in self.intencoes:
+            if intencao.casa_regra(normalizado):
+                return intencao
+        return None
+
+    @property
+    def preparado(self):
+        """Os centroides já foram calculados?"""
+        return self._centroides is not None
+
+    def centroides(self, embedding_function):
+        """Matriz (intenções x dimensão) com o centroide normalizado de cada intenção"""
+        with self._lock_centroides:
+            if self._centroides is None:
+                exemplos = [e for intencao in self.intencoes for e in intencao.examples]
+                vetores = np.asarray(embedding_function(exemplos), dtype=np.float32)
+                vetores /= np.linalg.norm(vetores, axis=1, keepdims=True)
+                centroides, inicio = [], 0
+                for intencao in self.intencoes:
+                    fim = inicio + len(intencao.examples)
+                    centroides.append(vetores[inicio:fim].mean(axis=0))
+                    inicio = fim
+                matriz = np.vstack(centroides)
+                matriz /= np.linalg.norm(matriz, axis=1, keepdims=True)
+                self._centroides = matriz
+            return self._centroides
+
+    def por_embedding(self, embedding, embedding_function):
+        """
+        Intenção do centroide mais próximo do embedding da pergunta, ou None
+
+        Na primeira chamada os exemplos são embedados (em um único lote, pela
+        função com cache) para montar os centroides.
+        """
+        centroides = self.centroides(embedding_function)
+        query = np.asarray(embedding, dtype=np.float32)
+        norma = np.linalg.norm(query)
+        if not norma or not len(centroides):
+            return None
+        scores = centroides @ (query / norma)
+        ordem = np.argsort(-scores)
+        melhor = scores[ordem[0]]
+        segundo = scores[ordem[1]] if len(ordem) > 1 else -1.0
+        if melhor < self.threshold or melhor - segundo < self.margin:
+            return None
+        return self.intencoes[ordem[0]]
+
+    def registrar(self, intencao, via=None):
+        """Conta uma mensagem; intencao None quando ela seguiu para o LLM"""
+        with self._lock:
+            self.requests += 1
+            if intencao is None:
+                return
+            self.hits[intencao.name] += 1
+            if via == "regra":
+                self.by_rule += 1
+            else:
+                self.by_embedding += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.requests
+            routed = self.by_rule + self.by_embedding
+            return {
+                "intents": len(self.intencoes),
+                "threshold": self.threshold,
+                "requests": total,
+                "routed": routed,
+                "routed_rate": routed / total if total else 0.0,
+                "by_rule": self.by_rule,
+                "by_embedding": self.by_embedding,
+                "hits": {
+                    name: {"hits": hits, "hit_rate": hits / total if total else 0.0}
+                    for name, hits in self.hits.items()
+                    if hits
+                },
+            }
+
+
+_intent_router = None
+_intent_router_lock = threading.Lock()
+
+
+def get_intent_router():
+    """Retorna o roteador de intenções do processo (None se desativado)"""
+    global _intent_router
+    if not INTENT_ROUTER_ENABLED:
+        return None
+    with _intent_router_lock:
+        if _intent_router is None:
+            _intent_router = IntentRouter(intencoes_fixas() + intencoes_dos_documentos())
+        return _intent_router
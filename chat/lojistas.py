@@ -0,0 +1,415 @@
+"""
+Bases de conhecimento por lojista (multi-tenant)
+
+Cada lojista (merchant_id do backend) tem o próprio índice, a coleção
+texto_gerado_<merchant_id> no Chroma ou o snapshot dela em
+TENANT_SNAPSHOT_DIR (conforme TENANT_BACKEND), e o próprio prompt, com o
+nome do produto. A configuração fica em TENANTS_DIR/<merchant_id>.json,
+toda opcional:
+
+    {
+      "display_name": "Loja da Ana",
+      "product": "Menos Café Mais Chá",
+      "prompt": "Você é o assistente da Loja da Ana... '{produto}'...",
+      "products": {
+        "<product_id>": {"name": "Kit Chá Verde", "prompt": "..."}
+      },
+      "docs": "docs_loja_ana"
+    }
+
+"prompt" é um modelo com {produto}; sem ele vale o prompt de vendas padrão
+(contexto.PROMPT_VENDAS_MODELO). "docs" é a pasta com os .txt do lojista
+(relativa a TENANTS_DIR), usada por 'rag.py --merchant ... index' sem
+--docs. Um lojista existe se tiver o arquivo de
+configuração ou um índice (o snapshot ou o manifesto da coleção).
+
+Os índices são carregados sob demanda, no primeiro pedido do lojista, e
+ficam em um LRU limitado pelo número de lojistas (TENANT_MAX_LOADED) e pela
+memória estimada dos índices (TENANT_MAX_MB); um lojista sem pedidos há
+TENANT_IDLE_TTL segundos é descarregado. Assim um processo atende milhares
+de lojistas com só os ativos em memória. Quando o índice muda em disco
+(POST /ingest, rag.py), o lojista é recarregado no próximo pedido, em
+todos os workers.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import cache
+from cache import (
+    ANSWER_CACHE_SIZE,
+    ANSWER_CACHE_THRESHOLD,
+    ANSWER_CACHE_TTL,
+    ANSWER_FALLBACK_THRESHOLD,
+    SemanticAnswerCache,
+)
+from chunking import EMBEDDING_MODEL
+from clientes import (
+    COLLECTION_NAME,
+    get_chroma_client,
+    get_chroma_embedding_function,
+    get_query_embedding_fn,
+)
+from contexto import PRODUTO_PADRAO, PROMPT_VENDAS_MODELO
+from manifesto import caminho_manifesto
+from retriever import SNAPSHOT_DIR, caminho_snapshot, criar_retriever
+
+TENANTS_DIR = os.getenv(
+    "TENANTS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "tenants")
+)
+TENANT_MAX_LOADED = int(os.getenv("TENANT_MAX_LOADED", "100"))
+TENANT_MAX_MB = float(os.getenv("TENANT_MAX_MB", "512"))
+# Segundos sem pedidos até o índice do lojista ser descarregado (0 desliga)
+TENANT_IDLE_TTL = float(os.getenv("TENANT_IDLE_TTL", "1800"))
+TENANT_BACKEND = os.getenv("TENANT_BACKEND") or os.getenv("RETRIEVER_BACKEND", "chroma")
+TENANT_SNAPSHOT_DIR = os.getenv("TENANT_SNAPSHOT_DIR", SNAPSHOT_DIR)
+# Segundos entre as verificações de que o índice carregado mudou em disco
+TENANT_RELOAD_CHECK = float(os.getenv("TENANT_RELOAD_CHECK", "2"))
+
+# Letras, dígitos, "_", "-" e "." (CPF), começando e terminando com letra ou
+# dígito: vale como nome de arquivo e de coleção do Chroma
+ID_VALIDO = re.compile(r"^[A-Za-z0-9](?:[A-Za-z0-9_.-]{0,46}[A-Za-z0-9])?$")
+
+SEM_RESULTADOS_MODELO = (
+    "Não encontrei informações relevantes para sua pergunta. "
+    "Tente reformular ou perguntar sobre o produto '{produto}'."
+)
+
+
+class LojistaDesconhecido(LookupError):
+    """Lojista ou produto sem configuração nem índice"""
+
+
+def validar_id(valor, campo="merchant_id"):
+    if not isinstance(valor, str) or not ID_VALIDO.match(valor) or ".." in valor:
+        raise ValueError(f"{campo} inválido: use letras, dígitos, '_', '-' ou '.' (até 48)")
+    return valor
+
+
+def collection_do_lojista(merchant_id):
+    """Nome da coleção (e do snapshot) do lojista"""
+    return f"{COLLECTION_NAME}_{validar_id(merchant_id)}"
+
+
+def caminho_snapshot_lojista(merchant_id):
+    return caminho_snapshot(collection_do_lojista(merchant_id), TENANT_SNAPSHOT_DIR)
+
+
+def caminho_config(merchant_id):
+    return os.path.join(TENANTS_DIR, f"{validar_id(merchant_id)}.json")
+
+
+def versao_indice(merchant_id, backend=TENANT_BACKEND):
+    """
+    Versão do índice do lojista em disco (None se não houver)
+
+    O mtime do snapshot no backend local; no Chroma, o do manifesto da
+    coleção, regravado a cada indexação.
+    """
+    if backend == "local":
+        caminho = caminho_snapshot_lojista(merchant_id)
+    else:
+        caminho = caminho_manifesto(collection_do_lojista(merchant_id))
+    try:
+        return os.stat(caminho).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def carregar_config(merchant_id, backend=TENANT_BACKEND):
+    """Configuração do lojista ({} sem arquivo); LojistaDesconhecido se não existir"""
+    caminho = caminho_config(merchant_id)
+    if os.path.exists(caminho):
+        with open(caminho, "r", encoding="utf-8") as file:
+            return json.load(file)
+    if versao_indice(merchant_id, backend) is not None:
+        return {}
+    raise LojistaDesconhecido(f"Lojista não encontrado: {merchant_id}")
+
+
+def pasta_docs(merchant_id):
+    """Pasta de documentos da configuração do lojista, ou None se não houver"""
+    try:
+        docs = carregar_config(merchant_id).get("docs")
+    except LojistaDesconhecido:
+        return None
+    return os.path.join(TENANTS_DIR, docs) if docs else None
+
+
+def chave_sessao(session_id, merchant_id=None):
+    """Sessões de lojistas diferentes nunca se misturam, mesmo com o mesmo session_id"""
+    return f"{merchant_id}:{session_id}" if merchant_id and session_id else session_id
+
+
+def produto_do_lojista(config, product_id=None):
+    """(nome do produto, prompt do sistema) do produto pedido ou do padrão do lojista"""
+    produto = {}
+    if product_id is not None:
+        produto = config.get("products", {}).get(validar_id(product_id, "product_id"))
+        if produto is None:
+            raise LojistaDesconhecido(f"Produto não encontrado: {product_id}")
+    nome = produto.get("name") or config.get("product") or PRODUTO_PADRAO
+    modelo = produto.get("prompt") or config.get("prompt") or PROMPT_VENDAS_MODELO
+    return nome, modelo.format(produto=nome)
+
+
+def estimar_bytes(retriever):
+    """Memória aproximada do índice: matriz de embeddings, textos e BM25"""
+    total = 0
+    vetorial = getattr(retriever, "retriever", retriever)
+    matrix = getattr(vetorial, "matrix", None)
+    if matrix is not None:
+        total += matrix.nbytes
+    lexical = getattr(retriever, "lexical_index", None)
+    if lexical is not None:
+        # Textos mais o índice invertido, da ordem de duas vezes o texto
+        total += 3 * sum(len(texto) for texto in lexical.documents)
+    return total
+
+
+class BaseLojista:
+    """Índice carregado de um lojista e os motores de cada produto"""
+
+    def __init__(self, merchant_id, config, retriever, versao=None):
+        self.merchant_id = merchant_id
+        self.config = config
+        self.retriever = retriever
+        self.versao = versao
+        self.bytes = estimar_bytes(retriever)
+        self.motores = {}
+        self.ultimo_uso = self.verificado = time.monotonic()
+        self._lock = threading.Lock()
+
+    def motor(self, product_id, criar):
+        """Motor do produto (criado na primeira vez com o retriever do lojista)"""
+        with self._lock:
+            motor = self.motores.get(product_id)
+            if motor is None:
+                nome, prompt = produto_do_lojista(self.config, product_id)
+                answer_cache = None
+                if cache.ANSWER_CACHE_ENABLED:
+                    answer_cache = SemanticAnswerCache(
+                        ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL,
+                        ANSWER_FALLBACK_THRESHOLD,
+                    )
+                # O roteador de intenções tem as respostas prontas do produto
+                # padrão: os lojistas usam só o índice e o prompt próprios
+                motor = criar(
+                    retriever=self.retriever,
+                    answer_cache=answer_cache,
+                    intent_router=None,
+                    system_prompt=prompt,
+                    sem_resultados=SEM_RESULTADOS_MODELO.format(produto=nome),
+                )
+                motor.collection_name = collection_do_lojista(self.merchant_id)
+                self.motores[product_id] = motor
+            return motor
+
+
+class BasesLojistas:
+    """
+    LRU dos índices dos lojistas, carregados sob demanda
+
+    criar(**componentes): cria o motor de um produto (MotorRAG ou
+    AsyncChatRAG, conforme a API).
+    """
+
+    def __init__(
+        self,
+        criar,
+        backend=TENANT_BACKEND,
+        max_loaded=TENANT_MAX_LOADED,
+        max_bytes=TENANT_MAX_MB * 1024 * 1024,
+        idle_ttl=TENANT_IDLE_TTL,
+        reload_check=TENANT_RELOAD_CHECK,
+    ):
+        self.criar = criar
+        self.backend = backend
+        self.max_loaded = max_loaded
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.reload_check = reload_check
+        self.hits = 0
+        self.loads = 0
+        self.reloads = 0
+        self.load_seconds = 0.0
+        self.evicted_lru = 0
+        self.evicted_idle = 0
+        self._bases = OrderedDict()
+        self._locks = {}  # merchant_id -> [lock da carga, quantos o usam]
+        self._lock = threading.Lock()
+
+    def _carregar(self, merchant_id):
+        # A versão é lida antes do índice: uma escrita no meio da carga
+        # provoca uma nova carga na próxima verificação
+        versao = versao_indice(merchant_id, self.backend)
+        config = carregar_config(merchant_id, self.backend)
+        collection = collection_do_lojista(merchant_id)
+        retriever = criar_retriever(
+            self.backend,
+            lambda: get_chroma_client(config.get("chroma", "cloud")).get_collection(
+                name=collection, embedding_function=get_chroma_embedding_function()
+            ),
+            get_query_embedding_fn(),
+            caminho_snapshot_lojista(merchant_id),
+            embedding_model=EMBEDDING_MODEL,
+        )
+        return BaseLojista(merchant_id, config, retriever, versao)
+
+    def _atual(self, base, agora):
+        """Se o índice carregado ainda é o do disco (conferido a cada reload_check)"""
+        if agora - base.verificado < self.reload_check:
+            return True
+        base.verificado = agora
+        return versao_indice(base.merchant_id, self.backend) == base.versao
+
+    @contextmanager
+    def _exclusivo(self, merchant_id):
+        """
+        Lock do lojista durante a carga do índice
+
+        Criado e contado sob o lock global, então quem chega durante uma carga
+        pega sempre o mesmo lock. Só sai do dicionário quando ninguém o usa e
+        o lojista não está carregado (IDs desconhecidos não acumulam locks).
+        """
+        with self._lock:
+            entrada = self._locks.setdefault(merchant_id, [threading.Lock(), 0])
+            entrada[1] += 1
+        try:
+            with entrada[0]:
+                yield
+        finally:
+            with self._lock:
+                entrada[1] -= 1
+                if entrada[1] == 0 and merchant_id not in self._bases:
+                    del self._locks[merchant_id]
+
+    def _remover(self, merchant_id):
+        """Tira o lojista do LRU e, se ninguém o usa, o lock dele (com o lock)"""
+        self._bases.pop(merchant_id, None)
+        entrada = self._locks.get(merchant_id)
+        if entrada is not None and entrada[1] == 0:
+            del self._locks[merchant_id]
+
+    def _descarregar_ociosos(self, agora):
+        """Remove do início do LRU os lojistas sem pedidos há idle_ttl (com o lock)"""
+        if not self.idle_ttl:
+            return
+        while self._bases:
+            merchant_id, base = next(iter(self._bases.items()))
+            if agora - base.ultimo_uso < self.idle_ttl:
+                break
+            self._remover(merchant_id)
+            self.evicted_idle += 1
+
+    def _limitar(self):
+        """Remove os menos usados até caber nos limites (com o lock; fica ao menos um)"""
+        while len(self._bases) > 1 and (
+            len(self._bases) > self.max_loaded or self.bytes() > self.max_bytes
+        ):
+            self._remover(next(iter(self._bases)))
+            self.evicted_lru += 1
+
+    def base(self, merchant_id):
+        """Base do lojista, carregando o índice se não estiver em memória"""
+        validar_id(merchant_id)
+        agora = time.monotonic()
+        with self._lock:
+            self._descarregar_ociosos(agora)
+            base = self._bases.get(merchant_id)
+            if base is not None and self._atual(base, agora):
+                self._bases.move_to_end(merchant_id)
+                base.ultimo_uso = agora
+                self.hits += 1
+                return base
+        # Um lock por lojista: carregar um índice não bloqueia os pedidos dos outros
+        with self._exclusivo(merchant_id):
+            with self._lock:
+                base = self._bases.get(merchant_id)
+            if base is None or base.versao != versao_indice(merchant_id, self.backend):
+                recarga = base is not None
+                inicio = time.perf_counter()
+                base = self._carregar(merchant_id)
+                with self._lock:
+                    self.loads += 1
+                    self.reloads += recarga
+                    self.load_seconds += time.perf_counter() - inicio
+                    self._bases[merchant_id] = base
+                    self._limitar()
+            else:
+                with self._lock:
+                    self.hits += 1
+            base.ultimo_uso = time.monotonic()
+            return base
+
+    def motor(self, merchant_id, product_id=None):
+        """Motor do produto do lojista (ValueError: ID inválido; LojistaDesconhecido)"""
+        return self.base(merchant_id).motor(product_id, self.criar)
+
+    def descartar(self, merchant_id):
+        """Descarrega o índice do lojista (o próximo pedido carrega a versão atual)"""
+        with self._lock:
+            carregado = merchant_id in self._bases
+            self._remover(merchant_id)
+            return carregado
+
+    def recarregar(self, merchant_id):
+        """
+        Carrega de novo o índice de um lojista em memória e troca o antigo
+
+        Roda fora do caminho dos pedidos (na indexação): os pedidos continuam
+        no índice antigo até a troca. Um lojista não carregado fica para o
+        primeiro pedido. Retorna se houve recarga.
+        """
+        with self._lock:
+            if merchant_id not in self._bases:
+                return False
+        with self._exclusivo(merchant_id):
+            inicio = time.perf_counter()
+            base = self._carregar(merchant_id)
+            with self._lock:
+                antiga = self._bases.get(merchant_id)
+                if antiga is None:
+                    return False
+                base.ultimo_uso = antiga.ultimo_uso
+                self._bases[merchant_id] = base
+                self.loads += 1
+                self.reloads += 1
+                self.load_seconds += time.perf_counter() - inicio
+                self._limitar()
+        return True
+
+    def invalidar_caches(self):
+        """Descarta os caches de respostas dos lojistas carregados"""
+        with self._lock:
+            bases = list(self._bases.values())
+        for base in bases:
+            for motor in list(base.motores.values()):
+                if motor.answer_cache is not None:
+                    motor.answer_cache.invalidate()
+
+    def bytes(self):
+        return sum(base.bytes for base in self._bases.values())
+
+    def stats(self):
+        with self._lock:
+            self._descarregar_ociosos(time.monotonic())
+            return {
+                "backend": self.backend,
+                "loaded": len(self._bases),
+                "max_loaded": self.max_loaded,
+                "bytes": self.bytes(),
+                "max_bytes": int(self.max_bytes),
+                "idle_ttl": self.idle_ttl,
+                "hits": self.hits,
+                "loads": self.loads,
+                "reloads": self.reloads,
+                "avg_load_ms": self.load_seconds / self.loads * 1000 if self.loads else 0.0,
+                "evicted_lru": self.evicted_lru,
+                "evicted_idle": self.evicted_idle,
+            }
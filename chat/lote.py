@@ -0,0 +1,298 @@
+"""
+Perguntas em lote (POST /chat/batch e `python rag.py batch`)
+
+Para reavaliar o bot depois de mudar o prompt ou os docs, centenas de
+objeções passam pelo pipeline de uma vez, em vez de uma chamada ao /chat
+(com o próprio embedding) por pergunta:
+
+1. as regras de intenção respondem o que casar, sem busca
+2. as demais perguntas são embedadas juntas: uma requisição por até
+   BATCH_EMBED_SIZE perguntas, passando pelo cache de embeddings
+3. a busca de todas é uma só (retriever.search_many): um produto de
+   matrizes no retriever local, uma consulta com todos os embeddings no
+   Chroma; o BM25 da busca híbrida continua por pergunta
+4. os completions rodam com no máximo BATCH_CONCURRENCY simultâneos
+
+As perguntas são independentes (sem histórico nem sessão) e, por padrão,
+não usam o cache de respostas: a ideia é ver as respostas do prompt e dos
+docs atuais. Os resultados saem em JSONL conforme ficam prontos, cada um
+com o tempo de espera e de geração; a última linha resume o lote.
+"""
+
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from metricas import registrar_resposta, span
+from motor import ERRO_RESPOSTA
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+# Completions simultâneos de um lote (o pedido pode pedir menos)
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+# Perguntas por requisição de embedding (a API aceita até 2048 entradas)
+BATCH_EMBED_SIZE = int(os.getenv("BATCH_EMBED_SIZE", "2048"))
+
+
+def validar_itens(itens, max_itens=BATCH_MAX_ITEMS):
+    """
+    Normaliza as perguntas do lote para {"id", "question"}
+
+    Cada item é um texto ou um objeto com "question" (ou "message") e, se
+    quiser, um "id" devolvido no resultado. ValueError se não servir.
+    """
+    if not isinstance(itens, list) or not itens:
+        raise ValueError("O lote deve ter ao menos uma pergunta")
+    if len(itens) > max_itens:
+        raise ValueError(f"No máximo {max_itens} perguntas por lote")
+    normalizados = []
+    for i, item in enumerate(itens):
+        if isinstance(item, str):
+            item = {"question": item}
+        if not isinstance(item, dict):
+            raise ValueError(f"Item {i + 1}: use um texto ou um objeto com 'question'")
+        pergunta = item.get("question") or item.get("message")
+        if not isinstance(pergunta, str) or not pergunta.strip():
+            raise ValueError(f"Item {i + 1}: informe o texto em 'question' (ou 'message')")
+        normalizados.append({"id": item.get("id", i), "question": pergunta.strip()})
+    return normalizados
+
+
+def ler_jsonl(linhas, max_itens=BATCH_MAX_ITEMS):
+    """Perguntas de um JSONL (uma por linha; linhas vazias são ignoradas)"""
+    itens = []
+    for numero, linha in enumerate(linhas, start=1):
+        linha = linha.strip()
+        if not linha:
+            continue
+        try:
+            itens.append(json.loads(linha))
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Linha {numero}: JSON inválido ({e.msg})")
+    return validar_itens(itens, max_itens)
+
+
+def ler_pedido_lote(payload, corpo, args):
+    """
+    Perguntas e opções de um pedido de lote (POST /chat/batch)
+
+    payload: JSON {"questions": [...], "concurrency", "use_cache"} ou só a
+    lista; sem JSON, corpo é lido como JSONL e as opções vêm de args (query
+    string). Retorna (itens, concorrência, usa o cache?); ValueError se não servir.
+    """
+    if isinstance(payload, list):
+        payload = {"questions": payload}
+    if isinstance(payload, dict):
+        itens = validar_itens(payload.get("questions"))
+        opcoes = payload
+    else:
+        itens = ler_jsonl(corpo.splitlines())
+        opcoes = args
+    try:
+        concorrencia = int(opcoes.get("concurrency", BATCH_CONCURRENCY))
+    except (TypeError, ValueError):
+        raise ValueError("'concurrency' deve ser um número inteiro")
+    usar_cache = str(opcoes.get("use_cache", False)).lower() == "true"
+    return itens, concorrencia, usar_cache
+
+
+class ItemLote:
+    """Uma pergunta do lote, com o contexto recuperado e a resposta"""
+
+    def __init__(self, index, item_id, question):
+        self.index = index
+        self.id = item_id
+        self.question = question
+        self.embedding = None
+        self.results = []
+        self.use_cache = False
+        self.response = None
+        self.source = None
+        self.wait = 0.0
+        self.completion = 0.0
+        self.total = 0.0
+
+    def to_dict(self):
+        return {
+            "index": self.index,
+            "id": self.id,
+            "question": self.question,
+            "response": self.response,
+            "source": self.source,
+            "chunks": [result["id"] for result in self.results],
+            "timings_ms": {
+                "wait": round(self.wait * 1000, 2),
+                "completion": round(self.completion * 1000, 2),
+                "total": round(self.total * 1000, 2),
+            },
+        }
+
+
+def preparar_lote(motor, itens, usar_cache=False, embed_size=BATCH_EMBED_SIZE):
+    """
+    Intenções, embeddings e busca do lote inteiro
+
+    Retorna (itens do lote, tempos do lote). Os itens com resposta pronta
+    (regra, intenção, cache ou sem resultados) já vêm com response.
+    """
+    lote = [ItemLote(i, item["id"], item["question"]) for i, item in enumerate(itens)]
+    tempos = {"embedding": 0.0, "retrieval": 0.0, "embedding_requests": 0}
+
+    for item in lote:
+        item.response = motor._rotear_por_regra(item.question)
+        if item.response is not None:
+            item.source = "rule"
+            registrar_resposta("rule")
+    pendentes = [item for item in lote if item.response is None]
+    if not pendentes:
+        return lote, tempos
+
+    perguntas = [item.question for item in pendentes]
+    inicio = time.perf_counter()
+    embeddings = []
+    try:
+        for i in range(0, len(perguntas), embed_size):
+            embeddings.extend(motor.query_embedding_fn(perguntas[i : i + embed_size]))
+            tempos["embedding_requests"] += 1
+    except Exception as e:
+        # A busca híbrida segue só com o BM25; a vetorial fica sem resultados
+        print(f"⚠️ Embeddings do lote indisponíveis: {e!r}")
+        embeddings = None
+    tempos["embedding"] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    try:
+        with span("retrieval"):
+            resultados = motor.retriever.search_many(perguntas, embeddings, motor.n_results)
+    except Exception as e:
+        print(f"❌ Erro ao buscar documentos do lote: {e}")
+        resultados = [[] for _ in pendentes]
+    tempos["retrieval"] = time.perf_counter() - inicio
+
+    for i, item in enumerate(pendentes):
+        item.embedding = embeddings[i] if embeddings is not None else None
+        item.results = resultados[i]
+        if not item.results:
+            item.response, item.source = motor.sem_resultados, "no_results"
+            registrar_resposta("no_results")
+            continue
+        resposta = motor._rotear_por_embedding(item.embedding)
+        if resposta is not None:
+            item.response, item.source = resposta, "intent"
+            registrar_resposta("intent")
+            continue
+        if usar_cache:
+            item.use_cache, item.response = motor._consultar_cache(item.embedding, item.results, [])
+            if item.response is not None:
+                item.source = "cache"
+                registrar_resposta("cache")
+    return lote, tempos
+
+
+def _concluir(motor, item, response, inicio_lote, inicio):
+    """Registra a resposta gerada (ou a de reserva) e os tempos do item"""
+    fim = time.perf_counter()
+    item.wait = inicio - inicio_lote
+    item.completion = fim - inicio
+    gerada = response
+    response, item.use_cache = motor._registrar_geracao(response, item.embedding, item.use_cache)
+    if response is not gerada:
+        item.source = "fallback_cache"
+    else:
+        item.source = "error" if response.startswith(ERRO_RESPOSTA) else "llm"
+    item.response = response
+    motor._fechar_turno(item.question, response, item.embedding, item.results, item.use_cache)
+    return item
+
+
+def _gerar(motor, item, inicio_lote):
+    inicio = time.perf_counter()
+    chunks = [result["text"] for result in item.results]
+    response = motor.generate_response(item.question, chunks, [])
+    return _concluir(motor, item, response, inicio_lote, inicio)
+
+
+def _resumo(lote, tempos, inicio_lote, concorrencia):
+    total = time.perf_counter() - inicio_lote
+    fontes = {}
+    for item in lote:
+        fontes[item.source] = fontes.get(item.source, 0) + 1
+    return {
+        "summary": True,
+        "items": len(lote),
+        "sources": fontes,
+        "concurrency": concorrencia,
+        "embedding_requests": tempos["embedding_requests"],
+        "timings_ms": {
+            "embedding": round(tempos["embedding"] * 1000, 2),
+            "retrieval": round(tempos["retrieval"] * 1000, 2),
+            "total": round(total * 1000, 2),
+        },
+        "items_per_second": len(lote) / total if total > 0 else 0.0,
+    }
+
+
+def _finalizar(item, inicio_lote):
+    item.total = time.perf_counter() - inicio_lote
+    return item.to_dict()
+
+
+def responder_lote(motor, itens, concorrencia=BATCH_CONCURRENCY, usar_cache=False):
+    """
+    Responde o lote e gera um resultado por pergunta, na ordem em que ficam prontos
+
+    itens: saída de validar_itens/ler_jsonl. Termina com o resumo do lote.
+    """
+    concorrencia = max(1, min(concorrencia, BATCH_CONCURRENCY))
+    inicio_lote = time.perf_counter()
+    lote, tempos = preparar_lote(motor, itens, usar_cache)
+
+    a_gerar = []
+    for item in lote:
+        if item.response is None:
+            a_gerar.append(item)
+        else:
+            yield _finalizar(item, inicio_lote)
+    if a_gerar:
+        with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+            futures = [executor.submit(_gerar, motor, item, inicio_lote) for item in a_gerar]
+            try:
+                for future in as_completed(futures):
+                    yield _finalizar(future.result(), inicio_lote)
+            finally:
+                # Cliente desconectado: os completions que nem começaram são cancelados
+                for future in futures:
+                    future.cancel()
+    yield _resumo(lote, tempos, inicio_lote, concorrencia)
+
+
+async def aresponder_lote(motor, itens, concorrencia=BATCH_CONCURRENCY, usar_cache=False):
+    """responder_lote para o AsyncChatRAG: completions no event loop, limitados por semáforo"""
+    concorrencia = max(1, min(concorrencia, BATCH_CONCURRENCY))
+    inicio_lote = time.perf_counter()
+    # Embedding e busca são chamadas síncronas: rodam em uma thread
+    lote, tempos = await asyncio.to_thread(preparar_lote, motor, itens, usar_cache)
+    semaforo = asyncio.Semaphore(concorrencia)
+
+    async def gerar(item):
+        async with semaforo:
+            inicio = time.perf_counter()
+            chunks = [result["text"] for result in item.results]
+            response = await motor.agenerate_response(item.question, chunks, [])
+            return _concluir(motor, item, response, inicio_lote, inicio)
+
+    tarefas = []
+    for item in lote:
+        if item.response is None:
+            tarefas.append(asyncio.ensure_future(gerar(item)))
+        else:
+            yield _finalizar(item, inicio_lote)
+    try:
+        for proxima in asyncio.as_completed(tarefas):
+            yield _finalizar(await proxima, inicio_lote)
+    finally:
+        # Cliente desconectado: não deixa completions órfãos rodando
+        for tarefa in tarefas:
+            tarefa.cancel()
+    yield _resumo(lote, tempos, inicio_lote, concorrencia)
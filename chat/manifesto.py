@@ -0,0 +1,188 @@
+"""
+Manifesto da indexação incremental
+
+Guarda, ao lado da coleção, o hash de cada arquivo e de cada chunk, os
+parâmetros de chunking e o modelo de embedding usados. Com ele a
+reindexação só embeda chunks novos ou alterados e remove os chunks de
+arquivos que saíram da pasta docs.
+"""
+
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock entre processos
+    fcntl = None
+
+VERSAO_MANIFESTO = 1
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+MANIFEST_DIR = os.path.join(base_dir, "manifests")
+
+
+def hash_texto(text):
+    """Hash do conteúdo (sha256 em hexadecimal)"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def caminho_manifesto(collection_name, manifest_dir=MANIFEST_DIR):
+    return os.path.join(manifest_dir, f"{collection_name}.json")
+
+
+def manifesto_vazio(collection_name, embedding_model, chunk_params):
+    return {
+        "version": VERSAO_MANIFESTO,
+        "collection": collection_name,
+        "embedding_model": embedding_model,
+        "chunk_params": chunk_params,
+        "files": {},
+    }
+
+
+def carregar_manifesto(collection_name, manifest_dir=MANIFEST_DIR):
+    """Lê o manifesto da coleção (None se não existir ou estiver corrompido)"""
+    path = caminho_manifesto(collection_name, manifest_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Manifesto ilegível, a coleção será reindexada: {e}")
+        return None
+    if manifest.get("version") != VERSAO_MANIFESTO:
+        return None
+    return manifest
+
+
+@contextmanager
+def bloqueio_colecao(collection_name, manifest_dir=MANIFEST_DIR):
+    """
+    Lock exclusivo da coleção entre processos (<collection>.lock ao lado do
+    manifesto), para ler o manifesto, indexar e gravar sem que outro worker
+    ou o rag.py grave no meio
+    """
+    os.makedirs(manifest_dir, exist_ok=True)
+    path = os.path.join(manifest_dir, f"{collection_name}.lock")
+    with open(path, "a") as file:
+        if fcntl is not None:
+            fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def salvar_manifesto(manifest, manifest_dir=MANIFEST_DIR):
+    """Grava o manifesto de forma atômica (arquivo temporário + rename)"""
+    os.makedirs(manifest_dir, exist_ok=True)
+    path = caminho_manifesto(manifest["collection"], manifest_dir)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def planejar_reindexacao(documents, manifest, split_fn, embedding_model, chunk_params):
+    """
+    Compara os documentos atuais com o manifesto e monta o plano
+
+    `documents` é a lista de {"id", "text"} de carregar_documentos e
+    `split_fn(doc)` devolve os chunks de um documento. Se o modelo de
+    embedding ou os parâmetros de chunking mudaram, tudo é reindexado. Em
+    um arquivo alterado, só os chunks com um hash que o arquivo não tinha
+    são embedados; os outros ficam com o ID e o embedding de antes.
+    Retorna um dicionário com os chunks a embedar, os IDs a remover e os
+    arquivos que ficam como estão.
+    """
+    full = (
+        manifest is None
+        or manifest.get("embedding_model") != embedding_model
+        or manifest.get("chunk_params") != chunk_params
+    )
+    old_files = {} if manifest is None else manifest.get("files", {})
+
+    plan = {
+        "full": full,
+        "to_embed": [],
+        "to_delete": [],
+        "files": {},
+        "unchanged_files": [],
+        "changed_files": [],
+        "removed_files": [],
+    }
+
+    if full:
+        for entry in old_files.values():
+            plan["to_delete"].extend(entry.get("chunks", {}).keys())
+
+    for doc in documents:
+        file_hash = hash_texto(doc["text"])
+        old_entry = old_files.get(doc["id"])
+
+        if not full and old_entry and old_entry.get("hash") == file_hash:
+            plan["files"][doc["id"]] = old_entry
+            plan["unchanged_files"].append(doc["id"])
+            continue
+
+        old_chunks = {} if full or not old_entry else old_entry.get("chunks", {})
+        chunks = split_fn(doc)
+        hashes = [hash_texto(chunk) for chunk in chunks]
+        # Chunks com um hash que o arquivo já tinha mantêm o ID antigo (e o
+        # embedding que está na coleção), mesmo que tenham mudado de posição:
+        # um trecho inserido no início do arquivo não reembeda o resto
+        por_hash = {}
+        for chunk_id, chunk_hash in old_chunks.items():
+            por_hash.setdefault(chunk_hash, []).append(chunk_id)
+        reusados = [por_hash[h].pop(0) if por_hash.get(h) else None for h in hashes]
+        ocupados = {chunk_id for chunk_id in reusados if chunk_id is not None}
+        new_chunks = {}
+        proximo = len(chunks)
+        for i, (chunk, chunk_hash, chunk_id) in enumerate(zip(chunks, hashes, reusados)):
+            if chunk_id is None:
+                # Conteúdo novo: o ID da posição, ou um número livre se um
+                # chunk reaproveitado já o usa
+                chunk_id = f"{doc['id']}_chunk{i + 1}"
+                while chunk_id in ocupados:
+                    proximo += 1
+                    chunk_id = f"{doc['id']}_chunk{proximo}"
+                ocupados.add(chunk_id)
+                plan["to_embed"].append({"id": chunk_id, "text": chunk})
+            new_chunks[chunk_id] = chunk_hash
+
+        if not full:
+            plan["to_delete"].extend(cid for cid in old_chunks if cid not in new_chunks)
+        plan["files"][doc["id"]] = {"hash": file_hash, "chunks": new_chunks}
+        plan["changed_files"].append(doc["id"])
+
+    current_ids = {doc["id"] for doc in documents}
+    for filename, entry in old_files.items():
+        if filename not in current_ids:
+            plan["removed_files"].append(filename)
+            if not full:
+                plan["to_delete"].extend(entry.get("chunks", {}).keys())
+
+    return plan
+
+
+def aplicar_falhas(plan, failed_ids):
+    """
+    Retira do plano os chunks cujo embedding falhou
+
+    Eles ficam fora do manifesto para serem tentados de novo na próxima
+    execução; o hash do arquivo também é limpo para forçar a comparação.
+    """
+    if not failed_ids:
+        return plan
+    for entry in plan["files"].values():
+        chunks = entry.get("chunks", {})
+        if any(cid in failed_ids for cid in chunks):
+            entry["hash"] = None
+            entry["chunks"] = {
+                cid: h for cid, h in chunks.items() if cid not in failed_ids
+            }
+    return plan
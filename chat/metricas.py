@@ -0,0 +1,311 @@
+"""
+Métricas de latência e traces do pipeline RAG
+
+Cada etapa de um pedido é medida com span("etapa"):
+
+- embedding: chamada de embeddings da pergunta à OpenAI (só em cache miss)
+- retrieval: busca dos chunks (inclui o embedding)
+- prompt: montagem das mensagens dentro do orçamento de tokens
+- completion: chamada de chat à OpenAI (first_token no streaming)
+- serialization: montagem do JSON da resposta na API
+
+A duração vai para um histograma por etapa (p50/p95/p99 das amostras
+recentes em stats(), buckets no formato do Prometheus em /metrics) e para
+o trace do pedido, quando houver um ativo. Com TRACE_LOG=true cada pedido
+gera uma linha JSON no log com as etapas, a origem da resposta e os tokens.
+
+Contadores: pedidos por endpoint e status, erros por etapa, tokens da
+OpenAI e a origem de cada resposta (regra, intenção, cache, LLM...).
+"""
+
+import bisect
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger("rag.trace")
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+TRACE_LOG = os.getenv("TRACE_LOG", "false").lower() == "true"
+# Amostras recentes por etapa usadas nos percentis
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "2048"))
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PERCENTIS = (50, 95, 99)
+
+CONTADORES = {
+    "rag_requests_total": "Pedidos atendidos, por endpoint e status",
+    "rag_errors_total": "Erros por etapa do pipeline",
+    "rag_tokens_total": "Tokens da OpenAI (prompt, completion e embedding)",
+    "rag_answers_total": "Respostas por origem (rule, intent, cache, llm, coalesced, no_results, error...)",
+    "rag_resilience_total": "Eventos das políticas de resiliência (retries, hedges, timeouts, circuito...)",
+}
+
+_trace_atual = contextvars.ContextVar("trace_atual", default=None)
+
+
+class Histograma:
+    """Buckets cumulativos, soma e contagem, e uma janela de amostras recentes"""
+
+    def __init__(self, buckets=BUCKETS, window=METRICS_WINDOW):
+        self.buckets = buckets
+        self.contagens = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.recentes = deque(maxlen=window)
+
+    def observar(self, segundos):
+        self.count += 1
+        self.sum += segundos
+        self.recentes.append(segundos)
+        i = bisect.bisect_left(self.buckets, segundos)
+        if i < len(self.contagens):
+            self.contagens[i] += 1
+
+    def percentis(self):
+        ordenados = sorted(self.recentes)
+        if not ordenados:
+            return {f"p{p}": 0.0 for p in PERCENTIS}
+        return {
+            f"p{p}": ordenados[min(len(ordenados) - 1, int(p / 100 * len(ordenados)))]
+            for p in PERCENTIS
+        }
+
+
+class Metricas:
+    """Histogramas por etapa e contadores com labels do processo"""
+
+    def __init__(self):
+        self.histogramas = {}
+        self.contadores = {}
+        self._lock = threading.Lock()
+
+    def observar(self, etapa, segundos):
+        with self._lock:
+            histograma = self.histogramas.get(etapa)
+            if histograma is None:
+                histograma = self.histogramas[etapa] = Histograma()
+            histograma.observar(segundos)
+
+    def incrementar(self, nome, valor=1, **labels):
+        chave = (nome, tuple(sorted(labels.items())))
+        with self._lock:
+            self.contadores[chave] = self.contadores.get(chave, 0) + valor
+
+    def stats(self):
+        with self._lock:
+            stages = {}
+            for etapa, histograma in sorted(self.histogramas.items()):
+                percentis = histograma.percentis()
+                stages[etapa] = {
+                    "count": histograma.count,
+                    "avg_ms": histograma.sum / histograma.count * 1000 if histograma.count else 0.0,
+                    **{f"{p}_ms": valor * 1000 for p, valor in percentis.items()},
+                }
+            counters = {}
+            for (nome, labels), valor in sorted(self.contadores.items()):
+                rotulo = ",".join(f"{k}={v}" for k, v in labels)
+                counters.setdefault(nome, {})[rotulo or "total"] = valor
+            return {"stages": stages, "counters": counters}
+
+    def prometheus(self, componentes=None):
+        """
+        Texto no formato de exposição do Prometheus
+
+        componentes: dicionário {nome: stats()} dos caches, sessões etc.
+        (o mesmo do /stats); os campos numéricos viram gauges rag_<nome>_<campo>
+        (rag_<nome>_<subnome>_<campo> em um nível de aninhamento, ex.: resilience).
+        """
+        linhas = []
+        with self._lock:
+            if self.histogramas:
+                linhas += [
+                    "# HELP rag_stage_duration_seconds Duração de cada etapa do pipeline",
+                    "# TYPE rag_stage_duration_seconds histogram",
+                ]
+                for etapa, histograma in sorted(self.histogramas.items()):
+                    acumulado = 0
+                    for limite, contagem in zip(histograma.buckets, histograma.contagens):
+                        acumulado += contagem
+                        linhas.append(
+                            f'rag_stage_duration_seconds_bucket{{stage="{etapa}",le="{limite}"}} {acumulado}'
+                        )
+                    linhas += [
+                        f'rag_stage_duration_seconds_bucket{{stage="{etapa}",le="+Inf"}} {histograma.count}',
+                        f'rag_stage_duration_seconds_sum{{stage="{etapa}"}} {histograma.sum:.6f}',
+                        f'rag_stage_duration_seconds_count{{stage="{etapa}"}} {histograma.count}',
+                    ]
+                linhas += [
+                    "# HELP rag_stage_duration_recent_seconds Percentis das amostras recentes de cada etapa",
+                    "# TYPE rag_stage_duration_recent_seconds summary",
+                ]
+                for etapa, histograma in sorted(self.histogramas.items()):
+                    for p, valor in histograma.percentis().items():
+                        quantil = int(p[1:]) / 100
+                        linhas.append(
+                            f'rag_stage_duration_recent_seconds{{stage="{etapa}",quantile="{quantil}"}} {valor:.6f}'
+                        )
+            for nome, ajuda in CONTADORES.items():
+                series = [(labels, v) for (n, labels), v in sorted(self.contadores.items()) if n == nome]
+                if not series:
+                    continue
+                linhas += [f"# HELP {nome} {ajuda}", f"# TYPE {nome} counter"]
+                for labels, valor in series:
+                    rotulo = ",".join(f'{k}="{v}"' for k, v in labels)
+                    linhas.append(f"{nome}{{{rotulo}}} {valor}" if rotulo else f"{nome} {valor}")
+
+        for componente, stats in (componentes or {}).items():
+            if not isinstance(stats, dict):
+                continue
+            for campo, valor in stats.items():
+                if isinstance(valor, dict):
+                    # Um nível de aninhamento: {política: {campo: valor}}
+                    linhas += _gauges(f"rag_{componente}_{campo}", valor)
+            linhas += _gauges(f"rag_{componente}", stats)
+        return "\n".join(linhas) + "\n"
+
+
+def _gauges(prefixo, stats):
+    """Linhas de gauge dos campos numéricos de um dicionário"""
+    linhas = []
+    for campo, valor in stats.items():
+        if isinstance(valor, bool) or not isinstance(valor, (int, float)):
+            continue
+        nome = f"{prefixo}_{campo}"
+        linhas += [f"# TYPE {nome} gauge", f"{nome} {valor}"]
+    return linhas
+
+
+_metricas = Metricas()
+
+
+def get_metrics():
+    """Retorna as métricas do processo"""
+    return _metricas
+
+
+class Trace:
+    """Etapas, origem da resposta e tokens de um pedido"""
+
+    def __init__(self, endpoint):
+        self.id = uuid.uuid4().hex[:16]
+        self.endpoint = endpoint
+        self.status = "ok"
+        self.spans = []
+        self.atributos = {}
+        self.inicio = time.perf_counter()
+
+    def to_dict(self):
+        return {
+            "trace_id": self.id,
+            "endpoint": self.endpoint,
+            "status": self.status,
+            "total_ms": round((time.perf_counter() - self.inicio) * 1000, 2),
+            "spans": [{"stage": etapa, "ms": round(ms, 2)} for etapa, ms in self.spans],
+            **self.atributos,
+        }
+
+
+def trace_atual():
+    """Trace do pedido em andamento (None fora de um pedido)"""
+    return _trace_atual.get()
+
+
+def registrar_etapa(etapa, segundos):
+    """Registra a duração de uma etapa no histograma e no trace do pedido"""
+    if not METRICS_ENABLED:
+        return
+    _metricas.observar(etapa, segundos)
+    atual = _trace_atual.get()
+    if atual is not None:
+        atual.spans.append((etapa, segundos * 1000))
+
+
+def registrar_erro(etapa):
+    """Conta um erro da etapa"""
+    if METRICS_ENABLED:
+        _metricas.incrementar("rag_errors_total", stage=etapa)
+
+
+@contextmanager
+def span(etapa):
+    """Mede o bloco como uma etapa; uma exceção conta como erro da etapa"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        registrar_erro(etapa)
+        raise
+    finally:
+        registrar_etapa(etapa, time.perf_counter() - inicio)
+
+
+def anotar(**atributos):
+    """Acrescenta atributos ao trace do pedido (ex.: status="error")"""
+    atual = _trace_atual.get()
+    if atual is None:
+        return
+    if "status" in atributos:
+        atual.status = atributos.pop("status")
+    atual.atributos.update(atributos)
+
+
+def registrar_resposta(origem):
+    """Conta a origem da resposta (rule, intent, cache, llm, coalesced...)"""
+    if METRICS_ENABLED:
+        _metricas.incrementar("rag_answers_total", source=origem)
+    anotar(source=origem)
+
+
+def registrar_tokens(usage, tipo=None):
+    """Soma os tokens do campo usage de uma resposta da OpenAI"""
+    if usage is None or not METRICS_ENABLED:
+        return
+    contagens = (
+        {tipo: getattr(usage, "prompt_tokens", 0) or 0}
+        if tipo
+        else {
+            "prompt": getattr(usage, "prompt_tokens", 0) or 0,
+            "completion": getattr(usage, "completion_tokens", 0) or 0,
+        }
+    )
+    atual = _trace_atual.get()
+    for nome, quantidade in contagens.items():
+        _metricas.incrementar("rag_tokens_total", quantidade, type=nome)
+        if atual is not None:
+            tokens = atual.atributos.setdefault("tokens", {})
+            tokens[nome] = tokens.get(nome, 0) + quantidade
+
+
+@contextmanager
+def trace(endpoint):
+    """
+    Trace de um pedido: as etapas medidas dentro do bloco entram nele
+
+    Ao final conta o pedido (endpoint e status), registra a duração total
+    na etapa "request" e, com TRACE_LOG=true, loga o trace em JSON.
+    """
+    atual = Trace(endpoint)
+    token = _trace_atual.set(atual)
+    try:
+        yield atual
+    except BaseException:
+        atual.status = "error"
+        raise
+    finally:
+        try:
+            _trace_atual.reset(token)
+        except ValueError:
+            # Generator de streaming finalizado em outro contexto
+            _trace_atual.set(None)
+        if METRICS_ENABLED:
+            _metricas.observar("request", time.perf_counter() - atual.inicio)
+            _metricas.incrementar("rag_requests_total", endpoint=endpoint, status=atual.status)
+        if TRACE_LOG:
+            logger.info(json.dumps(atual.to_dict(), ensure_ascii=False))
@@ -0,0 +1,474 @@
+"""
+Motor do chat RAG, compartilhado por todos os front ends
+
+MotorRAG concentra o pipeline de uma pergunta: respostas prontas do
+roteador de intenções, busca no retriever, cache semântico de respostas,
+montagem do prompt dentro do orçamento de tokens, geração com resiliência
+(resiliencia.py) e histórico da sessão. Os componentes são plugáveis no
+construtor (retriever, cliente da OpenAI, cache de respostas, sessões,
+roteador de intenções e coalescência); os omitidos vêm dos registros do
+processo. Os front ends são adaptadores finos sobre ele:
+
+- ChatRAG (chat_interativo.py): chat no terminal, e o motor da API Flask
+- AsyncChatRAG (chat_async.py): versão assíncrona para a API ASGI
+- ChatRAGWeb (chat_web.py): Streamlit, com o Chroma persistente
+- rag.py query: consulta pela linha de comando
+
+Uma otimização do pipeline entra aqui uma vez e vale para todos, e os
+benchmarks (bench_carga --alvo direto) medem este mesmo objeto.
+"""
+
+import os
+import time
+
+from cache import get_answer_cache
+from clientes import (
+    COLLECTION_NAME,
+    get_openai_client,
+    get_query_embedding_fn,
+    get_retriever,
+)
+from coalescencia import COALESCE_ENABLED, SingleFlight, chave_pedido
+from contexto import PROMPT_VENDAS, montar_mensagens
+from intencoes import get_intent_router
+from metricas import (
+    anotar,
+    registrar_erro,
+    registrar_etapa,
+    registrar_resposta,
+    registrar_tokens,
+    span,
+)
+from resiliencia import completar
+from sessoes import get_session_store
+
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.1"))
+LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "500"))
+# Chunks recuperados por pergunta
+N_RESULTS = int(os.getenv("N_RESULTS", "3"))
+
+# Resposta quando o LLM falha e não há fallback: a exceção vai só para o log
+# (é também o prefixo que impede erros de entrar no cache de respostas)
+ERRO_RESPOSTA = "Desculpe, não consegui gerar sua resposta agora. Tente novamente em instantes."
+
+SEM_RESULTADOS = "Não encontrei informações relevantes para sua pergunta. Tente reformular ou perguntar sobre objeções de vendas ou o produto 'Menos Café Mais Chá'."
+
+# Marca os componentes não informados: vêm dos registros do processo
+# (None desliga o cache de respostas, o roteador e a coalescência)
+PADRAO = object()
+
+
+def resposta_compartilhavel(resultado):
+    """Respostas de erro não são repassadas aos pedidos coalescidos"""
+    response = resultado[3]
+    return response is not None and not response.startswith(ERRO_RESPOSTA)
+
+
+class MotorRAG:
+    """Pipeline RAG de uma pergunta com componentes plugáveis"""
+
+    def __init__(
+        self,
+        retriever=None,
+        client=None,
+        answer_cache=PADRAO,
+        sessions=None,
+        intent_router=PADRAO,
+        coalescer=PADRAO,
+        query_embedding_fn=None,
+        chroma_kind="cloud",
+        model=None,
+        temperature=LLM_TEMPERATURE,
+        max_tokens=LLM_MAX_TOKENS,
+        n_results=N_RESULTS,
+        system_prompt=PROMPT_VENDAS,
+        sem_resultados=SEM_RESULTADOS,
+    ):
+        """
+        chroma_kind: cliente do Chroma do retriever padrão ("cloud" ou
+        "persistent"); model: modelo principal (padrão LLM_MODEL);
+        system_prompt e sem_resultados: prompt e resposta sem chunks do
+        produto (os do lojista, em lojistas.py).
+        """
+        self.openai_api_key = os.getenv("OPENAI_API_KEY")
+        self.collection_name = COLLECTION_NAME
+
+        # Embeddings das perguntas passam pelo cache compartilhado do processo
+        self.query_embedding_fn = query_embedding_fn or get_query_embedding_fn()
+
+        # Backend de busca: "chroma" (padrão) ou "local" (snapshot mapeado em memória)
+        self.retriever_backend = os.getenv("RETRIEVER_BACKEND", "chroma")
+        self.retriever = retriever or get_retriever(
+            self.retriever_backend, chroma_kind, self.collection_name
+        )
+
+        # Cliente OpenAI (pool HTTP com keep-alive compartilhado)
+        self.client = client or get_openai_client(self.openai_api_key)
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.n_results = n_results
+        self.system_prompt = system_prompt
+        self.sem_resultados = sem_resultados
+
+        # Histórico da conversa sem sessão (terminal); a API usa uma conversa por sessão
+        self.conversation_history = []
+        self.sessions = sessions or get_session_store()
+
+        # Cache semântico de respostas (None se ANSWER_CACHE_ENABLED=false)
+        self.answer_cache = get_answer_cache() if answer_cache is PADRAO else answer_cache
+
+        # Respostas prontas para saudações e objeções conhecidas (None se desativado)
+        self.intent_router = get_intent_router() if intent_router is PADRAO else intent_router
+
+        # Perguntas iguais em andamento compartilham busca e geração (None se desativado)
+        if coalescer is PADRAO:
+            coalescer = SingleFlight() if COALESCE_ENABLED else None
+        self.coalescer = coalescer
+
+    def embed_question(self, question):
+        """Embedding da pergunta, passando pelo cache compartilhado"""
+        return self.query_embedding_fn([question])[0]
+
+    def retrieve(self, question, n_results=None, lexical_shortcut=True):
+        """
+        Busca os chunks relevantes e retorna o embedding da pergunta junto
+
+        Na busca híbrida o embedding vem None quando o atalho lexical
+        respondeu sem calculá-lo.
+        """
+        try:
+            with span("retrieval"):
+                return self.retriever.search(
+                    question, self.embed_question, n_results or self.n_results, lexical_shortcut
+                )
+        except Exception as e:
+            print(f"❌ Erro ao buscar documentos: {e}")
+            return None, []
+
+    def query_documents(self, question, n_results=None):
+        """Busca documentos relevantes na base de conhecimento"""
+        _, results = self.retrieve(question, n_results)
+        relevant_chunks = [result["text"] for result in results]
+        return relevant_chunks
+
+    def get_history(self, session_id=None):
+        """Histórico da sessão (ou da conversa do terminal, sem session_id)"""
+        if session_id is None:
+            return self.conversation_history
+        return self.sessions.get_history(session_id)
+
+    def clear_history(self, session_id=None):
+        """Limpa o histórico da sessão (ou da conversa do terminal)"""
+        if session_id is None:
+            self.conversation_history = []
+        else:
+            self.sessions.clear(session_id)
+
+    def build_messages(self, question, relevant_chunks, history=None):
+        """Monta as mensagens (prompt do sistema, chunks, histórico e pergunta)"""
+        if history is None:
+            history = self.conversation_history
+        # Chunks e histórico entram até o orçamento de tokens (contexto.py)
+        with span("prompt"):
+            messages, _ = montar_mensagens(
+                question, relevant_chunks, history, system_prompt=self.system_prompt
+            )
+        return messages
+
+    def _pedido_completion(self, client, messages, stream=False):
+        """
+        Chamada de chat (model, timeout) -> resposta, para as políticas de
+        resiliencia.py; com o cliente assíncrono devolve a corrotina
+        """
+        return lambda model, timeout: client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            stream=stream,
+            timeout=timeout,
+        )
+
+    def _completion(self, messages, stream=False):
+        """Chamada de chat com prazos, retries e modelo de reserva (resiliencia.py)"""
+        return completar(
+            self._pedido_completion(self.client, messages, stream),
+            stream=stream,
+            modelo=self.model,
+        )
+
+    @staticmethod
+    def _conteudo(response):
+        """Texto da resposta do chat, contando os tokens usados"""
+        registrar_tokens(response.usage)
+        return response.choices[0].message.content
+
+    @staticmethod
+    def _falha_na_geracao(erro):
+        """Registra a falha do LLM no log; quem perguntou recebe ERRO_RESPOSTA"""
+        print(f"❌ Erro ao gerar resposta: {erro!r}")
+        return ERRO_RESPOSTA
+
+    @staticmethod
+    def _trecho(chunk, inicio):
+        """
+        Texto de um chunk do stream (None se vazio); inicio é o instante do
+        pedido até o primeiro trecho, e None depois dele
+        """
+        if not chunk.choices or not chunk.choices[0].delta.content:
+            return None
+        if inicio is not None:
+            # Tempo até o primeiro token (etapa "first_token")
+            registrar_etapa("first_token", time.perf_counter() - inicio)
+        return chunk.choices[0].delta.content
+
+    def generate_response(self, question, relevant_chunks, history=None):
+        """Gera resposta usando OpenAI com contexto RAG"""
+        try:
+            messages = self.build_messages(question, relevant_chunks, history)
+            with span("completion"):
+                return self._conteudo(self._completion(messages))
+        except Exception as e:
+            return self._falha_na_geracao(e)
+
+    def generate_response_stream(self, question, relevant_chunks, history=None):
+        """Gera a resposta em streaming, devolvendo os trechos conforme chegam"""
+        messages = self.build_messages(question, relevant_chunks, history)
+        inicio = time.perf_counter()
+        for chunk in self._completion(messages, stream=True):
+            texto = self._trecho(chunk, inicio)
+            if texto:
+                inicio = None
+                yield texto
+
+    def _consultar_cache(self, embedding, results, history):
+        """Retorna (usa o cache?, resposta em cache ou None)"""
+        # Só turnos sem histórico usam o cache de respostas: com histórico a
+        # resposta depende da conversa, não apenas da pergunta
+        use_cache = (
+            bool(results)
+            and embedding is not None
+            and self.answer_cache is not None
+            and not history
+        )
+        cached = self.answer_cache.lookup(embedding, results) if use_cache else None
+        return use_cache, cached
+
+    def _registrar_geracao(self, response, embedding, use_cache):
+        """
+        Conta a resposta gerada pelo LLM; se a geração falhou, usa a resposta
+        em cache da pergunta mais parecida, quando houver
+
+        Retorna (resposta, usa o cache?): a resposta de reserva não é gravada
+        no cache de novo.
+        """
+        if not response.startswith(ERRO_RESPOSTA):
+            registrar_resposta("llm")
+            return response, use_cache
+        if self.answer_cache is not None and embedding is not None:
+            reserva = self.answer_cache.mais_proxima(embedding)
+            if reserva is not None:
+                registrar_resposta("fallback_cache")
+                return reserva, False
+        registrar_resposta("error")
+        anotar(status="error")
+        return response, use_cache
+
+    def _rotear_por_regra(self, question):
+        """Resposta pronta se uma regra de intenção casar com a pergunta, senão None"""
+        if self.intent_router is None:
+            return None
+        intencao = self.intent_router.por_regra(question)
+        if intencao is not None:
+            self.intent_router.registrar(intencao, "regra")
+            return intencao.answer
+        return None
+
+    def _rotear_por_embedding(self, embedding):
+        """Resposta pronta da intenção mais próxima do embedding, senão None"""
+        if self.intent_router is None:
+            return None
+        intencao = None
+        if embedding is not None:
+            intencao = self.intent_router.por_embedding(embedding, self.query_embedding_fn)
+        self.intent_router.registrar(intencao, "embedding")
+        return intencao.answer if intencao is not None else None
+
+    # Os passos abaixo não fazem I/O: o motor síncrono e o assíncrono
+    # (chat_async.py) só trocam as chamadas de busca, geração e sessões
+
+    def _resultado_por_regra(self, question):
+        """Resultado do pipeline quando uma regra de intenção responde (dispensa a busca), senão None"""
+        resposta = self._rotear_por_regra(question)
+        if resposta is None:
+            return None
+        registrar_resposta("rule")
+        return None, [], False, resposta
+
+    def _atalho_lexical(self, history):
+        # O atalho lexical pula o embedding, que o cache de respostas precisa:
+        # só vale quando o cache não seria usado neste turno
+        return self.answer_cache is None or bool(history)
+
+    def _resultado_da_busca(self, embedding, results, history):
+        """
+        Consulta o roteador de intenções e o cache de respostas com o que a busca trouxe
+
+        Retorna (embedding, resultados, usa o cache?, resposta pronta ou None).
+        """
+        resposta = self._rotear_por_embedding(embedding) if results else None
+        if resposta is not None:
+            registrar_resposta("intent")
+            return embedding, results, False, resposta
+        use_cache, cached = self._consultar_cache(embedding, results, history)
+        if cached is not None:
+            registrar_resposta("cache")
+        return embedding, results, use_cache, cached
+
+    @staticmethod
+    def _precisa_gerar(resultado):
+        """Há chunks e nenhuma resposta pronta: o LLM gera a resposta"""
+        return resultado[3] is None and bool(resultado[1])
+
+    @staticmethod
+    def _chunks(results):
+        return [result["text"] for result in results]
+
+    def _com_resposta_gerada(self, resultado, response):
+        """O resultado do pipeline com a resposta do LLM (ou a de reserva, se ele falhou)"""
+        embedding, results, use_cache, _ = resultado
+        response, use_cache = self._registrar_geracao(response, embedding, use_cache)
+        return embedding, results, use_cache, response
+
+    def _concluir(self, question, resultado, compartilhado=False):
+        """
+        Resposta de um resultado do pipeline (próprio ou de um pedido coalescido)
+
+        Retorna (resposta, mensagens do turno para o histórico, ou None sem
+        chunks). Só quem gerou a resposta a guarda no cache de respostas.
+        """
+        embedding, results, use_cache, response = resultado
+        if compartilhado:
+            registrar_resposta("coalesced")
+        if response is None:
+            registrar_resposta("no_results")
+            return self.sem_resultados, None
+        messages = self._fechar_turno(
+            question, response, embedding, results, use_cache and not compartilhado
+        )
+        return response, messages
+
+    def _falha_no_stream(self, erro, partes, embedding, use_cache):
+        """
+        Desfecho de um stream que falhou: (último trecho, resposta do
+        histórico, usa o cache?)
+
+        Sem nenhum trecho enviado ainda, a resposta de reserva substitui o
+        erro; com trechos, o histórico guarda o que o usuário viu, e essa
+        resposta parcial nunca vai para o cache.
+        """
+        registrar_erro("completion")
+        print(f"❌ Erro ao gerar resposta: {erro!r}")
+        response, use_cache = self._registrar_geracao(
+            ERRO_RESPOSTA, None if partes else embedding, use_cache
+        )
+        if not partes:
+            return response, response, use_cache
+        return "\n\n" + response, "".join(partes) + "\n\n" + response, False
+
+    def _fechar_turno(self, question, response, embedding, results, use_cache):
+        """Guarda a resposta no cache (se aplicável) e retorna as mensagens do turno"""
+        if use_cache and not response.startswith(ERRO_RESPOSTA):
+            self.answer_cache.store(embedding, results, response)
+        return [
+            {"role": "user", "content": question},
+            {"role": "assistant", "content": response},
+        ]
+
+    def _guardar_turno(self, messages, session_id=None):
+        """Acrescenta as mensagens do turno ao histórico da sessão (ou do terminal)"""
+        if session_id is None:
+            self.conversation_history.extend(messages)
+        else:
+            self.sessions.append(session_id, messages)
+
+    def _buscar_contexto(self, question, history):
+        """
+        Busca os chunks e consulta o roteador de intenções e o cache de respostas
+
+        Retorna (embedding, resultados, usa o cache?, resposta pronta ou None).
+        Uma intenção reconhecida pela regra dispensa a busca (resultados vazios).
+        """
+        resultado = self._resultado_por_regra(question)
+        if resultado is not None:
+            return resultado
+        embedding, results = self.retrieve(
+            question, lexical_shortcut=self._atalho_lexical(history)
+        )
+        return self._resultado_da_busca(embedding, results, history)
+
+    def _responder(self, question, history):
+        """Busca o contexto e gera a resposta (resposta None se não houver chunks)"""
+        resultado = self._buscar_contexto(question, history)
+        if self._precisa_gerar(resultado):
+            response = self.generate_response(question, self._chunks(resultado[1]), history)
+            resultado = self._com_resposta_gerada(resultado, response)
+        return resultado
+
+    def process_question(self, question, session_id=None, history=None):
+        """
+        Processa uma pergunta e retorna a resposta
+
+        history: histórico mantido por quem chama (ex.: Streamlit); nesse
+        caso a resposta não é gravada no histórico da sessão.
+        """
+        externo = history is not None
+        if not externo:
+            history = self.get_history(session_id)
+
+        if self.coalescer is None:
+            resultado, compartilhado = self._responder(question, history), False
+        else:
+            # Pedidos simultâneos iguais esperam o resultado do primeiro
+            resultado, compartilhado = self.coalescer.do(
+                chave_pedido(question, history),
+                lambda: self._responder(question, history),
+                resposta_compartilhavel,
+            )
+        response, messages = self._concluir(question, resultado, compartilhado)
+        if messages is not None and not externo:
+            self._guardar_turno(messages, session_id)
+        return response
+
+    def process_question_stream(self, question, session_id=None):
+        """
+        Processa uma pergunta devolvendo a resposta em trechos (deltas)
+
+        O histórico só é atualizado quando o stream termina.
+        """
+        history = self.get_history(session_id)
+        resultado = self._buscar_contexto(question, history)
+
+        if self._precisa_gerar(resultado):
+            embedding, results, use_cache, _ = resultado
+            partes = []
+            try:
+                for delta in self.generate_response_stream(
+                    question, self._chunks(results), history
+                ):
+                    partes.append(delta)
+                    yield delta
+            except Exception as e:
+                final, response, use_cache = self._falha_no_stream(e, partes, embedding, use_cache)
+                yield final
+                resultado = embedding, results, use_cache, response
+            else:
+                resultado = self._com_resposta_gerada(resultado, "".join(partes))
+            response, messages = self._concluir(question, resultado)
+        else:
+            response, messages = self._concluir(question, resultado)
+            yield response
+
+        if messages is not None:
+            self._guardar_turno(messages, session_id)
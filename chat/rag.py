@@ -1,31 +1,54 @@
+import argparse
+import json
 import os
+import sys
 from dotenv import load_dotenv
-import chromadb
-from openai import OpenAI
-from chromadb.utils import embedding_functions
+from chunking import CHUNK_PARAMS, EMBEDDING_MODEL, dividir_documento
+import clientes
+from ingestao import executar_ingestao, imprimir_estatisticas
+from manifesto import (
+    aplicar_falhas,
+    bloqueio_colecao,
+    carregar_manifesto,
+    manifesto_vazio,
+    planejar_reindexacao,
+    salvar_manifesto,
+)
+from lojistas import (
+    LojistaDesconhecido,
+    caminho_config,
+    caminho_snapshot_lojista,
+    carregar_config,
+    collection_do_lojista,
+    pasta_docs,
+    produto_do_lojista,
+)
+from lote import BATCH_CONCURRENCY, ler_jsonl, responder_lote
+from motor import MotorRAG
+from retriever import caminho_snapshot, exportar_snapshot
 
 load_dotenv()
 
 openai_api_key = os.getenv("OPENAI_API_KEY")
 
-openai_ef = embedding_functions.OpenAIEmbeddingFunction(
-    api_key=openai_api_key, model_name="text-embedding-3-small"
-)
+collection_name = clientes.COLLECTION_NAME
+# Lojista da linha de comando (--merchant); None é a base padrão
+merchant_id = None
 
-chroma_client = chromadb.CloudClient(
-    api_key=os.getenv("CHROMADB_API_KEY"),
-    tenant=os.getenv("CHROMADB_TENANT_ID"),
-    database=os.getenv("CHROMADB"),
-)
+# Clientes criados sob demanda e compartilhados no processo (clientes.py):
+# importar este módulo não abre conexões
 
-# Initialize the Chroma client with persistence
-# chroma_client = chromadb.PersistentClient(path="chroma_persistent_storage")
-collection_name = "texto_gerado"
-collection = chroma_client.get_or_create_collection(
-    name=collection_name, embedding_function=openai_ef
-)
 
-client = OpenAI(api_key=openai_api_key)
+def get_client():
+    """Retorna o cliente OpenAI (criado na primeira chamada)"""
+    return clientes.get_openai_client(openai_api_key)
+
+
+def get_collection():
+    """Retorna a coleção do Chroma (conecta na primeira chamada)"""
+    # Para o Chroma local: clientes.get_collection("persistent", collection_name)
+    return clientes.get_collection("cloud", collection_name)
+
 
 """
 Modelo de Pergunta ao Chat
@@ -59,100 +82,248 @@ def carregar_documentos(directory_path):
     return documents
 
 
-# Function que divide o texto em chunks
-def split_text(text, chunk_size=1000, chunk_overlap=20):
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        chunks.append(text[start:end])
-        start = end - chunk_overlap
-    return chunks
-
-
-# Carrega os documentos
+# Pasta com os documentos da base de conhecimento
 base_dir = os.path.dirname(os.path.abspath(__file__))
 directory_path = os.path.join(base_dir, "docs")
-if not os.path.isdir(directory_path):
-    raise FileNotFoundError(f"Pasta 'docs' não encontrada em: {directory_path}")
-documents = carregar_documentos(directory_path)
-
-print(f"Loaded {len(documents)} documents")
-
-
-# Split documents into chunks
-chunked_documents = []
-for doc in documents:
-    chunks = split_text(doc["text"])
-    for i, chunk in enumerate(chunks):
-        chunked_documents.append({"id": f"{doc['id']}_chunk{i + 1}", "text": chunk})
-
-# print(f"O documento foi dividido em {len(chunked_documents)} chunks")
 
 
 # Function to generate embeddings using OpenAI API
 def get_openai_embedding(text):
-    response = client.embeddings.create(input=text, model="text-embedding-3-small")
+    response = get_client().embeddings.create(
+        input=text, model=EMBEDDING_MODEL
+    )
     embedding = response.data[0].embedding
     return embedding
 
 
-# Generate embeddings for the document chunks
-for doc in chunked_documents:
-    doc["embedding"] = get_openai_embedding(doc["text"])
+# Function to index only new or changed chunks, using the manifest
+def indexar_incremental(documents, full=False):
+    # Um POST /ingest do mesmo lojista não grava o manifesto no meio da indexação
+    with bloqueio_colecao(collection_name):
+        return _indexar_incremental(documents, full)
 
-# print(doc["embedding"])
 
-# Upsert documents with embeddings into Chroma
-for doc in chunked_documents:
-    collection.upsert(
-        ids=[doc["id"]], documents=[doc["text"]], embeddings=[doc["embedding"]]
+def _indexar_incremental(documents, full):
+    collection = get_collection()
+    manifest = None if full else carregar_manifesto(collection_name)
+    plan = planejar_reindexacao(
+        documents,
+        manifest,
+        lambda doc: dividir_documento(doc, CHUNK_PARAMS),
+        EMBEDDING_MODEL,
+        CHUNK_PARAMS,
+    )
+    print(
+        f"{len(plan['unchanged_files'])} arquivos sem mudança | "
+        f"{len(plan['changed_files'])} novos/alterados | "
+        f"{len(plan['removed_files'])} removidos"
     )
 
+    if plan["full"]:
+        # Sem manifesto confiável: remove da coleção tudo que não faz mais parte do corpus
+        current_ids = {cid for entry in plan["files"].values() for cid in entry["chunks"]}
+        existing_ids = collection.get(include=[])["ids"]
+        plan["to_delete"] = [cid for cid in existing_ids if cid not in current_ids]
 
-# Function to query documents
-def query_documents(question, n_results=2):
-    # query_embedding = get_openai_embedding(question)
-    results = collection.query(query_texts=question, n_results=n_results)
+    if plan["to_delete"]:
+        collection.delete(ids=plan["to_delete"])
+        print(f"🗑️ {len(plan['to_delete'])} chunks removidos da coleção")
+
+    if plan["to_embed"]:
+        # Generate embeddings in token-bounded batches and upsert them into Chroma in bulk
+        stats = executar_ingestao(plan["to_embed"], get_client(), collection)
+        imprimir_estatisticas(stats)
+        aplicar_falhas(plan, set(stats["failed_ids"]))
+    else:
+        print("✅ Nenhum chunk novo ou alterado, nada para embedar")
 
-    # Extract the relevant chunks
-    relevant_chunks = [doc for sublist in results["documents"] for doc in sublist]
-    return relevant_chunks
+    new_manifest = manifesto_vazio(collection_name, EMBEDDING_MODEL, CHUNK_PARAMS)
+    new_manifest["files"] = plan["files"]
+    salvar_manifesto(new_manifest)
+    return plan
 
-    # for idx, document in enumerate(results["documents"][0]):
-    #     doc_id = results["ids"][0][idx]
-    #     distance = results["distances"][0][idx]
-    #     print(f"Found document chunk: {document} (ID: {doc_id}, Distance: {distance})")
+
+
+# Query embeddings go through the process-wide embedding cache
+query_embedding_fn = clientes.get_query_embedding_fn(EMBEDDING_MODEL)
+
+
+def get_retriever():
+    """Retorna o retriever da coleção (híbrido com BM25 se RETRIEVER_HYBRID)"""
+    return clientes.get_retriever("chroma", "cloud", collection_name)
+
+
+_motor = None
+
+
+def get_motor():
+    """Motor do chat (motor.py) sobre a coleção do Chroma Cloud, criado sob demanda"""
+    global _motor
+    if _motor is None:
+        componentes = {}
+        if merchant_id:
+            # Prompt do produto padrão do lojista (lojistas.py)
+            try:
+                config = carregar_config(merchant_id, "chroma")
+            except LojistaDesconhecido:
+                config = {}
+            componentes["system_prompt"] = produto_do_lojista(config)[1]
+        _motor = MotorRAG(
+            retriever=get_retriever(), query_embedding_fn=query_embedding_fn, **componentes
+        )
+    return _motor
+
+
+# Function to query documents
+def query_documents(question, n_results=2):
+    return get_motor().query_documents(question, n_results=n_results)
 
 
 # Function to generate a response from OpenAI
 def generate_response(question, relevant_chunks):
-    context = "\n\n".join(relevant_chunks)
-    prompt = (
-        "Você é um assistente de vendas e tem a função de tirar as dúvidas dos clientes e converter em vendas, use o modelo"
-        " de objeções que o informamos e ajude o cliente a chegar até a venda, seu objetivo é vender. Se você não souber a resposta, diga que não saiba"
-        "\n\nContext:\n" + context + "\n\nQuestion:\n" + question
+    # Mesmo prompt, orçamento de tokens e resiliência do chat, sem histórico
+    return get_motor().generate_response(question, relevant_chunks, history=[])
+
+
+# Comandos da linha de comando
+def cmd_index(args):
+    if not os.path.isdir(args.docs):
+        raise FileNotFoundError(f"Pasta 'docs' não encontrada em: {args.docs}")
+    documents = carregar_documentos(args.docs)
+    print(f"Loaded {len(documents)} documents")
+    indexar_incremental(documents, full=args.command == "reindex")
+
+
+def cmd_stats(args):
+    manifest = carregar_manifesto(collection_name)
+    print(f"Coleção: {collection_name}")
+    print(f"Chunks na coleção: {get_collection().count()}")
+    if manifest is None:
+        print("Manifesto: ausente (o próximo 'index' reindexa tudo)")
+        return
+    print(f"Modelo de embedding: {manifest['embedding_model']}")
+    print(f"Parâmetros de chunking: {manifest['chunk_params']}")
+    for filename, entry in sorted(manifest["files"].items()):
+        print(f"   📄 {filename}: {len(entry['chunks'])} chunks")
+
+
+def cmd_query(args):
+    relevant_chunks = query_documents(args.question, n_results=args.n_results)
+    for i, chunk in enumerate(relevant_chunks, 1):
+        print(f"---- Chunk {i} ----")
+        print(chunk)
+    if not args.no_answer:
+        answer = generate_response(args.question, relevant_chunks)
+        print("---- Resposta ----")
+        print(answer)
+
+
+def cmd_batch(args):
+    entrada = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+    with entrada:
+        itens = ler_jsonl(entrada)
+    output = args.output or f"{os.path.splitext(args.input)[0]}_respostas.jsonl"
+    if args.input == "-" and not args.output:
+        output = "respostas.jsonl"
+    print(f"==== Respondendo {len(itens)} perguntas (até {args.concurrency} simultâneas) ====")
+    with open(output, "w", encoding="utf-8") as file:
+        for resultado in responder_lote(get_motor(), itens, args.concurrency, args.cache):
+            file.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+            file.flush()
+    tempos = resultado["timings_ms"]
+    print(
+        f"✅ {resultado['items']} respostas em {tempos['total'] / 1000:.2f}s "
+        f"({resultado['items_per_second']:.1f}/s; embedding {tempos['embedding']:.0f} ms, "
+        f"busca {tempos['retrieval']:.0f} ms) salvas em {output}"
     )
-
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {
-                "role": "system",
-                "content": prompt,
-            },
-            {
-                "role": "user",
-                "content": question,
-            },
-        ],
+    print(f"   Origens: {resultado['sources']}")
+
+
+def cmd_snapshot(args):
+    # O manifesto diz com que modelo e chunking a coleção foi indexada
+    manifest = carregar_manifesto(collection_name) or {}
+    metadata = {
+        "collection": collection_name,
+        "embedding_model": manifest.get("embedding_model", EMBEDDING_MODEL),
+        "chunk_params": manifest.get("chunk_params", CHUNK_PARAMS),
+    }
+    output = args.output or (
+        caminho_snapshot_lojista(merchant_id) if merchant_id else caminho_snapshot(collection_name)
     )
+    total = exportar_snapshot(get_collection(), output, args.dtype, metadata)
+    tamanho = os.path.getsize(output) / 1024
+    print(f"✅ Snapshot com {total} chunks ({args.dtype}, {tamanho:.0f} KiB) salvo em {output}")
 
-    answer = response.choices[0].message
-    return answer
 
-
-question = "A empresa é confiável?"
-relevant_chunks = query_documents(question)
-answer = generate_response(question, relevant_chunks)
-print(answer.content)
+def main(argv=None):
+    global collection_name, merchant_id
+    parser = argparse.ArgumentParser(
+        description="Indexação e consulta da base de conhecimento do chat"
+    )
+    parser.add_argument(
+        "--merchant",
+        help="lojista: usa a coleção texto_gerado_<merchant> em vez da base padrão",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+
+    for name, help_text in (
+        ("index", "indexa apenas documentos novos ou alterados (padrão)"),
+        ("reindex", "descarta o manifesto e reindexa todos os documentos"),
+    ):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument(
+            "--docs",
+            help="pasta com os .txt (padrão: docs/, ou a pasta 'docs' da configuração com --merchant)",
+        )
+        sub.set_defaults(func=cmd_index)
+
+    sub = subparsers.add_parser("stats", help="mostra o estado da coleção e do manifesto")
+    sub.set_defaults(func=cmd_stats)
+
+    sub = subparsers.add_parser("query", help="busca chunks e gera uma resposta")
+    sub.add_argument("question")
+    sub.add_argument("-n", "--n-results", type=int, default=2)
+    sub.add_argument("--no-answer", action="store_true", help="só mostra os chunks")
+    sub.set_defaults(func=cmd_query)
+
+    sub = subparsers.add_parser(
+        "batch", help="responde um JSONL de perguntas (avaliação offline)"
+    )
+    sub.add_argument("input", help='JSONL com {"question": ...} por linha ("-" lê da entrada padrão)')
+    sub.add_argument("-o", "--output", help="JSONL das respostas (padrão: <input>_respostas.jsonl)")
+    sub.add_argument("-c", "--concurrency", type=int, default=BATCH_CONCURRENCY)
+    sub.add_argument("--cache", action="store_true", help="usa o cache de respostas")
+    sub.set_defaults(func=cmd_batch)
+
+    sub = subparsers.add_parser(
+        "snapshot", help="exporta os embeddings da coleção para o retriever local"
+    )
+    sub.add_argument("--output", help="arquivo do snapshot (padrão: o da coleção em SNAPSHOT_DIR ou TENANT_SNAPSHOT_DIR)")
+    sub.add_argument(
+        "--dtype",
+        choices=["float32", "float16"],
+        default="float32",
+        help="precisão da matriz (float16 ocupa metade)",
+    )
+    sub.set_defaults(func=cmd_snapshot)
+
+    args = parser.parse_args(argv)
+    if args.command is None:
+        # Compatível com o uso antigo: 'python rag.py' indexa os documentos
+        args = parser.parse_args((sys.argv[1:] if argv is None else argv) + ["index"])
+    if args.merchant:
+        merchant_id = args.merchant
+        collection_name = collection_do_lojista(merchant_id)
+    if args.func is cmd_index and args.docs is None:
+        # Nunca a pasta da base padrão para um lojista: iria para a coleção dele
+        args.docs = pasta_docs(merchant_id) if merchant_id else directory_path
+        if args.docs is None:
+            parser.error(
+                f"informe --docs ou \"docs\" em {caminho_config(merchant_id)} "
+                f"para indexar o lojista {merchant_id}"
+            )
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,481 @@
+"""
+Resiliência das chamadas à OpenAI (completions e embeddings)
+
+Cada tipo de chamada tem uma Politica com:
+
+- prazo por tentativa adaptativo: TIMEOUT_P99_FACTOR x p99 das latências
+  recentes, entre o mínimo e o máximo configurados, e um prazo total
+  (deadline) que limita a soma das tentativas e esperas
+- retry com backoff exponencial e jitter só para erros transitórios
+  (timeout, conexão, 429 e 5xx), limitado por um orçamento de retries: cada
+  chamada deposita RETRY_BUDGET_RATIO e cada retry ou hedge gasta 1, então
+  numa falha geral os retries não multiplicam a carga sobre a OpenAI
+- hedge: se a resposta passa do p95 recente, dispara uma segunda requisição
+  igual e fica com a que chegar primeiro (também paga pelo orçamento)
+- circuit breaker: após BREAKER_FAILURES falhas transitórias seguidas a
+  política recusa chamadas por BREAKER_COOLDOWN segundos (CircuitoAberto)
+  e depois deixa passar uma chamada de teste
+
+completar()/acompletar() tentam o modelo principal (LLM_MODEL) e, se ele
+estiver indisponível, o modelo de reserva (LLM_FALLBACK_MODEL), cada um com
+sua política. Os demais fallbacks (resposta em cache, busca só lexical)
+ficam com quem chama. O SDK da OpenAI não refaz as chamadas (OPENAI_MAX_RETRIES=0):
+os retries ficam todos aqui. Os eventos vão para stats() (/stats) e para o
+contador rag_resilience_total do /metrics.
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import openai
+
+from metricas import METRICS_ENABLED, Histograma, get_metrics
+
+TIMEOUT_P99_FACTOR = float(os.getenv("TIMEOUT_P99_FACTOR", "3"))
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.2"))
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.2"))
+RETRY_BUDGET_MIN = float(os.getenv("RETRY_BUDGET_MIN", "10"))
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "true").lower() == "true"
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.5"))
+# Amostras de latência necessárias antes de adaptar o prazo e fazer hedge
+RESILIENCE_MIN_SAMPLES = int(os.getenv("RESILIENCE_MIN_SAMPLES", "20"))
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))
+
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+# Modelo mais barato usado quando o principal falha ("" desativa)
+LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL", "")
+
+# (prazo mínimo e máximo por tentativa, prazo total) de cada política, em segundos
+PRAZOS = {
+    "completion": (
+        float(os.getenv("LLM_TIMEOUT_MIN", "5")),
+        float(os.getenv("LLM_TIMEOUT_MAX", "30")),
+        float(os.getenv("LLM_DEADLINE", "45")),
+    ),
+    "completion_fallback": (
+        float(os.getenv("LLM_TIMEOUT_MIN", "5")),
+        float(os.getenv("LLM_TIMEOUT_MAX", "30")),
+        float(os.getenv("LLM_DEADLINE", "45")),
+    ),
+    "embedding": (
+        float(os.getenv("EMBEDDING_TIMEOUT_MIN", "2")),
+        float(os.getenv("EMBEDDING_TIMEOUT_MAX", "10")),
+        float(os.getenv("EMBEDDING_DEADLINE", "15")),
+    ),
+}
+
+# Threads das requisições com hedge (a original e a cópia correm em paralelo)
+_executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="hedge")
+
+
+class CircuitoAberto(Exception):
+    """A política recusou a chamada porque o circuit breaker está aberto"""
+
+
+def erro_transitorio(erro):
+    """Timeout, falha de conexão, 429 ou 5xx: vale tentar de novo"""
+    if isinstance(erro, (TimeoutError, asyncio.TimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(erro, openai.APIStatusError):
+        return erro.status_code == 429 or erro.status_code >= 500
+    return False
+
+
+class CircuitBreaker:
+    """Fechado -> aberto após `falhas` seguidas -> meio aberto após `cooldown`"""
+
+    def __init__(self, falhas=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.falhas = falhas
+        self.cooldown = cooldown
+        self.consecutivas = 0
+        self.aberto_em = None
+        self.testando = False
+        self.aberturas = 0
+        self._lock = threading.Lock()
+
+    @property
+    def estado(self):
+        if self.aberto_em is None:
+            return "closed"
+        if time.monotonic() - self.aberto_em >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def permitir(self):
+        """A chamada pode seguir? No meio aberto passa uma chamada de teste por vez"""
+        with self._lock:
+            estado = self.estado
+            if estado == "closed":
+                return True
+            if estado == "half_open" and not self.testando:
+                self.testando = True
+                return True
+            return False
+
+    def sucesso(self):
+        with self._lock:
+            self.consecutivas = 0
+            self.aberto_em = None
+            self.testando = False
+
+    def falha(self):
+        """Registra uma falha; retorna True se o circuito abriu agora"""
+        with self._lock:
+            self.consecutivas += 1
+            reabriu = self.testando
+            self.testando = False
+            if reabriu or (self.aberto_em is None and self.consecutivas >= self.falhas):
+                self.aberto_em = time.monotonic()
+                self.aberturas += 1
+                return True
+            return False
+
+
+class OrcamentoRetry:
+    """Orçamento de retries: cada chamada deposita `proporcao`, cada retry gasta 1"""
+
+    def __init__(self, proporcao=RETRY_BUDGET_RATIO, minimo=RETRY_BUDGET_MIN):
+        self.proporcao = proporcao
+        self.maximo = max(minimo, 1.0)
+        self.saldo = self.maximo
+        self._lock = threading.Lock()
+
+    def depositar(self):
+        with self._lock:
+            self.saldo = min(self.maximo, self.saldo + self.proporcao)
+
+    def retirar(self):
+        with self._lock:
+            if self.saldo < 1.0:
+                return False
+            self.saldo -= 1.0
+            return True
+
+
+class Politica:
+    """Prazos, retries, hedge e circuit breaker de um tipo de chamada"""
+
+    def __init__(
+        self,
+        nome,
+        timeout_min=5.0,
+        timeout_max=30.0,
+        deadline=45.0,
+        tentativas=RETRY_MAX_ATTEMPTS,
+        espera_base=RETRY_BASE_DELAY,
+        hedge=HEDGE_ENABLED,
+        hedge_min=HEDGE_MIN_DELAY,
+        min_amostras=RESILIENCE_MIN_SAMPLES,
+        breaker=None,
+        orcamento=None,
+    ):
+        self.nome = nome
+        self.timeout_min = timeout_min
+        self.timeout_max = timeout_max
+        self.deadline = deadline
+        self.tentativas = max(1, tentativas)
+        self.espera_base = espera_base
+        self.hedge = hedge
+        self.hedge_min = hedge_min
+        self.min_amostras = min_amostras
+        self.breaker = breaker or CircuitBreaker()
+        self.orcamento = orcamento or OrcamentoRetry()
+        self.latencias = Histograma(window=512)
+        self.eventos = {}
+        self._lock = threading.Lock()
+
+    # Estado e contadores
+
+    def contar(self, evento):
+        """Conta um evento da política (stats() e rag_resilience_total)"""
+        with self._lock:
+            self.eventos[evento] = self.eventos.get(evento, 0) + 1
+        if METRICS_ENABLED:
+            get_metrics().incrementar("rag_resilience_total", policy=self.nome, event=evento)
+
+    def _observar(self, segundos):
+        with self._lock:
+            self.latencias.observar(segundos)
+
+    def _percentis(self):
+        with self._lock:
+            if len(self.latencias.recentes) < self.min_amostras:
+                return None
+            return self.latencias.percentis()
+
+    def timeout_atual(self):
+        """Prazo de uma tentativa: fator x p99 recente, entre o mínimo e o máximo"""
+        percentis = self._percentis()
+        if percentis is None:
+            return self.timeout_max
+        return min(self.timeout_max, max(self.timeout_min, TIMEOUT_P99_FACTOR * percentis["p99"]))
+
+    def atraso_hedge(self):
+        """Espera antes do hedge (p95 recente), ou None sem amostras suficientes"""
+        percentis = self._percentis()
+        if not self.hedge or percentis is None:
+            return None
+        return max(self.hedge_min, percentis["p95"])
+
+    def stats(self):
+        percentis = self._percentis()
+        with self._lock:
+            eventos = dict(self.eventos)
+        return {
+            "state": self.breaker.estado,
+            "retry_budget": round(self.orcamento.saldo, 2),
+            "timeout_s": self.timeout_atual(),
+            "hedge_delay_s": self.atraso_hedge(),
+            "p95_s": percentis["p95"] if percentis else None,
+            **{evento: eventos.get(evento, 0) for evento in EVENTOS},
+        }
+
+    # Execução
+
+    def _iniciar(self):
+        if not self.breaker.permitir():
+            self.contar("rejected")
+            raise CircuitoAberto(f"Circuito '{self.nome}' aberto")
+        self.contar("calls")
+        self.orcamento.depositar()
+        return time.monotonic() + self.deadline
+
+    def _falhou(self, erro, tentativa, limite):
+        """Registra a falha; retorna a espera antes do retry ou None para desistir"""
+        if not erro_transitorio(erro):
+            # Erro da requisição (400, autenticação...): não é culpa da OpenAI
+            self.breaker.sucesso()
+            self.contar("errors")
+            return None
+        self.contar("timeouts" if "Timeout" in type(erro).__name__ else "failures")
+        if self.breaker.falha():
+            self.contar("breaker_opened")
+        if tentativa >= self.tentativas or self.breaker.estado != "closed":
+            return None
+        espera = self.espera_base * (2 ** (tentativa - 1)) * random.uniform(0.5, 1.5)
+        if time.monotonic() + espera >= limite:
+            return None
+        if not self.orcamento.retirar():
+            self.contar("budget_exhausted")
+            return None
+        self.contar("retries")
+        return espera
+
+    def _sucesso(self, inicio, amostrar):
+        self.breaker.sucesso()
+        if amostrar:
+            self._observar(time.monotonic() - inicio)
+
+    def executar(self, chamar, hedge=True, amostrar=True):
+        """
+        Executa chamar(timeout) com prazos, retries, hedge e circuit breaker
+
+        Propaga CircuitoAberto ou o último erro quando não há mais o que
+        tentar. amostrar=False não usa a latência para adaptar os prazos
+        (ex.: abertura de um stream, bem mais rápida que a resposta inteira).
+        """
+        limite = self._iniciar()
+        tentativa = 0
+        while True:
+            tentativa += 1
+            timeout = min(self.timeout_atual(), limite - time.monotonic())
+            inicio = time.monotonic()
+            try:
+                if timeout <= 0:
+                    raise TimeoutError(f"Prazo total de '{self.nome}' esgotado")
+                atraso = self.atraso_hedge() if hedge else None
+                if atraso is None or atraso >= timeout:
+                    resultado = chamar(timeout)
+                else:
+                    resultado = self._com_hedge(chamar, timeout, atraso)
+            except Exception as erro:
+                espera = self._falhou(erro, tentativa, limite)
+                if espera is None:
+                    raise
+                time.sleep(espera)
+                continue
+            self._sucesso(inicio, amostrar)
+            return resultado
+
+    def _com_hedge(self, chamar, timeout, atraso):
+        # O prazo conta desde a chamada original, não desde o hedge
+        prazo = time.monotonic() + timeout
+        original = _executor.submit(chamar, timeout)
+        prontos, _ = wait([original], timeout=atraso)
+        if prontos or not self.orcamento.retirar():
+            return original.result(timeout=max(0.0, prazo - time.monotonic()))
+        self.contar("hedges")
+        copia = _executor.submit(chamar, timeout - atraso)
+        pendentes = {original, copia}
+        erro = None
+        while pendentes:
+            prontos, pendentes = wait(
+                pendentes,
+                timeout=max(0.0, prazo - time.monotonic()),
+                return_when=FIRST_COMPLETED,
+            )
+            if not prontos:
+                raise TimeoutError(f"Prazo de '{self.nome}' esgotado com hedge")
+            for future in prontos:
+                if future.exception() is None:
+                    if future is copia:
+                        self.contar("hedge_wins")
+                    return future.result()
+                erro = future.exception()
+        raise erro
+
+    async def aexecutar(self, achamar, hedge=True, amostrar=True):
+        """Versão assíncrona de executar: achamar(timeout) é uma corrotina"""
+        limite = self._iniciar()
+        tentativa = 0
+        while True:
+            tentativa += 1
+            timeout = min(self.timeout_atual(), limite - time.monotonic())
+            inicio = time.monotonic()
+            try:
+                if timeout <= 0:
+                    raise TimeoutError(f"Prazo total de '{self.nome}' esgotado")
+                atraso = self.atraso_hedge() if hedge else None
+                if atraso is None or atraso >= timeout:
+                    resultado = await asyncio.wait_for(achamar(timeout), timeout)
+                else:
+                    resultado = await self._acom_hedge(achamar, timeout, atraso)
+            except Exception as erro:
+                espera = self._falhou(erro, tentativa, limite)
+                if espera is None:
+                    raise
+                await asyncio.sleep(espera)
+                continue
+            self._sucesso(inicio, amostrar)
+            return resultado
+
+    async def _acom_hedge(self, achamar, timeout, atraso):
+        prazo = time.monotonic() + timeout
+        original = asyncio.ensure_future(achamar(timeout))
+        tarefas = {original}
+        try:
+            prontos, _ = await asyncio.wait(tarefas, timeout=atraso)
+            if not prontos and self.orcamento.retirar():
+                self.contar("hedges")
+                tarefas.add(asyncio.ensure_future(achamar(timeout - atraso)))
+            erro = None
+            pendentes = set(tarefas)
+            while pendentes:
+                prontos, pendentes = await asyncio.wait(
+                    pendentes,
+                    timeout=max(0.0, prazo - time.monotonic()),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not prontos:
+                    raise TimeoutError(f"Prazo de '{self.nome}' esgotado com hedge")
+                for tarefa in prontos:
+                    if tarefa.exception() is None:
+                        if tarefa is not original:
+                            self.contar("hedge_wins")
+                        return tarefa.result()
+                    erro = tarefa.exception()
+            raise erro
+        finally:
+            # A requisição que perdeu a corrida é cancelada
+            for tarefa in tarefas:
+                tarefa.cancel()
+
+
+EVENTOS = (
+    "calls",
+    "retries",
+    "hedges",
+    "hedge_wins",
+    "timeouts",
+    "failures",
+    "errors",
+    "budget_exhausted",
+    "breaker_opened",
+    "rejected",
+    "fallbacks",
+)
+
+_politicas = {}
+_politicas_lock = threading.Lock()
+
+
+def get_politica(nome):
+    """Política do processo para o tipo de chamada (criada na primeira chamada)"""
+    with _politicas_lock:
+        politica = _politicas.get(nome)
+        if politica is None:
+            timeout_min, timeout_max, deadline = PRAZOS.get(nome, PRAZOS["completion"])
+            politica = _politicas[nome] = Politica(nome, timeout_min, timeout_max, deadline)
+        return politica
+
+
+def resilience_stats():
+    """stats() de cada política já usada no processo (/stats)"""
+    with _politicas_lock:
+        politicas = dict(_politicas)
+    return {nome: politica.stats() for nome, politica in sorted(politicas.items())}
+
+
+def _modelos(principal=None):
+    """[(modelo, política)] na ordem em que são tentados"""
+    principal = principal or LLM_MODEL
+    modelos = [(principal, "completion")]
+    if LLM_FALLBACK_MODEL and LLM_FALLBACK_MODEL != principal:
+        modelos.append((LLM_FALLBACK_MODEL, "completion_fallback"))
+    return modelos
+
+
+def _usar_reserva(modelos, i, erro):
+    """Passa para o próximo modelo? Só se houver um e o erro for de disponibilidade"""
+    if i == len(modelos) - 1 or not (isinstance(erro, CircuitoAberto) or erro_transitorio(erro)):
+        return False
+    get_politica(modelos[i][1]).contar("fallbacks")
+    print(f"⚠️ {modelos[i][0]} indisponível ({erro}), usando {modelos[i + 1][0]}")
+    return True
+
+
+def completar(chamar, stream=False, modelo=None):
+    """
+    chamar(modelo, timeout) pelo modelo principal e, se preciso, pelo de reserva
+
+    modelo substitui LLM_MODEL como principal. Em streaming só a abertura do
+    stream passa pela política, sem hedge.
+    """
+    modelos = _modelos(modelo)
+    for i, (modelo, nome) in enumerate(modelos):
+        try:
+            return get_politica(nome).executar(
+                lambda timeout, modelo=modelo: chamar(modelo, timeout),
+                hedge=not stream,
+                amostrar=not stream,
+            )
+        except Exception as erro:
+            if not _usar_reserva(modelos, i, erro):
+                raise
+
+
+async def acompletar(achamar, stream=False, modelo=None):
+    """Versão assíncrona de completar: achamar(modelo, timeout) é uma corrotina"""
+    modelos = _modelos(modelo)
+    for i, (modelo, nome) in enumerate(modelos):
+        try:
+            return await get_politica(nome).aexecutar(
+                lambda timeout, modelo=modelo: achamar(modelo, timeout),
+                hedge=not stream,
+                amostrar=not stream,
+            )
+        except Exception as erro:
+            if not _usar_reserva(modelos, i, erro):
+                raise
+
+
+def descartar_politicas():
+    """Esquece as políticas do processo (a próxima chamada recria; usado nos benchmarks)"""
+    with _politicas_lock:
+        _politicas.clear()
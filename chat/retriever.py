@@ -0,0 +1,401 @@
+"""
+Backends de busca (retrievers) da base de conhecimento
+
+- ChromaRetriever: consulta a coleção do Chroma (Cloud ou persistente)
+- LocalRetriever: mantém os embeddings dos chunks em uma matriz NumPy,
+  mapeada em memória a partir de um snapshot local (snapshot.py), e faz o
+  top-k por similaridade de cosseno vetorizada, sem ida à rede para buscar
+- HybridRetriever: combina um dos dois com o índice BM25 (busca_lexical.py)
+  por reciprocal rank fusion; perguntas que são só uma palavra-chave exata
+  são respondidas pelo BM25 sem calcular o embedding
+
+Todos devolvem uma lista de {"id", "text", "distance"} em ordem de
+relevância; search_many busca um lote de perguntas já embedadas de uma vez
+(lote.py). Como os embeddings da OpenAI são normalizados, a ordem por
+distância L2 (padrão do Chroma) é a mesma da similaridade de cosseno.
+"""
+
+import asyncio
+import os
+from collections.abc import Sequence
+
+import numpy as np
+
+from busca_lexical import BM25Index
+from snapshot import carregar_snapshot, salvar_snapshot
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+SNAPSHOT_DIR = os.path.join(base_dir, "snapshots")
+
+# Sem a variável, a busca é híbrida só no backend local: no Chroma o índice
+# BM25 precisaria baixar a coleção inteira ao subir o processo
+RETRIEVER_HYBRID = os.getenv("RETRIEVER_HYBRID")
+if RETRIEVER_HYBRID is not None:
+    RETRIEVER_HYBRID = RETRIEVER_HYBRID.lower() == "true"
+LEXICAL_SHORTCUT = os.getenv("LEXICAL_SHORTCUT", "true").lower() == "true"
+# Linhas convertidas de float16 para float32 por vez na busca
+BLOCO_FLOAT16 = 4096
+
+
+def caminho_snapshot(collection_name, snapshot_dir=SNAPSHOT_DIR):
+    return os.path.join(snapshot_dir, f"{collection_name}.snap")
+
+
+class VectorRetriever:
+    """Busca a partir do embedding da pergunta (base dos backends vetoriais)"""
+
+    def search(self, question, embed, n_results=3, lexical_shortcut=True):
+        """Retorna (embedding da pergunta, resultados); embed(pergunta) -> vetor"""
+        embedding = embed(question)
+        return embedding, self.query_by_embedding(embedding, n_results)
+
+    async def asearch(self, question, aembed, n_results=3, lexical_shortcut=True):
+        embedding = await aembed(question)
+        return embedding, await self.aquery_by_embedding(embedding, n_results)
+
+    def query_by_embeddings(self, embeddings, n_results=3):
+        """Resultados de cada embedding (os backends fazem uma busca só)"""
+        return [self.query_by_embedding(embedding, n_results) for embedding in embeddings]
+
+    def search_many(self, questions, embeddings, n_results=3):
+        """Resultados de um lote de perguntas; embeddings None (falha) não acha nada"""
+        if embeddings is None:
+            return [[] for _ in questions]
+        return self.query_by_embeddings(embeddings, n_results)
+
+
+class ChromaRetriever(VectorRetriever):
+    """Busca pela coleção do Chroma"""
+
+    def __init__(self, collection, embedding_function=None):
+        self.collection = collection
+        # Se informada, a pergunta é embedada aqui (ex.: pelo cache de
+        # embeddings) em vez de pela função de embedding da coleção
+        self.embedding_function = embedding_function
+
+    def _resultados(self, results, i=0):
+        return [
+            {"id": chunk_id, "text": text, "distance": distance}
+            for chunk_id, text, distance in zip(
+                results["ids"][i], results["documents"][i], results["distances"][i]
+            )
+        ]
+
+    def query(self, question, n_results=3):
+        if self.embedding_function is not None:
+            embedding = self.embedding_function([question])[0]
+            return self.query_by_embedding(embedding, n_results)
+        results = self.collection.query(query_texts=question, n_results=n_results)
+        return self._resultados(results)
+
+    def query_by_embedding(self, embedding, n_results=3):
+        results = self.collection.query(
+            query_embeddings=[embedding], n_results=n_results
+        )
+        return self._resultados(results)
+
+    async def aquery_by_embedding(self, embedding, n_results=3):
+        # O cliente do Chroma é síncrono: roda em uma thread para não
+        # bloquear o event loop
+        return await asyncio.to_thread(self.query_by_embedding, embedding, n_results)
+
+    def query_by_embeddings(self, embeddings, n_results=3):
+        # Uma ida ao Chroma para o lote inteiro
+        if not len(embeddings):
+            return []
+        results = self.collection.query(
+            query_embeddings=[list(map(float, embedding)) for embedding in embeddings],
+            n_results=n_results,
+        )
+        return [self._resultados(results, i) for i in range(len(embeddings))]
+
+    def count(self):
+        return self.collection.count()
+
+    def documentos(self):
+        """IDs e textos de todos os chunks da coleção"""
+        data = self.collection.get(include=["documents"])
+        return data["ids"], data["documents"]
+
+
+class LocalRetriever(VectorRetriever):
+    """Busca em memória sobre uma matriz de embeddings normalizados"""
+
+    def __init__(self, ids, documents, embeddings, embedding_function=None, normalized=False, metadata=None):
+        if normalized:
+            # Matriz já normalizada (ex.: mapeada do snapshot): usada sem cópia
+            self.matrix = embeddings
+        else:
+            matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self.matrix = matrix / norms
+        self.ids = list(ids)
+        # Do snapshot os textos vêm como uma sequência lida sob demanda
+        self.documents = documents if isinstance(documents, Sequence) else list(documents)
+        self.embedding_function = embedding_function
+        self.metadata = metadata or {}
+
+    @classmethod
+    def from_snapshot(cls, path, embedding_function=None, embedding_model=None):
+        """
+        Abre um snapshot salvo por salvar_snapshot/exportar_snapshot
+
+        Com embedding_model, recusa um snapshot gerado com outro modelo (os
+        vetores das perguntas não seriam comparáveis aos dos chunks).
+        """
+        snap = carregar_snapshot(path)
+        if embedding_model and snap.embedding_model and snap.embedding_model != embedding_model:
+            raise ValueError(
+                f"Snapshot {path} gerado com {snap.embedding_model}, mas as perguntas "
+                f"usam {embedding_model}. Gere de novo com 'python rag.py snapshot'"
+            )
+        return cls(
+            snap.ids,
+            snap.documents,
+            snap.embeddings,
+            embedding_function,
+            normalized=snap.normalized,
+            metadata=snap.stats(),
+        )
+
+    def _scores(self, query):
+        """Similaridade de cada chunk com query (vetor, ou dimensão x perguntas)"""
+        if self.matrix.dtype == np.float32:
+            return self.matrix @ query
+        # float16: converte por blocos para não materializar a matriz inteira em float32
+        scores = np.empty((len(self.ids),) + query.shape[1:], dtype=np.float32)
+        for inicio in range(0, len(self.ids), BLOCO_FLOAT16):
+            bloco = self.matrix[inicio : inicio + BLOCO_FLOAT16]
+            scores[inicio : inicio + len(bloco)] = bloco.astype(np.float32) @ query
+        return scores
+
+    def query(self, question, n_results=3):
+        if self.embedding_function is None:
+            raise ValueError("LocalRetriever sem embedding_function não aceita texto")
+        embedding = self.embedding_function([question])[0]
+        return self.query_by_embedding(embedding, n_results)
+
+    def query_by_embedding(self, embedding, n_results=3):
+        if not self.ids:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        return self._top(self._scores(query), n_results)
+
+    def _top(self, scores, n_results):
+        """Os n_results chunks de maior similaridade, em ordem"""
+        k = min(n_results, len(self.ids))
+        if k < len(self.ids):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(self.ids))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [
+            {
+                "id": self.ids[i],
+                "text": self.documents[i],
+                "distance": float(1.0 - scores[i]),
+            }
+            for i in top
+        ]
+
+    def query_by_embeddings(self, embeddings, n_results=3):
+        """Top-k de várias perguntas com um único produto de matrizes"""
+        if not self.ids or not len(embeddings):
+            return [[] for _ in embeddings]
+        queries = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        # chunks x perguntas: uma coluna de similaridades por pergunta
+        scores = self._scores(np.ascontiguousarray((queries / norms).T))
+        return [self._top(scores[:, j], n_results) for j in range(scores.shape[1])]
+
+    async def aquery_by_embedding(self, embedding, n_results=3):
+        # Busca em memória leva microssegundos: roda direto no event loop
+        return self.query_by_embedding(embedding, n_results)
+
+    def count(self):
+        return len(self.ids)
+
+    def documentos(self):
+        return self.ids, self.documents
+
+
+class HybridRetriever:
+    """
+    Busca híbrida: BM25 + vetorial, combinadas por reciprocal rank fusion
+
+    Cada lista contribui 1 / (rrf_k + posição) para o chunk. Com
+    lexical_shortcut, uma pergunta curta cujos termos apontam claramente
+    para um chunk (BM25Index.exact_match) é respondida só pelo BM25, sem
+    a chamada de embedding.
+    """
+
+    def __init__(
+        self,
+        retriever,
+        lexical_index,
+        embedding_function=None,
+        rrf_k=60,
+        candidates=10,
+        lexical_shortcut=LEXICAL_SHORTCUT,
+    ):
+        self.retriever = retriever
+        self.lexical_index = lexical_index
+        self.embedding_function = embedding_function
+        self.rrf_k = rrf_k
+        self.candidates = candidates
+        self.lexical_shortcut = lexical_shortcut
+        self.shortcuts = 0
+        self.lexical_fallbacks = 0
+
+    def _atalho(self, question, n_results, lexical_shortcut):
+        if not (self.lexical_shortcut and lexical_shortcut):
+            return None
+        lexicais = self.lexical_index.exact_match(question, n_results)
+        if lexicais is None:
+            return None
+        self.shortcuts += 1
+        return [{"id": r["id"], "text": r["text"], "distance": None} for r in lexicais]
+
+    def _fundir(self, question, vetoriais, n_results):
+        lexicais = self.lexical_index.query(question, self.candidates)
+        scores, por_id = {}, {}
+        for resultados in (vetoriais, lexicais):
+            for posicao, result in enumerate(resultados):
+                chunk_id = result["id"]
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (self.rrf_k + posicao + 1)
+                por_id.setdefault(
+                    chunk_id,
+                    {"id": chunk_id, "text": result["text"], "distance": result.get("distance")},
+                )
+        ordem = sorted(scores, key=lambda chunk_id: -scores[chunk_id])
+        return [por_id[chunk_id] for chunk_id in ordem[:n_results]]
+
+    def _so_lexical(self, question, n_results, erro):
+        """Resultados só do BM25 quando o embedding da pergunta falhou"""
+        print(f"⚠️ Embedding indisponível, busca só lexical: {erro}")
+        self.lexical_fallbacks += 1
+        lexicais = self.lexical_index.query(question, n_results)
+        return None, [{"id": r["id"], "text": r["text"], "distance": None} for r in lexicais]
+
+    def search(self, question, embed, n_results=3, lexical_shortcut=True):
+        """
+        Retorna (embedding da pergunta, resultados)
+
+        O embedding é None quando o atalho lexical respondeu sozinho. Quem
+        precisa do embedding (ex.: cache de respostas) passa lexical_shortcut=False.
+        """
+        atalho = self._atalho(question, n_results, lexical_shortcut)
+        if atalho is not None:
+            return None, atalho
+        try:
+            embedding = embed(question)
+        except Exception as e:
+            return self._so_lexical(question, n_results, e)
+        vetoriais = self.retriever.query_by_embedding(embedding, self.candidates)
+        return embedding, self._fundir(question, vetoriais, n_results)
+
+    async def asearch(self, question, aembed, n_results=3, lexical_shortcut=True):
+        atalho = self._atalho(question, n_results, lexical_shortcut)
+        if atalho is not None:
+            return None, atalho
+        try:
+            embedding = await aembed(question)
+        except Exception as e:
+            return self._so_lexical(question, n_results, e)
+        vetoriais = await self.retriever.aquery_by_embedding(embedding, self.candidates)
+        return embedding, self._fundir(question, vetoriais, n_results)
+
+    def query(self, question, n_results=3):
+        if self.embedding_function is None:
+            raise ValueError("HybridRetriever sem embedding_function não aceita texto")
+
+        def embed(text):
+            return self.embedding_function([text])[0]
+
+        return self.search(question, embed, n_results)[1]
+
+    def query_by_embedding(self, embedding, n_results=3):
+        # Sem o texto da pergunta não há BM25: só a busca vetorial
+        return self.retriever.query_by_embedding(embedding, n_results)
+
+    def query_by_embeddings(self, embeddings, n_results=3):
+        return self.retriever.query_by_embeddings(embeddings, n_results)
+
+    def search_many(self, questions, embeddings, n_results=3):
+        """
+        Resultados de um lote de perguntas já embedadas
+
+        A parte vetorial é uma busca só para o lote; o BM25 e a fusão são por
+        pergunta. Sem embeddings (a chamada falhou), só o BM25.
+        """
+        if embeddings is None:
+            self.lexical_fallbacks += len(questions)
+            return [
+                [{"id": r["id"], "text": r["text"], "distance": None} for r in self.lexical_index.query(question, n_results)]
+                for question in questions
+            ]
+        vetoriais = self.retriever.query_by_embeddings(embeddings, self.candidates)
+        return [
+            self._fundir(question, resultados, n_results)
+            for question, resultados in zip(questions, vetoriais)
+        ]
+
+    async def aquery_by_embedding(self, embedding, n_results=3):
+        return await self.retriever.aquery_by_embedding(embedding, n_results)
+
+    def count(self):
+        return self.retriever.count()
+
+    def documentos(self):
+        return self.retriever.documentos()
+
+
+def exportar_snapshot(collection, path, dtype="float32", metadata=None):
+    """Salva ids, textos e embeddings da coleção em um snapshot"""
+    data = collection.get(include=["documents", "embeddings"])
+    return salvar_snapshot(
+        path, data["ids"], data["documents"], data["embeddings"], dtype=dtype, metadata=metadata
+    )
+
+
+def criar_retriever(
+    backend,
+    collection_factory,
+    embedding_function,
+    snapshot_path,
+    hybrid=RETRIEVER_HYBRID,
+    embedding_model=None,
+):
+    """
+    Cria o retriever configurado ("chroma" ou "local"), híbrido com BM25 se `hybrid`
+
+    `collection_factory` só é chamada no backend do Chroma, então o backend
+    local não abre conexão com o Chroma; embedding_model é conferido com o
+    modelo gravado no snapshot. hybrid=None: híbrido só no backend local.
+    """
+    if hybrid is None:
+        hybrid = backend == "local"
+    if backend == "local":
+        if not os.path.exists(snapshot_path):
+            raise FileNotFoundError(
+                f"Snapshot não encontrado em {snapshot_path}. "
+                "Gere com 'python rag.py snapshot'"
+            )
+        retriever = LocalRetriever.from_snapshot(
+            snapshot_path, embedding_function, embedding_model
+        )
+    elif backend == "chroma":
+        retriever = ChromaRetriever(collection_factory(), embedding_function)
+    else:
+        raise ValueError(f"Backend de busca desconhecido: {backend}")
+
+    if not hybrid:
+        return retriever
+    # O índice BM25 é montado em memória sobre os mesmos chunks (no Chroma,
+    # todos os textos da coleção são baixados aqui)
+    return HybridRetriever(retriever, BM25Index(*retriever.documentos()), embedding_function)
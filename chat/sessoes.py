@@ -0,0 +1,383 @@
+"""
+Histórico de conversa por sessão
+
+Cada cliente do site tem a própria conversa, identificada pelo session_id
+da requisição. O histórico de cada sessão é limitado às últimas mensagens,
+sessões ociosas expiram e o total de memória ocupada tem um teto: ao
+passar dele, as sessões usadas há mais tempo são descartadas primeiro.
+
+Backends (SESSION_BACKEND), todos com get_history/append/clear/stats e as
+versões assíncronas aget_history/aappend/aclear:
+
+- memory: dicionário no processo (padrão; cada worker tem as suas sessões)
+- sqlite: arquivo SQLite em modo WAL, compartilhado pelos workers da máquina
+- redis: servidor Redis, compartilhado entre máquinas (requer o pacote redis)
+
+Nos dois últimos, qualquer worker continua a conversa de qualquer sessão,
+sem precisar de sticky routing no balanceador.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # redis é opcional (só para SESSION_BACKEND=redis)
+    redis = None
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_DB_PATH = os.getenv(
+    "SESSION_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions", "sessions.db"),
+)
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+SESSION_MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", "20"))
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "1800"))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Custo fixo estimado por mensagem e por sessão (dicionários, listas, chaves)
+BYTES_POR_MENSAGEM = 200
+BYTES_POR_SESSAO = 500
+
+
+def serializar_mensagens(messages):
+    """JSON compacto e comprimido (zlib) de uma lista de mensagens"""
+    dados = json.dumps(messages, ensure_ascii=False, separators=(",", ":"))
+    return zlib.compress(dados.encode("utf-8"))
+
+
+def desserializar_mensagens(dados):
+    return json.loads(zlib.decompress(dados).decode("utf-8"))
+
+
+def tamanho_mensagens(messages):
+    """Estimativa dos bytes ocupados por uma lista de mensagens"""
+    return sum(
+        BYTES_POR_MENSAGEM + len(m.get("content") or "") * 2 for m in messages
+    )
+
+
+class InMemorySessionStore:
+    """Sessões em memória, em ordem de uso (LRU)"""
+
+    def __init__(
+        self,
+        max_messages=SESSION_MAX_MESSAGES,
+        idle_ttl=SESSION_IDLE_TTL,
+        max_sessions=SESSION_MAX_SESSIONS,
+        max_bytes=SESSION_MAX_BYTES,
+    ):
+        self.max_messages = max_messages
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.expired = 0
+        self.evicted = 0
+        self._sessions = OrderedDict()  # session_id -> [mensagens, último uso, bytes]
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _remover(self, session_id):
+        _, _, tamanho = self._sessions.pop(session_id)
+        self._bytes -= tamanho
+
+    def _expirar(self, agora):
+        # As sessões estão em ordem de uso: basta olhar o começo da fila
+        while self._sessions:
+            session_id, (_, ultimo_uso, _) = next(iter(self._sessions.items()))
+            if agora - ultimo_uso < self.idle_ttl:
+                break
+            self._remover(session_id)
+            self.expired += 1
+
+    def _aplicar_limites(self):
+        while self._sessions and (
+            len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes
+        ):
+            self._remover(next(iter(self._sessions)))
+            self.evicted += 1
+
+    def get_history(self, session_id):
+        """Cópia do histórico da sessão (lista vazia se não existir)"""
+        with self._lock:
+            agora = time.monotonic()
+            self._expirar(agora)
+            sessao = self._sessions.get(session_id)
+            if sessao is None:
+                return []
+            sessao[1] = agora
+            self._sessions.move_to_end(session_id)
+            return list(sessao[0])
+
+    def append(self, session_id, messages):
+        """Acrescenta mensagens, mantendo só as últimas max_messages"""
+        with self._lock:
+            agora = time.monotonic()
+            self._expirar(agora)
+            sessao = self._sessions.get(session_id)
+            if sessao is None:
+                sessao = [[], agora, BYTES_POR_SESSAO]
+                self._sessions[session_id] = sessao
+                self._bytes += BYTES_POR_SESSAO
+            historico = (sessao[0] + list(messages))[-self.max_messages:]
+            tamanho = BYTES_POR_SESSAO + tamanho_mensagens(historico)
+            self._bytes += tamanho - sessao[2]
+            sessao[0], sessao[1], sessao[2] = historico, agora, tamanho
+            self._sessions.move_to_end(session_id)
+            self._aplicar_limites()
+
+    def clear(self, session_id):
+        """Apaga o histórico da sessão"""
+        with self._lock:
+            if session_id in self._sessions:
+                self._remover(session_id)
+
+    async def aget_history(self, session_id):
+        # Operações em memória levam microssegundos: rodam direto no event loop
+        return self.get_history(session_id)
+
+    async def aappend(self, session_id, messages):
+        self.append(session_id, messages)
+
+    async def aclear(self, session_id):
+        self.clear(session_id)
+
+    def stats(self):
+        with self._lock:
+            self._expirar(time.monotonic())
+            return {
+                "backend": "memory",
+                "sessions": len(self._sessions),
+                "bytes": self._bytes,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+                "max_messages": self.max_messages,
+                "expired": self.expired,
+                "evicted": self.evicted,
+            }
+
+
+class SQLiteSessionStore:
+    """
+    Sessões em um arquivo SQLite (WAL), compartilhado entre processos
+
+    Cada sessão é uma linha com o histórico serializado e o horário do último
+    uso. O modo WAL deixa leituras e escritas de vários workers correrem
+    juntas; append usa BEGIN IMMEDIATE para que duas mensagens simultâneas
+    da mesma sessão não se sobrescrevam.
+    """
+
+    # Remove as sessões expiradas no máximo uma vez a cada intervalo
+    INTERVALO_LIMPEZA = 60.0
+
+    def __init__(
+        self,
+        path=SESSION_DB_PATH,
+        max_messages=SESSION_MAX_MESSAGES,
+        idle_ttl=SESSION_IDLE_TTL,
+    ):
+        self.path = path
+        self.max_messages = max_messages
+        self.idle_ttl = idle_ttl
+        self.expired = 0
+        self._ultima_limpeza = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, timeout=30, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions "
+            "(session_id TEXT PRIMARY KEY, history BLOB NOT NULL, updated REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)"
+        )
+
+    def _limpar_expiradas(self, agora):
+        if agora - self._ultima_limpeza < self.INTERVALO_LIMPEZA:
+            return
+        self._ultima_limpeza = agora
+        cursor = self._conn.execute(
+            "DELETE FROM sessions WHERE updated < ?", (agora - self.idle_ttl,)
+        )
+        self.expired += cursor.rowcount
+
+    def _ler(self, session_id, agora):
+        row = self._conn.execute(
+            "SELECT history, updated FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None or agora - row[1] >= self.idle_ttl:
+            return None
+        return desserializar_mensagens(row[0])
+
+    def get_history(self, session_id):
+        """Histórico da sessão (lista vazia se não existir ou tiver expirado)"""
+        with self._lock:
+            agora = time.time()
+            historico = self._ler(session_id, agora)
+            if historico is None:
+                return []
+            self._conn.execute(
+                "UPDATE sessions SET updated = ? WHERE session_id = ?", (agora, session_id)
+            )
+            return historico
+
+    def append(self, session_id, messages):
+        """Acrescenta mensagens, mantendo só as últimas max_messages"""
+        with self._lock:
+            agora = time.time()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                historico = self._ler(session_id, agora) or []
+                historico = (historico + list(messages))[-self.max_messages:]
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sessions (session_id, history, updated) "
+                    "VALUES (?, ?, ?)",
+                    (session_id, serializar_mensagens(historico), agora),
+                )
+                self._limpar_expiradas(agora)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def clear(self, session_id):
+        """Apaga o histórico da sessão"""
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    async def aget_history(self, session_id):
+        # sqlite3 é síncrono: roda em uma thread para não bloquear o event loop
+        return await asyncio.to_thread(self.get_history, session_id)
+
+    async def aappend(self, session_id, messages):
+        await asyncio.to_thread(self.append, session_id, messages)
+
+    async def aclear(self, session_id):
+        await asyncio.to_thread(self.clear, session_id)
+
+    def stats(self):
+        with self._lock:
+            sessions, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(history)), 0) FROM sessions "
+                "WHERE updated >= ?",
+                (time.time() - self.idle_ttl,),
+            ).fetchone()
+        return {
+            "backend": "sqlite",
+            "sessions": sessions,
+            "bytes": total_bytes,
+            "max_messages": self.max_messages,
+            "idle_ttl": self.idle_ttl,
+            "expired": self.expired,
+        }
+
+
+class RedisSessionStore:
+    """
+    Sessões em um servidor Redis, compartilhado entre máquinas
+
+    Cada sessão é uma lista Redis com uma mensagem (JSON compacto) por item.
+    append faz RPUSH + LTRIM + EXPIRE em uma transação (MULTI/EXEC), então
+    o corte nas últimas max_messages e o TTL de ociosidade ficam no servidor.
+    """
+
+    PREFIXO = "chat:session:"
+
+    def __init__(
+        self,
+        url=SESSION_REDIS_URL,
+        max_messages=SESSION_MAX_MESSAGES,
+        idle_ttl=SESSION_IDLE_TTL,
+        client=None,
+    ):
+        if client is None:
+            if redis is None:
+                raise ImportError(
+                    "SESSION_BACKEND=redis requer o pacote redis (pip install redis)"
+                )
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.max_messages = max_messages
+        self.idle_ttl = idle_ttl
+
+    def _chave(self, session_id):
+        return f"{self.PREFIXO}{session_id}"
+
+    def get_history(self, session_id):
+        """Histórico da sessão (lista vazia se não existir ou tiver expirado)"""
+        chave = self._chave(session_id)
+        pipe = self.client.pipeline()
+        pipe.lrange(chave, 0, -1)
+        pipe.expire(chave, max(int(self.idle_ttl), 1))
+        itens, _ = pipe.execute()
+        return [json.loads(item) for item in itens]
+
+    def append(self, session_id, messages):
+        """Acrescenta mensagens, mantendo só as últimas max_messages"""
+        if not messages:
+            return
+        chave = self._chave(session_id)
+        pipe = self.client.pipeline()
+        pipe.rpush(
+            chave,
+            *[json.dumps(m, ensure_ascii=False, separators=(",", ":")) for m in messages],
+        )
+        pipe.ltrim(chave, -self.max_messages, -1)
+        pipe.expire(chave, max(int(self.idle_ttl), 1))
+        pipe.execute()
+
+    def clear(self, session_id):
+        """Apaga o histórico da sessão"""
+        self.client.delete(self._chave(session_id))
+
+    async def aget_history(self, session_id):
+        # Cliente síncrono: roda em uma thread para não bloquear o event loop
+        return await asyncio.to_thread(self.get_history, session_id)
+
+    async def aappend(self, session_id, messages):
+        await asyncio.to_thread(self.append, session_id, messages)
+
+    async def aclear(self, session_id):
+        await asyncio.to_thread(self.clear, session_id)
+
+    def stats(self):
+        return {
+            "backend": "redis",
+            "max_messages": self.max_messages,
+            "idle_ttl": self.idle_ttl,
+        }
+
+
+def criar_session_store(backend):
+    """Cria o armazenamento de sessões configurado ("memory", "sqlite" ou "redis")"""
+    if backend == "memory":
+        return InMemorySessionStore()
+    if backend == "sqlite":
+        return SQLiteSessionStore()
+    if backend == "redis":
+        return RedisSessionStore()
+    raise ValueError(f"Backend de sessões desconhecido: {backend}")
+
+
+_session_store = None
+_session_store_lock = threading.Lock()
+
+
+def get_session_store():
+    """Retorna o armazenamento de sessões do processo (SESSION_BACKEND)"""
+    global _session_store
+    with _session_store_lock:
+        if _session_store is None:
+            _session_store = criar_session_store(SESSION_BACKEND)
+        return _session_store
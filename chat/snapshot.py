@@ -0,0 +1,204 @@
+"""
+Snapshot dos embeddings da base de conhecimento (formato .snap)
+
+Um único arquivo versionado com tudo o que o retriever local precisa para
+responder sem chamar o Chroma nem re-embedar os docs:
+
+    RAGSNAP\\0 | tamanho do cabeçalho (uint32) | cabeçalho JSON | seções
+
+O cabeçalho guarda a versão do formato, o número de chunks, a dimensão, o
+dtype da matriz (float16 ou float32), o modelo de embedding, os parâmetros
+de chunking, a data de geração e o offset e tamanho de cada seção:
+
+- embeddings: matriz (chunks x dimensão) já normalizada
+- text_offsets / texts: offsets (int64) e textos dos chunks em UTF-8
+- id_offsets / ids: idem para os IDs
+
+As seções começam em offsets múltiplos de 64 bytes e são abertas com
+np.memmap: carregar o snapshot não lê a matriz nem os textos para a
+memória do processo, e vários workers que abrem o mesmo arquivo
+compartilham as mesmas páginas do cache do sistema operacional.
+
+Snapshots .npz da versão anterior continuam sendo lidos.
+"""
+
+import json
+import os
+import time
+from collections.abc import Sequence
+
+import numpy as np
+
+MAGIC = b"RAGSNAP\0"
+VERSAO_SNAPSHOT = 1
+ALINHAMENTO = 64
+DTYPES = ("float16", "float32")
+
+
+class Textos(Sequence):
+    """Lista de strings lida sob demanda de um blob UTF-8 mapeado em memória"""
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        inicio, fim = int(self.offsets[i]), int(self.offsets[i + 1])
+        return bytes(self.blob[inicio:fim]).decode("utf-8")
+
+
+class Snapshot:
+    """IDs, textos, matriz de embeddings e metadados de um snapshot"""
+
+    def __init__(self, ids, documents, embeddings, metadata=None, normalized=False):
+        self.ids = ids
+        self.documents = documents
+        self.embeddings = embeddings
+        self.metadata = metadata or {}
+        self.normalized = normalized
+
+    @property
+    def embedding_model(self):
+        return self.metadata.get("embedding_model")
+
+    def stats(self):
+        return {
+            "version": self.metadata.get("version"),
+            "chunks": len(self.ids),
+            "dimension": int(self.embeddings.shape[1]) if len(self.ids) else 0,
+            "dtype": str(self.embeddings.dtype),
+            "embedding_model": self.embedding_model,
+            "created": self.metadata.get("created"),
+        }
+
+
+def _codificar(textos):
+    """(offsets int64, blob UTF-8) de uma lista de strings"""
+    dados = [texto.encode("utf-8") for texto in textos]
+    offsets = np.zeros(len(dados) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(d) for d in dados], dtype=np.int64)
+    return offsets, b"".join(dados)
+
+
+def _normalizar(embeddings):
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    if matrix.ndim != 2:
+        matrix = matrix.reshape(len(matrix), -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def salvar_snapshot(path, ids, documents, embeddings, dtype="float32", metadata=None):
+    """
+    Grava o snapshot de forma atômica (arquivo temporário + rename)
+
+    dtype: "float32" ou "float16" (metade do tamanho; a ordem do top-k
+    praticamente não muda com embeddings normalizados).
+    metadata: modelo de embedding, parâmetros de chunking, coleção etc.
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"dtype deve ser um de {DTYPES}: {dtype}")
+    if not (len(ids) == len(documents) == len(embeddings)):
+        raise ValueError("ids, documents e embeddings devem ter o mesmo tamanho")
+
+    matrix = _normalizar(embeddings).astype(dtype) if len(ids) else np.zeros((0, 0), dtype=dtype)
+    text_offsets, texts = _codificar(documents)
+    id_offsets, ids_blob = _codificar(ids)
+    secoes = [
+        ("embeddings", matrix.tobytes()),
+        ("text_offsets", text_offsets.tobytes()),
+        ("texts", texts),
+        ("id_offsets", id_offsets.tobytes()),
+        ("ids", ids_blob),
+    ]
+
+    header = {
+        **(metadata or {}),
+        "version": VERSAO_SNAPSHOT,
+        "count": len(ids),
+        "dimension": int(matrix.shape[1]),
+        "dtype": dtype,
+        "normalized": True,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "sections": {},
+    }
+    # O cabeçalho tem os offsets das seções, que dependem do tamanho do
+    # cabeçalho: reserva espaço de sobra e completa com espaços
+    reserva = len(json.dumps(header).encode("utf-8")) + 64 * (len(secoes) + 1) + 256
+    inicio_dados = -(-(len(MAGIC) + 4 + reserva) // ALINHAMENTO) * ALINHAMENTO
+    posicao = inicio_dados
+    for nome, dados in secoes:
+        header["sections"][nome] = [posicao, len(dados)]
+        posicao = -(-(posicao + len(dados)) // ALINHAMENTO) * ALINHAMENTO
+    cabecalho = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    cabecalho = cabecalho.ljust(inicio_dados - len(MAGIC) - 4, b" ")
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(MAGIC)
+        file.write(len(cabecalho).to_bytes(4, "little"))
+        file.write(cabecalho)
+        for nome, dados in secoes:
+            file.seek(header["sections"][nome][0])
+            file.write(dados)
+        file.truncate(posicao)
+    os.replace(tmp_path, path)
+    return len(ids)
+
+
+def ler_cabecalho(path):
+    """Cabeçalho JSON de um snapshot .snap (sem abrir as seções)"""
+    with open(path, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} não é um snapshot (.snap)")
+        tamanho = int.from_bytes(file.read(4), "little")
+        header = json.loads(file.read(tamanho).decode("utf-8"))
+    if header.get("version") != VERSAO_SNAPSHOT:
+        raise ValueError(
+            f"Versão do snapshot não suportada: {header.get('version')} "
+            f"(esperada {VERSAO_SNAPSHOT}). Gere de novo com 'python rag.py snapshot'"
+        )
+    return header
+
+
+def _carregar_npz(path):
+    """Snapshot .npz do formato anterior (lido inteiro para a memória)"""
+    with np.load(path, allow_pickle=False) as data:
+        return Snapshot(
+            data["ids"].tolist(),
+            data["documents"].tolist(),
+            data["embeddings"].astype(np.float32),
+        )
+
+
+def carregar_snapshot(path):
+    """Abre o snapshot com as seções mapeadas em memória (somente leitura)"""
+    if path.endswith(".npz"):
+        return _carregar_npz(path)
+    header = ler_cabecalho(path)
+    secoes = header["sections"]
+    count, dimension = header["count"], header["dimension"]
+
+    def secao(nome, dtype, shape=None):
+        offset, nbytes = secoes[nome]
+        if nbytes == 0:
+            return np.zeros(shape or 0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape or (nbytes // np.dtype(dtype).itemsize,))
+
+    embeddings = secao("embeddings", header["dtype"], (count, dimension))
+    documents = Textos(secao("texts", np.uint8), secao("text_offsets", np.int64))
+    # Os IDs são poucos bytes e são usados em todas as buscas: decodifica já
+    ids = list(Textos(secao("ids", np.uint8), secao("id_offsets", np.int64)))
+    metadata = {k: v for k, v in header.items() if k != "sections"}
+    return Snapshot(ids, documents, embeddings, metadata, normalized=header.get("normalized", False))
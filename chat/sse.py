@@ -0,0 +1,16 @@
+"""
+Formatação de Server-Sent Events (/chat/stream)
+
+Compartilhada pelas APIs Flask (api_chat.py) e ASGI (api_chat_async.py),
+sem que uma importe a outra.
+"""
+
+import json
+
+
+def sse_event(data, event=None):
+    """Formata um evento Server-Sent Events"""
+    payload = json.dumps(data, ensure_ascii=False)
+    if event:
+        return f"event: {event}\ndata: {payload}\n\n"
+    return f"data: {payload}\n\n"
@@ -0,0 +1,57 @@
+"""
+Contagem de tokens local (sem chamadas de API)
+
+Usa o tiktoken quando estiver instalado; caso contrário, cai para uma
+estimativa por caracteres, suficiente para montar lotes e orçamentos.
+"""
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken é opcional
+    tiktoken = None
+
+# Média aproximada de caracteres por token para texto em português
+CHARS_POR_TOKEN = 4
+
+_encodings = {}
+
+
+def get_encoding(model_name="text-embedding-3-small"):
+    """Retorna o encoding do tiktoken para o modelo (ou None se indisponível)"""
+    if tiktoken is None:
+        return None
+    if model_name not in _encodings:
+        try:
+            _encodings[model_name] = tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            _encodings[model_name] = tiktoken.get_encoding("cl100k_base")
+    return _encodings[model_name]
+
+
+def count_tokens(text, model_name="text-embedding-3-small"):
+    """Conta os tokens de um texto"""
+    if not text:
+        return 0
+    encoding = get_encoding(model_name)
+    if encoding is None:
+        return max(1, (len(text) + CHARS_POR_TOKEN - 1) // CHARS_POR_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text, max_tokens, model_name="text-embedding-3-small"):
+    """Corta o texto para caber em max_tokens (preferindo terminar em um espaço)"""
+    if max_tokens <= 0:
+        return ""
+    encoding = get_encoding(model_name)
+    if encoding is None:
+        limite = max_tokens * CHARS_POR_TOKEN
+        if len(text) <= limite:
+            return text
+        cortado = text[:limite]
+    else:
+        ids = encoding.encode(text, disallowed_special=())
+        if len(ids) <= max_tokens:
+            return text
+        cortado = encoding.decode(ids[:max_tokens])
+    espaco = cortado.rfind(" ")
+    return cortado[:espaco] if espaco > len(cortado) // 2 else cortado